@@ -4,6 +4,7 @@ import os
 SERVER_HOST = '127.0.0.1'
 SERVER_PORT = 5001
 BUFFER_SIZE = 4096
+USE_SENDFILE = True  # Let the kernel copy file pages straight to the socket
 
 filename = "sample_file.txt"
 filesize = os.path.getsize(filename)
@@ -13,10 +14,13 @@ client_socket.connect((SERVER_HOST, SERVER_PORT))
 client_socket.send(filename.encode())
 
 with open(filename, "rb") as f:
-    while True:
-        bytes_read = f.read(BUFFER_SIZE)
-        if not bytes_read:
-            break
-        client_socket.sendall(bytes_read)
+    if USE_SENDFILE:
+        client_socket.sendfile(f)  # Falls back to a send() loop where os.sendfile is missing
+    else:
+        while True:
+            bytes_read = f.read(BUFFER_SIZE)
+            if not bytes_read:
+                break
+            client_socket.sendall(bytes_read)
 
 client_socket.close()
@@ -5,38 +5,40 @@ CHUNK_SIZE = 1024
 SERVER_HOST = '127.0.0.1'
 SERVER_PORT = 5001
 
+def file_checksum(file_path):
+    """SHA-256 of a file, read back in blocks so memory use does not grow with the file"""
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while block := f.read(64 * 1024):
+            sha256.update(block)
+    return sha256.hexdigest()
+
 client_socket = socket.socket()
 client_socket.connect((SERVER_HOST, SERVER_PORT))
 
 filename = "sample_file.txt"
 client_socket.send(filename.encode())
 
-received_chunks = {}
+output_path = "reconstructed_" + filename
 
 # Step 1: Receive checksum
 checksum = client_socket.recv(64).decode()
 print(f"[Client] Checksum received: {checksum}")
 
-# Step 2: Receive chunks
+# Step 2: Receive chunks, each written straight to its final offset
+output = open(output_path, "wb")
 while True:
     header = client_socket.recv(8)
     if header == b"END":
         break
     seq = int(header.decode())
     chunk = client_socket.recv(CHUNK_SIZE)
-    received_chunks[seq] = chunk
-
-# Step 3: Reassemble in order
-reconstructed = b''.join([received_chunks[i] for i in sorted(received_chunks)])
-
-# Step 4: Save to file
-with open("reconstructed_" + filename, "wb") as f:
-    f.write(reconstructed)
+    output.seek(seq * CHUNK_SIZE)
+    output.write(chunk)
+output.close()
 
-# Step 5: Verify checksum
-sha256 = hashlib.sha256()
-sha256.update(reconstructed)
-recomputed = sha256.hexdigest()
+# Step 3: Verify checksum in one streaming pass over the saved file
+recomputed = file_checksum(output_path)
 
 if recomputed == checksum:
     print("[Client] Transfer successful. Checksum verified.")
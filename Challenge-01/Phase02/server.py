@@ -5,6 +5,7 @@ import hashlib
 CHUNK_SIZE = 1024
 SERVER_HOST = '0.0.0.0'
 SERVER_PORT = 5001
+USE_SENDFILE = False  # Zero-copy payload path; pays off once CHUNK_SIZE is several KiB (see bench_sendfile.py)
 
 def compute_checksum(file_path):
     sha256 = hashlib.sha256()
@@ -13,30 +14,53 @@ def compute_checksum(file_path):
             sha256.update(chunk)
     return sha256.hexdigest()
 
-def send_chunks(client_socket, file_path):
+def send_header(client_socket, header):
+    """Send a small header with sendmsg, letting the kernel coalesce it with the payload that follows"""
+    flags = getattr(socket, 'MSG_MORE', 0)
+    view = memoryview(header)
+    while view:
+        view = view[client_socket.sendmsg([view], [], flags):]
+
+def send_payload(client_socket, f, offset, length):
+    """Send file bytes straight from the page cache without copying them through Python"""
+    while length:
+        sent = os.sendfile(client_socket.fileno(), f.fileno(), offset, length)
+        if sent == 0:
+            raise EOFError(f"File ended before offset {offset}")
+        offset += sent
+        length -= sent
+
+def send_chunks(client_socket, file_path, use_sendfile=USE_SENDFILE):
     checksum = compute_checksum(file_path)
     client_socket.send(checksum.encode())  # send checksum
 
     with open(file_path, 'rb') as f:
-        seq = 0
-        while chunk := f.read(CHUNK_SIZE):
-            header = f"{seq:08d}".encode()  # fixed 8-byte sequence header
-            client_socket.send(header + chunk)
-            seq += 1
+        if use_sendfile and hasattr(os, 'sendfile'):
+            size = os.fstat(f.fileno()).st_size
+            for seq, offset in enumerate(range(0, size, CHUNK_SIZE)):
+                send_header(client_socket, f"{seq:08d}".encode())  # fixed 8-byte sequence header
+                send_payload(client_socket, f, offset, min(CHUNK_SIZE, size - offset))
+        else:
+            seq = 0
+            while chunk := f.read(CHUNK_SIZE):
+                header = f"{seq:08d}".encode()  # fixed 8-byte sequence header
+                client_socket.send(header + chunk)
+                seq += 1
 
     client_socket.send(b"END")  # signal end of transfer
 
 # --- Main server setup ---
-server_socket = socket.socket()
-server_socket.bind((SERVER_HOST, SERVER_PORT))
-server_socket.listen(1)
-print(f"[*] Listening as {SERVER_HOST}:{SERVER_PORT}")
+if __name__ == "__main__":
+    server_socket = socket.socket()
+    server_socket.bind((SERVER_HOST, SERVER_PORT))
+    server_socket.listen(1)
+    print(f"[*] Listening as {SERVER_HOST}:{SERVER_PORT}")
 
-client_socket, address = server_socket.accept()
-print(f"[+] {address} is connected.")
+    client_socket, address = server_socket.accept()
+    print(f"[+] {address} is connected.")
 
-filename = client_socket.recv(1024).decode()
-send_chunks(client_socket, filename)
+    filename = client_socket.recv(1024).decode()
+    send_chunks(client_socket, filename)
 
-client_socket.close()
-server_socket.close()
+    client_socket.close()
+    server_socket.close()
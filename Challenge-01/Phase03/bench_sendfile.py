@@ -0,0 +1,91 @@
+"""Compare the read()+send() copy loop with the sendfile() zero-copy path.
+
+Streams a temporary file through send_chunks() over a loopback TCP
+connection and reports wall time, throughput and the CPU time spent in the
+sending thread for each path. The "plain" rows send the file without chunk
+headers, as the Phase01 client does.
+
+    python bench_sendfile.py --size-mb 256 --runs 3 --chunk-size 4096
+"""
+import argparse
+import os
+import socket
+import tempfile
+import threading
+import time
+import server
+from digest_index import INDEX_SUFFIX
+
+def drain(sock, counter):
+    buffer = bytearray(1 << 20)
+    while True:
+        n = sock.recv_into(buffer)
+        if not n:
+            break
+        counter[0] += n
+
+def send_plain(sock, file_path, use_sendfile):
+    with open(file_path, 'rb') as f:
+        if use_sendfile:
+            sock.sendfile(f)
+        else:
+            while data := f.read(64 * 1024):
+                sock.sendall(data)
+
+def run_once(send, file_path, use_sendfile):
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    receiver = socket.create_connection(listener.getsockname())
+    sender, _ = listener.accept()
+    listener.close()
+
+    received = [0]
+    reader = threading.Thread(target=drain, args=(receiver, received))
+    reader.start()
+
+    start_wall = time.perf_counter()
+    start_cpu = time.thread_time()
+    send(sender, file_path, use_sendfile)
+    sender.shutdown(socket.SHUT_WR)
+    cpu = time.thread_time() - start_cpu
+    reader.join()
+    wall = time.perf_counter() - start_wall
+
+    sender.close()
+    receiver.close()
+    return wall, cpu, received[0]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=256)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--chunk-size', type=int, default=server.CHUNK_SIZE,
+                        help='chunk size in bytes (the Phase03 header allows at most 9999)')
+    args = parser.parse_args()
+    server.CHUNK_SIZE = args.chunk_size
+
+    with tempfile.NamedTemporaryFile(delete=False) as f:
+        for _ in range(args.size_mb):
+            f.write(os.urandom(1 << 20))
+        file_path = f.name
+
+    try:
+        modes = [('chunked read+send', server.send_chunks, False),
+                 ('plain read+send', send_plain, False)]
+        if hasattr(os, 'sendfile'):
+            modes.insert(1, ('chunked sendfile', server.send_chunks, True))
+            modes.append(('plain sendfile', send_plain, True))
+        print(f"File: {args.size_mb} MiB, chunk size {server.CHUNK_SIZE} bytes, best of {args.runs}")
+        for name, send, use_sendfile in modes:
+            best = min(run_once(send, file_path, use_sendfile) for _ in range(args.runs))
+            wall, cpu, received = best
+            print(f"{name:>18}: {wall:7.3f} s wall  {cpu:7.3f} s sender CPU  "
+                  f"{received / wall / (1 << 20):8.1f} MiB/s")
+    finally:
+        os.unlink(file_path)
+        if os.path.exists(file_path + INDEX_SUFFIX):
+            os.unlink(file_path + INDEX_SUFFIX)
+
+if __name__ == '__main__':
+    main()
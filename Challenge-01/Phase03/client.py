@@ -1,19 +1,19 @@
 import socket
 import hashlib
+from framing import FrameReader
 
 CHUNK_SIZE = 1024
 HEADER_SIZE = 12  # 8 bytes for seq + 4 bytes for chunk size
 SERVER_HOST = '127.0.0.1'
 SERVER_PORT = 5001
 
-def recv_all(sock, num_bytes):
-    data = b''
-    while len(data) < num_bytes:
-        packet = sock.recv(num_bytes - len(data))
-        if not packet:
-            return None
-        data += packet
-    return data
+def file_checksum(file_path):
+    """SHA-256 of a file, read back in blocks so memory use does not grow with the file"""
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while block := f.read(64 * 1024):
+            sha256.update(block)
+    return sha256.hexdigest()
 
 client_socket = socket.socket()
 client_socket.connect((SERVER_HOST, SERVER_PORT))
@@ -21,21 +21,24 @@ client_socket.connect((SERVER_HOST, SERVER_PORT))
 filename = "sample_file.txt"
 client_socket.send(filename.encode())
 
-received_chunks = {}
+output_path = "reconstructed_" + filename
+reader = FrameReader(client_socket)  # Frames are views into one reusable buffer
 
 # Step 1: Receive checksum
-checksum = client_socket.recv(64).decode()
+checksum = bytes(reader.read(64)).decode()
 print(f"[Client] Checksum received: {checksum}")
 
-# Step 2: Receive all chunks
+# Step 2: Receive all chunks, each written straight to its final offset.
+# Chunks arrive shuffled; the ones still missing are holes that later writes fill.
+output = open(output_path, "wb")
 while True:
-    header = recv_all(client_socket, HEADER_SIZE)
-    if not header:
+    header = reader.read(HEADER_SIZE)
+    if header is None:
         break
 
     try:
-        seq_str = header[:8].decode()
-        size_str = header[8:].decode()
+        seq_str = bytes(header[:8]).decode()
+        size_str = bytes(header[8:]).decode()
 
         if seq_str == "-0000001":
             break
@@ -43,27 +46,21 @@ while True:
         seq = int(seq_str)
         size = int(size_str)
 
-        chunk = recv_all(client_socket, size)
+        chunk = reader.read(size)
         if chunk is None:
             print(f"[Client] Failed to receive chunk {seq}.")
             break
 
-        received_chunks[seq] = chunk
+        output.seek(seq * CHUNK_SIZE)
+        output.write(chunk)
     except Exception as e:
         print(f"[Client] Error parsing header or receiving chunk: {e}")
         break
 
-# Step 3: Reassemble in order
-reconstructed = b''.join(received_chunks[i] for i in sorted(received_chunks))
+output.close()
 
-# Step 4: Save to file
-with open("reconstructed_" + filename, "wb") as f:
-    f.write(reconstructed)
-
-# Step 5: Verify checksum
-sha256 = hashlib.sha256()
-sha256.update(reconstructed)
-recomputed = sha256.hexdigest()
+# Step 3: Verify checksum in one streaming pass over the saved file
+recomputed = file_checksum(output_path)
 
 if recomputed == checksum:
     print("[Client] ✅ Transfer successful. Checksum verified.")
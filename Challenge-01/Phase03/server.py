@@ -2,10 +2,13 @@ import socket
 import os
 import hashlib
 import random
+from digest_index import DigestIndex
 
 CHUNK_SIZE = 1024
 SERVER_HOST = '0.0.0.0'
 SERVER_PORT = 5001
+USE_SENDFILE = False  # Zero-copy payload path; pays off once CHUNK_SIZE is several KiB (see bench_sendfile.py)
+USE_DIGEST_INDEX = True  # Keep the checksum in a <file>.digests sidecar so repeat downloads skip hashing
 
 def compute_checksum(file_path):
     sha256 = hashlib.sha256()
@@ -14,6 +17,13 @@ def compute_checksum(file_path):
             sha256.update(chunk)
     return sha256.hexdigest()
 
+def cached_checksum(file_path):
+    """compute_checksum, served from the sidecar index while the file is unchanged"""
+    if not USE_DIGEST_INDEX:
+        return compute_checksum(file_path)
+    index = DigestIndex(file_path)
+    return index.get("file:sha256", lambda: bytes.fromhex(compute_checksum(file_path))).hex()
+
 def prepare_chunks(file_path):
     chunks = []
     with open(file_path, 'rb') as f:
@@ -25,30 +35,66 @@ def prepare_chunks(file_path):
             seq += 1
     return chunks
 
-def send_chunks(client_socket, file_path):
-    checksum = compute_checksum(file_path)
+def prepare_chunk_offsets(file_path):
+    """Headers and file offsets only; payload bytes stay in the page cache"""
+    chunks = []
+    size = os.path.getsize(file_path)
+    for seq, offset in enumerate(range(0, size, CHUNK_SIZE)):
+        chunk_len = min(CHUNK_SIZE, size - offset)
+        header = f"{seq:08d}{chunk_len:04d}".encode()  # 12 bytes: 8 for seq, 4 for size
+        chunks.append((seq, header, offset, chunk_len))
+    return chunks
+
+def send_header(client_socket, header):
+    """Send a small header with sendmsg, letting the kernel coalesce it with the payload that follows"""
+    flags = getattr(socket, 'MSG_MORE', 0)
+    view = memoryview(header)
+    while view:
+        view = view[client_socket.sendmsg([view], [], flags):]
+
+def send_payload(client_socket, f, offset, length):
+    """Send file bytes straight from the page cache without copying them through Python"""
+    while length:
+        sent = os.sendfile(client_socket.fileno(), f.fileno(), offset, length)
+        if sent == 0:
+            raise EOFError(f"File ended before offset {offset}")
+        offset += sent
+        length -= sent
+
+def send_chunks(client_socket, file_path, use_sendfile=USE_SENDFILE):
+    checksum = cached_checksum(file_path)
     client_socket.send(checksum.encode())  # Step 1: send checksum
 
-    chunks = prepare_chunks(file_path)
-    random.shuffle(chunks)  # Optional: simulate out-of-order delivery
+    if use_sendfile and hasattr(os, 'sendfile'):
+        chunks = prepare_chunk_offsets(file_path)
+        random.shuffle(chunks)  # Optional: simulate out-of-order delivery
+
+        with open(file_path, 'rb') as f:
+            for _, header, offset, chunk_len in chunks:
+                send_header(client_socket, header)
+                send_payload(client_socket, f, offset, chunk_len)
+    else:
+        chunks = prepare_chunks(file_path)
+        random.shuffle(chunks)  # Optional: simulate out-of-order delivery
 
-    for _, data in chunks:
-        client_socket.send(data)
+        for _, data in chunks:
+            client_socket.send(data)
 
     # Send termination header: sequence = -1 → "-0000001" and dummy size "0000"
     client_socket.send(f"-00000010000".encode())  # 12-byte end signal
 
 # --- Main server setup ---
-server_socket = socket.socket()
-server_socket.bind((SERVER_HOST, SERVER_PORT))
-server_socket.listen(1)
-print(f"[*] Listening as {SERVER_HOST}:{SERVER_PORT}")
+if __name__ == "__main__":
+    server_socket = socket.socket()
+    server_socket.bind((SERVER_HOST, SERVER_PORT))
+    server_socket.listen(1)
+    print(f"[*] Listening as {SERVER_HOST}:{SERVER_PORT}")
 
-client_socket, address = server_socket.accept()
-print(f"[+] {address} is connected.")
+    client_socket, address = server_socket.accept()
+    print(f"[+] {address} is connected.")
 
-filename = client_socket.recv(1024).decode()
-send_chunks(client_socket, filename)
+    filename = client_socket.recv(1024).decode()
+    send_chunks(client_socket, filename)
 
-client_socket.close()
-server_socket.close()
+    client_socket.close()
+    server_socket.close()
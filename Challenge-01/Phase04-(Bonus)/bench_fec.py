@@ -0,0 +1,105 @@
+"""Compare pipelined downloads with and without XOR parity FEC as corruption rises.
+
+For each corruption probability, starts server.py in a subprocess with
+CORRUPTION_PROBABILITY patched, then downloads a temporary random file with
+client.py --pipelined, once without FEC and once per --fec group size.
+Reports completion time, goodput (file bytes per second), the bytes
+received on the wire and how many chunks were rebuilt from parity.
+
+    python bench_fec.py --size-mb 8 --rates 0 0.05 0.1 0.2 0.3 --fec 4 8 16
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+PHASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_BOOTSTRAP = (
+    "import sys; sys.path.insert(0, sys.argv[1]); import server; "
+    "server.SERVER_PORT = int(sys.argv[2]); server.CORRUPTION_PROBABILITY = float(sys.argv[3]); "
+    "server.main()"
+)
+# Counts every byte the client receives and prints the total when it exits
+CLIENT_BOOTSTRAP = (
+    "import sys, socket, atexit; sys.path.insert(0, sys.argv[1]); import client; "
+    "client.SERVER_PORT = int(sys.argv[2]); received = [0]\n"
+    "class CountingSocket(socket.socket):\n"
+    "    def recv_into(self, *args):\n"
+    "        n = super().recv_into(*args); received[0] += n; return n\n"
+    "socket.socket = CountingSocket\n"
+    "atexit.register(lambda: print(f'WIRE {received[0]}'))\n"
+    "sys.argv = ['client.py'] + sys.argv[3:]; client.main()"
+)
+
+def wait_until_listening(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"server did not start listening on port {port}")
+
+def download(work_dir, port, filename, fec, chunk_size):
+    """(seconds, wire bytes, chunks rebuilt, succeeded) for one download"""
+    for suffix in ("", ".part", ".resume"):
+        path = os.path.join(work_dir, "reconstructed_" + filename + suffix)
+        if os.path.exists(path):
+            os.remove(path)
+    args = [filename, "--pipelined", "--chunk-size", str(chunk_size)]
+    if fec:
+        args += ["--fec", str(fec)]
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", CLIENT_BOOTSTRAP, PHASE_DIR, str(port)] + args,
+                            cwd=work_dir, capture_output=True, text=True, encoding="utf-8")
+    elapsed = time.perf_counter() - start
+    wire = rebuilt = 0
+    for line in result.stdout.splitlines():
+        if line.startswith("WIRE "):
+            wire = int(line.split()[1])
+        elif "from parity" in line:
+            rebuilt += 1
+    return elapsed, wire, rebuilt, "received successfully" in result.stdout
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=8)
+    parser.add_argument("--chunk-size", type=int, default=1024)
+    parser.add_argument("--rates", type=float, nargs="+", default=[0.0, 0.05, 0.1, 0.2, 0.3],
+                        help="corruption probabilities to sweep")
+    parser.add_argument("--fec", type=int, nargs="+", default=[4, 8, 16], help="FEC group sizes to compare")
+    parser.add_argument("--port", type=int, default=15001)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        filename = "bench_fec.bin"
+        with open(os.path.join(work_dir, filename), "wb") as f:
+            for _ in range(args.size_mb):
+                f.write(os.urandom(1 << 20))
+        size = args.size_mb << 20
+
+        print(f"File: {args.size_mb} MiB, {args.chunk_size}-byte chunks, pipelined")
+        print(f"{'corrupt':>7} {'fec':>5} {'time s':>7} {'MiB/s':>7} {'wire MiB':>9} {'overhead':>8} {'rebuilt':>8}")
+        for rate in args.rates:
+            server = subprocess.Popen([sys.executable, "-c", SERVER_BOOTSTRAP, PHASE_DIR, str(args.port), str(rate)],
+                                      cwd=work_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                wait_until_listening(args.port)
+                for fec in [0] + args.fec:
+                    elapsed, wire, rebuilt, ok = download(work_dir, args.port, filename, fec, args.chunk_size)
+                    label = f"1/{fec}" if fec else "off"
+                    if not ok:
+                        print(f"{rate:>7.2f} {label:>5}  download failed")
+                        continue
+                    print(f"{rate:>7.2f} {label:>5} {elapsed:>7.2f} {size / elapsed / (1 << 20):>7.1f} "
+                          f"{wire / (1 << 20):>9.1f} {wire / size - 1:>7.1%} {rebuilt:>8}")
+            finally:
+                server.terminate()
+                server.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Compare many small downloads with and without a keep-alive session, against one large file.
+
+Starts server.py in a subprocess with CORRUPTION_PROBABILITY patched, fills a
+temporary directory with --files random files of --file-kb KiB each and
+writes one file holding the same number of bytes. Then it times:
+
+- one client.py run (process and connection) per small file, as before sessions;
+- a single client.py --dir run that fetches every small file over one connection;
+- a single client.py run for the large file.
+
+    python bench_session.py --files 200 --file-kb 16 --pipelined
+"""
+import argparse
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+PHASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_BOOTSTRAP = (
+    "import sys; sys.path.insert(0, sys.argv[1]); import server; "
+    "server.SERVER_PORT = int(sys.argv[2]); server.CORRUPTION_PROBABILITY = float(sys.argv[3]); "
+    "server.main()"
+)
+CLIENT_BOOTSTRAP = (
+    "import sys; sys.path.insert(0, sys.argv[1]); import client; "
+    "client.SERVER_PORT = int(sys.argv[2]); sys.argv = ['client.py'] + sys.argv[3:]; client.main()"
+)
+
+def wait_until_listening(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"server did not start listening on port {port}")
+
+def run_client(work_dir, port, args):
+    result = subprocess.run([sys.executable, "-c", CLIENT_BOOTSTRAP, PHASE_DIR, str(port)] + args,
+                            cwd=work_dir, capture_output=True, text=True, encoding="utf-8")
+    return result.stdout.count("received successfully")
+
+def reset(work_dir):
+    for name in os.listdir(work_dir):
+        if name.startswith("reconstructed_"):
+            path = os.path.join(work_dir, name)
+            shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--file-kb", type=int, default=16)
+    parser.add_argument("--pipelined", action="store_true")
+    parser.add_argument("--corruption", type=float, default=0.0, help="CORRUPTION_PROBABILITY for the server")
+    parser.add_argument("--port", type=int, default=15002)
+    args = parser.parse_args()
+    mode = ["--pipelined"] if args.pipelined else []
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.mkdir(os.path.join(work_dir, "small"))
+        names = [f"small/{index:05d}.bin" for index in range(args.files)]
+        for name in names:
+            with open(os.path.join(work_dir, name), "wb") as f:
+                f.write(os.urandom(args.file_kb << 10))
+        with open(os.path.join(work_dir, "large.bin"), "wb") as f:
+            f.write(os.urandom(args.files * args.file_kb << 10))
+        size = args.files * args.file_kb << 10
+
+        server = subprocess.Popen([sys.executable, "-c", SERVER_BOOTSTRAP, PHASE_DIR, str(args.port),
+                                   str(args.corruption)],
+                                  cwd=work_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_until_listening(args.port)
+            # Warm the digest sidecars so every case measures the transfer alone
+            run_client(work_dir, args.port, ["--dir", "small"] + mode)
+            run_client(work_dir, args.port, ["large.bin"] + mode)
+
+            print(f"{args.files} files of {args.file_kb} KiB vs one {size >> 10} KiB file, "
+                  f"{'pipelined' if args.pipelined else 'stop-and-wait'}, corruption {args.corruption:.0%}")
+            print(f"{'case':<22} {'time s':>7} {'MiB/s':>7} {'verified':>9}")
+            cases = [
+                ("one run per file", lambda: sum(run_client(work_dir, args.port, [name] + mode) for name in names),
+                 args.files),
+                ("one --dir session", lambda: run_client(work_dir, args.port, ["--dir", "small"] + mode), args.files),
+                ("one large file", lambda: run_client(work_dir, args.port, ["large.bin"] + mode), 1),
+            ]
+            for label, run, expected in cases:
+                reset(work_dir)
+                start = time.perf_counter()
+                verified = run()
+                elapsed = time.perf_counter() - start
+                print(f"{label:<22} {elapsed:>7.2f} {size / elapsed / (1 << 20):>7.1f} {verified:>4}/{expected}")
+        finally:
+            server.terminate()
+            server.wait()
+
+if __name__ == "__main__":
+    main()
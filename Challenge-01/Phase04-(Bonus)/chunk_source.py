@@ -0,0 +1,106 @@
+import mmap
+import os
+from protocol import new_bitmap, set_bit, has_bit, missing_chunks
+
+class ChunkSource:
+    """Lazy, mmap-backed view of a file as a sequence of chunk frames.
+
+    Indexing yields the same ``(seq, header, checksum, chunk)`` tuples that
+    ``prepare_chunks`` used to build eagerly, but ``chunk`` is a memoryview
+    slice of the mapping and ``checksum`` is a slice of a precomputed digest
+    table. Nothing is copied up front, so resident memory stays bounded by
+    what the OS pages in. Re-slicing a chunk for retransmission costs no copy.
+
+    Given data (the file's content already in memory, e.g. from a cache),
+    chunks are sliced from it instead and the file is not opened.
+
+    Without a digest table but with chunk_digest (a function of the chunk
+    bytes), each frame's digest is computed the first time the frame is
+    built, so the first chunk goes out without hashing the whole file.
+    Likewise, given file_hasher, chunks are fed to it in order as their
+    frames are first built; file_digest() only reads what was not sent.
+    """
+
+    def __init__(self, file_path, chunk_size, digests=None, digest_size=0, data=None, chunk_digest=None,
+                 file_hasher=None):
+        self.chunk_size = chunk_size
+        self.digests = digests  # Raw per-chunk digests back to back; None sends frames without one
+        self.digest_size = digest_size
+        self.chunk_digest = chunk_digest
+        self.computed = None  # Bitmap of the digests filled in so far, when they are computed lazily
+        self.file_hasher = file_hasher
+        self.hashed = 0  # Chunks fed to file_hasher, always a prefix of the file
+        self._file = self._map = None
+        if data is not None:
+            self.size = len(data)
+            self._view = memoryview(data)
+        else:
+            self.size = os.path.getsize(file_path)
+            self._file = open(file_path, 'rb')
+            # mmap cannot map an empty file
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+            self._view = memoryview(self._map) if self._map is not None else memoryview(b'')
+        if digests is None and chunk_digest is not None:
+            self.digests = bytearray(len(self) * digest_size)
+            self.computed = new_bitmap(len(self))
+
+    def __len__(self):
+        return (self.size + self.chunk_size - 1) // self.chunk_size
+
+    def chunk(self, seq):
+        """Zero-copy slice of chunk seq"""
+        if not 0 <= seq < len(self):
+            raise IndexError(f"chunk {seq} out of range")
+        start = seq * self.chunk_size
+        return self._view[start:start + self.chunk_size]
+
+    def checksum(self, seq):
+        """Raw digest of chunk seq, computed now if it is the first frame that needs it"""
+        start = seq * self.digest_size
+        if self.computed is not None and not has_bit(self.computed, seq):
+            self.digests[start:start + self.digest_size] = self.chunk_digest(self.chunk(seq))
+            set_bit(self.computed, seq)
+        return self.digests[start:start + self.digest_size]
+
+    def digest_table(self):
+        """Every chunk's digest back to back, or None if some frame was never built"""
+        if self.digests is None or (self.computed is not None and missing_chunks(self.computed, len(self))):
+            return None
+        return bytes(self.digests)
+
+    def file_digest(self):
+        """Whole-file digest, reading only the chunks no frame was built for (and filling in their digests)"""
+        while self.hashed < len(self):
+            self.file_hasher.update(self.chunk(self.hashed))
+            if self.computed is not None:
+                self.checksum(self.hashed)
+            self.hashed += 1
+        return self.file_hasher.digest()
+
+    def __getitem__(self, seq):
+        chunk = self.chunk(seq)
+        checksum = self.checksum(seq) if self.digests is not None else b''
+        if self.file_hasher is not None and seq == self.hashed:
+            self.file_hasher.update(chunk)
+            self.hashed += 1
+        return seq, f"{seq:08d}".encode(), checksum, chunk
+
+    def __iter__(self):
+        for seq in range(len(self)):
+            yield self[seq]
+
+    def close(self):
+        self._view.release()
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                pass  # A chunk slice is still referenced; the mapping is freed with it
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
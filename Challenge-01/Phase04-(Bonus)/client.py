@@ -1,75 +1,463 @@
+import argparse
+import os
 import socket
-import hashlib
 import struct
+import threading
+import time
+from framing import FrameReader
+from protocol import (END_SEQ, PASS_END_SEQ, PARITY_SEQ, PARITY_HEADER, MISSING_FILE, MAX_FEC_GROUP, VERSION_SIZE,
+                      INTEGRITY_ALGORITHMS, CHUNK_ALGORITHM, FILE_ALGORITHM, BLAKE2B_DIGEST_SIZE, send_request,
+                      send_report, read_listing, safe_relative_path, digest, digest_size, new_hasher, xor_parity)
+from resume import PartialDownload, load_resume_state, resume_options
+from delta import BLOCK_SIGNATURE, block_signatures, apply_delta
 
-CHUNK_SIZE = 1024
+CHUNK_SIZE = 1024  # Requested by default; the server confirms the size it uses
 HEADER_SIZE = 8
-CHECKSUM_SIZE = 64
 SERVER_HOST = '127.0.0.1'
 SERVER_PORT = 5001
+REPORT_INTERVAL = 64  # Pipelined mode: send a bitmap after this many frames
 
-def recv_all(sock, num_bytes):
-    data = b''
-    while len(data) < num_bytes:
-        packet = sock.recv(num_bytes - len(data))
-        if not packet:
-            return None
-        data += packet
-    return data
+class Integrity:
+    """The digest algorithms requested from the server"""
 
-client_socket = socket.socket()
-client_socket.connect((SERVER_HOST, SERVER_PORT))
+    def __init__(self, chunk_algorithm, file_algorithm, blake2b_size):
+        self.chunk_algorithm = chunk_algorithm
+        self.file_algorithm = file_algorithm
+        self.blake2b_size = blake2b_size
+        self.chunk_size = digest_size(chunk_algorithm, blake2b_size)
+        self.file_size = digest_size(file_algorithm, blake2b_size)
 
-filename = "sample_file.txt"
-client_socket.send(filename.encode())
+    def chunk_digest(self, chunk):
+        return digest(chunk, self.chunk_algorithm, self.blake2b_size)
 
-received_chunks = {}
+    def file_digest(self, data):
+        return digest(data, self.file_algorithm, self.blake2b_size)
 
-# Step 1: Receive number of chunks
-chunk_count = int(recv_all(client_socket, HEADER_SIZE).decode())
-print(f"[Client] Expecting {chunk_count} chunks")
+    def file_hasher(self):
+        return new_hasher(self.file_algorithm, self.blake2b_size)
 
-# Step 2: Receive chunks
-while True:
-    header = recv_all(client_socket, HEADER_SIZE)
-    if not header:
-        break
-    seq_str = header.decode()
-    if seq_str == "-0000001":
-        break
+def receive_manifest(reader, chunk_count, integrity):
+    """Receive the per-chunk digest table and check it against its root digest"""
+    root = reader.read(integrity.file_size)
+    root = bytes(root) if root is not None else None
+    digests = reader.read(chunk_count * integrity.chunk_size)
+    if digests is None or integrity.file_digest(digests) != root:
+        return None
+    return bytes(digests)
 
-    try:
-        seq = int(seq_str)
-    except ValueError:
-        print("[Client] Invalid header. Terminating.")
-        break
+def receive_frame(reader, seq, integrity, manifest=None):
+    """Receive the rest of a chunk frame; returns (chunk, expected digest), or (None, None) if cut short.
 
-    checksum = recv_all(client_socket, CHECKSUM_SIZE).decode()
-    chunk_length_bytes = recv_all(client_socket, 4)
-    chunk_length = struct.unpack('!I', chunk_length_bytes)[0]
+    The chunk is a view into the reader's buffer, valid until the next read.
+    """
+    checksum_size = 0 if manifest is not None else integrity.chunk_size
+    frame = reader.read(checksum_size + 4)
+    if frame is None:
+        print(f"[Client] Failed to receive chunk {seq}")
+        return None, None
+    checksum = bytes(frame[:checksum_size])
+    chunk_length = struct.unpack_from('!I', frame, checksum_size)[0]
 
-    chunk = recv_all(client_socket, chunk_length)
+    chunk = reader.read(chunk_length)
     if chunk is None:
         print(f"[Client] Failed to receive chunk {seq}")
-        client_socket.send("NACK".encode())
-        continue
+        return None, None
 
-    sha256 = hashlib.sha256()
-    sha256.update(chunk)
-    if sha256.hexdigest() != checksum:
+    if manifest is not None:
+        # One hash and a table lookup; the digest never crossed the wire with the chunk
+        size = integrity.chunk_size
+        return chunk, manifest[seq * size:(seq + 1) * size]
+    return chunk, checksum
+
+def receive_chunk(reader, seq, integrity, manifest=None):
+    """Receive the rest of a chunk frame and return the chunk if its digest matches"""
+    chunk, expected = receive_frame(reader, seq, integrity, manifest)
+    if chunk is None:
+        return None
+    if integrity.chunk_digest(chunk) != expected:
         print(f"[Client] ❌ Corrupted chunk {seq}")
-        client_socket.send("NACK".encode())
-        continue
+        return None
+    return chunk
+
+def recover_from_parity(reader, group, download, integrity):
+    """Read a parity frame and rebuild the group's chunk if exactly one arrived corrupted.
+
+    group holds (seq, chunk or None if corrupted, expected digest, length)
+    for the chunk frames since the previous parity frame. Returns False if
+    the connection broke.
+    """
+    frame = reader.read(PARITY_HEADER.size)
+    if frame is None:
+        return False
+    count, length = PARITY_HEADER.unpack(frame)
+    parity = reader.read(length)
+    if parity is None:
+        return False
+    bad = [entry for entry in group if entry[1] is None]
+    if count != len(group) or len(bad) != 1:
+        return True  # Nothing to rebuild, or more damage than one parity frame can repair
+    seq, _, expected, chunk_length = bad[0]
+    others = [chunk for _, chunk, _, _ in group if chunk is not None]
+    rebuilt = xor_parity([parity] + others, length)[:chunk_length]
+    if integrity.chunk_digest(rebuilt) == expected:
+        download.write(seq, rebuilt)
+        print(f"[Client] 🔧 Rebuilt chunk {seq} from parity")
+    return True
+
+def read_seq(reader):
+    header = reader.read(HEADER_SIZE)
+    if header is None:
+        return None
+    try:
+        return int(header)
+    except ValueError:
+        print("[Client] Invalid header. Terminating.")
+        return None
+
+def read_file_digest(reader, integrity):
+    """The whole-file digest the server sends right after the end marker, or None if cut short"""
+    file_digest = reader.read(integrity.file_size)
+    return bytes(file_digest) if file_digest is not None else None
+
+def receive_with_ack(client_socket, reader, download, integrity, manifest, on_complete=None):
+    """Returns the whole-file digest that follows the end marker, or None if the connection broke off.
+
+    on_complete, if given, is called once the last chunk is acknowledged.
+    """
+    if on_complete is not None and download.complete():
+        on_complete()
+        on_complete = None
+    while True:
+        seq = read_seq(reader)
+        if seq is None:
+            return None
+        if seq == END_SEQ:
+            return read_file_digest(reader, integrity)
+
+        chunk = receive_chunk(reader, seq, integrity, manifest)
+        if chunk is None:
+            client_socket.send("NACK".encode())
+            continue
+
+        download.write(seq, chunk)
+        client_socket.send("ACK".encode())
+        if on_complete is not None and download.complete():
+            on_complete()
+            on_complete = None
+
+def receive_pipelined(client_socket, reader, download, integrity, manifest, fec=0, on_complete=None):
+    """Returns the whole-file digest that follows the end marker, or None if the connection broke off.
+
+    on_complete, if given, is called once a final report has claimed every chunk.
+    """
+    verified = download.bitmap  # Reports include chunks kept from an earlier run
+    frames_processed = reported = 0
+    group = []  # FEC: chunk frames since the last parity frame
+    while True:
+        seq = read_seq(reader)
+        if seq is None:
+            return None
+        if seq == END_SEQ:
+            return read_file_digest(reader, integrity)
+        if seq == PASS_END_SEQ:
+            send_report(client_socket, frames_processed, verified)
+            reported = frames_processed
+            if on_complete is not None and download.complete():
+                on_complete()  # The server sends nothing but the end marker after this report
+                on_complete = None
+            continue
+        if seq == PARITY_SEQ:
+            if not recover_from_parity(reader, group, download, integrity):
+                return None
+            group.clear()
+        elif fec:
+            chunk, expected = receive_frame(reader, seq, integrity, manifest)
+            frames_processed += 1
+            if chunk is None:
+                continue
+            if integrity.chunk_digest(chunk) == expected:
+                download.write(seq, chunk)
+                group.append((seq, bytes(chunk), expected, len(chunk)))  # The view is reused by the next read
+            else:
+                print(f"[Client] ❌ Corrupted chunk {seq}")
+                group.append((seq, None, expected, len(chunk)))
+        else:
+            chunk = receive_chunk(reader, seq, integrity, manifest)
+            frames_processed += 1
+            if chunk is not None:
+                download.write(seq, chunk)
+        # With FEC, only report between groups, so a chunk its parity can still rebuild is not resent
+        if frames_processed - reported >= REPORT_INTERVAL and not group:
+            send_report(client_socket, frames_processed, verified)
+            reported = frames_processed
+
+def open_stream(filename, options):
+    """Connect and send the request; returns the socket and a reader for its replies"""
+    client_socket = socket.socket()
+    client_socket.connect((SERVER_HOST, SERVER_PORT))
+    send_request(client_socket, filename, **options)
+    return client_socket, FrameReader(client_socket)  # Frames are views into one reusable buffer
+
+def receive_preamble(reader, integrity, with_manifest):
+    """Chunk count, negotiated chunk size, file version tag and (optionally) the verified manifest.
+
+    None if the server has no such file. The whole-file digest comes after the data.
+    """
+    chunk_count = read_seq(reader)
+    if chunk_count is None:
+        raise ConnectionError("server closed the connection")
+    if chunk_count == MISSING_FILE:
+        return None
+    chunk_size = int(reader.read(HEADER_SIZE))
+    version = bytes(reader.read(VERSION_SIZE))
+    manifest = receive_manifest(reader, chunk_count, integrity) if with_manifest else None
+    return chunk_count, chunk_size, version, manifest
+
+def receive_stream(client_socket, reader, download, integrity, manifest, pipelined, fec, file_digests):
+    """Receive one stream's chunks; the whole-file digest it ends with is appended to file_digests"""
+    try:
+        if pipelined:
+            file_digest = receive_pipelined(client_socket, reader, download, integrity, manifest, fec)
+        else:
+            file_digest = receive_with_ack(client_socket, reader, download, integrity, manifest)
+        file_digests.append(file_digest)
+    except OSError as e:
+        print(f"[Client] Connection lost: {e}")
+    finally:
+        client_socket.close()
+
+def sync_delta(filename, output_path, options, integrity, block_size):
+    """Bring an existing local copy up to date rsync-style; True if the result verified"""
+    signatures = block_signatures(output_path, block_size)
+    blocks = len(signatures) // BLOCK_SIGNATURE.size
+    print(f"[Client] Delta sync against {output_path} ({blocks} blocks of {block_size} bytes)")
+    temp_path = output_path + '.delta'
+    client_socket, reader = open_stream(filename, {**options, "mode": "delta", "blocks": blocks})
+    try:
+        client_socket.sendall(signatures)
+        file_digest = reader.read(integrity.file_size)
+        if file_digest is None:
+            raise ConnectionError("server closed the connection")
+        file_digest = bytes(file_digest)
+        hasher = integrity.file_hasher()
+        with open(output_path, 'rb') as basis, open(temp_path, 'wb') as out:
+            literal_bytes, copied_bytes = apply_delta(reader, basis, out, block_size, hasher)
+    except (OSError, ValueError) as e:
+        print(f"[Client] Delta sync failed: {e}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return False
+    finally:
+        client_socket.close()
+    if hasher.digest() != file_digest:
+        os.remove(temp_path)
+        print(f"[Client] Delta result does not match its {integrity.file_algorithm} digest")
+        return False
+    os.replace(temp_path, output_path)
+    print(f"[Client] ✅ File synced: {literal_bytes} bytes received, {copied_bytes} bytes reused from the local copy.")
+    return True
+
+def finish_download(download, integrity, file_digest):
+    """Verify a download against file_digest and move it into place, or keep the partial file for the next run"""
+    if not download.complete():
+        missing = download.chunk_count - download.received()
+        download.close()
+        print(f"[Client] ❌ Transfer interrupted with {missing} chunks missing. Run again to resume.")
+        return False
+    if file_digest is None:
+        download.close()
+        print("[Client] ❌ Connection closed before the whole-file digest arrived. Run again to resume.")
+        return False
+    if download.digest() != file_digest:
+        download.discard()
+        print(f"[Client] ❌ File does not match its {integrity.file_algorithm} digest.")
+        return False
+    download.finish()
+    print("[Client] ✅ File received successfully.")
+    return True
+
+def output_path_for(filename):
+    """Where a download of filename is written, or None if that would be outside the working directory"""
+    output_path = "reconstructed_" + filename
+    root = os.path.realpath(os.getcwd())
+    if os.path.commonpath([root, os.path.realpath(output_path)]) != root:
+        return None
+    return output_path
+
+def fetch_files(client_socket, reader, filenames, options, integrity, with_manifest, pipelined, fec=0):
+    """Download files one after another over one keep-alive connection; returns how many verified.
+
+    The request for the next file goes out as soon as the current one holds
+    every chunk, so the server moves on right after its end marker instead
+    of idling for a round trip while the request travels.
+    """
+    states = {}
+
+    def request(index):
+        if index < len(filenames):
+            state = states[index] = load_resume_state(output_path_for(filenames[index]))
+            file_options = {**options, "keepalive": 1, **(resume_options(state) if state is not None else {})}
+            send_request(client_socket, filenames[index], **file_options)
+
+    request(0)
+    verified = 0
+    for index, filename in enumerate(filenames):
+        preamble = receive_preamble(reader, integrity, with_manifest)
+        if preamble is None:
+            print(f"[Client] ❌ {filename} not found on the server")
+            request(index + 1)
+            continue
+        chunk_count, chunk_size, version, manifest = preamble
+        if with_manifest and manifest is None:
+            print(f"[Client] ❌ Manifest of {filename} failed verification. Terminating.")
+            break
+        print(f"[Client] {filename}: expecting {chunk_count} chunks of {chunk_size} bytes")
+        download = PartialDownload(output_path_for(filename), chunk_size, chunk_count, version,
+                                   integrity.file_hasher(), states.pop(index))
+        next_request = lambda: request(index + 1)
+        if pipelined:
+            file_digest = receive_pipelined(client_socket, reader, download, integrity, manifest, fec, next_request)
+        else:
+            file_digest = receive_with_ack(client_socket, reader, download, integrity, manifest, next_request)
+        if finish_download(download, integrity, file_digest):
+            verified += 1
+        elif not download.complete():
+            break  # The connection broke off mid-file
+    return verified
+
+def download_session(filenames, directory, options, integrity, with_manifest, pipelined, fec=0):
+    """Fetch several files, or every file of a server directory, over a single connection"""
+    client_socket = socket.socket()
+    client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    client_socket.connect((SERVER_HOST, SERVER_PORT))
+    reader = FrameReader(client_socket)
+    start = time.perf_counter()
+    try:
+        if directory is not None:
+            send_request(client_socket, directory, mode="list", keepalive=1)
+            listing = read_listing(reader)
+            if listing is None:
+                raise ConnectionError("server closed the connection")
+            print(f"[Client] {directory}: {len(listing)} files on the server")
+            for name in listing:
+                if not safe_relative_path(name):
+                    print(f"[Client] ❌ Skipping listing entry {name!r}: not a relative path under {directory}")
+            filenames = filenames + [f"{directory.rstrip('/')}/{name}" for name in listing if safe_relative_path(name)]
+        for filename in filenames:
+            if output_path_for(filename) is None:
+                print(f"[Client] ❌ Skipping {filename}: it would be saved outside the working directory")
+        filenames = [filename for filename in filenames if output_path_for(filename) is not None]
+        verified = fetch_files(client_socket, reader, filenames, options, integrity, with_manifest, pipelined, fec)
+    except OSError as e:
+        print(f"[Client] Connection lost: {e}")
+        return
+    finally:
+        client_socket.close()
+    print(f"[Client] Session done: {verified} of {len(filenames)} files verified in "
+          f"{time.perf_counter() - start:.2f}s over one connection.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Download a file with per-chunk verification")
+    parser.add_argument("filenames", nargs="*", metavar="filename",
+                        help="file(s) to download (default: sample_file.txt); several share one connection")
+    parser.add_argument("--dir", help="also download every file under this server directory, over one connection")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="stream all chunks and acknowledge with periodic bitmaps")
+    parser.add_argument("--manifest", action="store_true",
+                        help="receive all chunk digests up front instead of one checksum per frame")
+    parser.add_argument("--chunk-algo", choices=INTEGRITY_ALGORITHMS, default=CHUNK_ALGORITHM,
+                        help="digest used to verify each chunk")
+    parser.add_argument("--file-algo", choices=INTEGRITY_ALGORITHMS, default=FILE_ALGORITHM,
+                        help="digest used to verify the whole file (and the manifest)")
+    parser.add_argument("--blake2b-size", type=int, default=BLAKE2B_DIGEST_SIZE,
+                        help="BLAKE2b digest size in bytes (1-64)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                        help="requested chunk size in bytes; the server may clamp it")
+    parser.add_argument("--streams", type=int, default=1,
+                        help="download over this many connections, each carrying one stripe of the file")
+    parser.add_argument("--fec", type=int, default=0, metavar="K",
+                        help=f"pipelined mode: one XOR parity frame per K chunks (1-{MAX_FEC_GROUP}), "
+                             "so a corrupted chunk is rebuilt without a retransmission")
+    parser.add_argument("--delta", action="store_true",
+                        help="if an earlier copy exists, fetch only what changed (blocks of --chunk-size bytes)")
+    args = parser.parse_args()
+    if args.fec and not args.pipelined:
+        parser.error("--fec needs --pipelined")
+    filenames = args.filenames or ([] if args.dir else ["sample_file.txt"])
+    session = len(filenames) > 1 or args.dir is not None
+    if session and (args.streams > 1 or args.delta):
+        parser.error("--streams and --delta take a single file")
+    integrity = Integrity(args.chunk_algo, args.file_algo, args.blake2b_size)
+    streams = max(1, args.streams)
+
+    options = {"mode": "pipelined" if args.pipelined else "ack",
+               "integrity": "manifest" if args.manifest else "frame",
+               "chunk_algo": args.chunk_algo, "file_algo": args.file_algo, "blake2b_size": args.blake2b_size,
+               "chunk_size": args.chunk_size, "fec": args.fec}
+    if session:
+        download_session(filenames, args.dir, options, integrity, args.manifest, args.pipelined, args.fec)
+        return
+
+    filename = filenames[0]
+    output_path = output_path_for(filename)
+    if output_path is None:
+        parser.error(f"{filename} would be saved outside the working directory")
+    # After an interrupted run, ask only for the missing chunks; the server ignores this if the file changed
+    state = load_resume_state(output_path)
+    if state is not None:
+        options.update(resume_options(state))
+    elif args.delta and os.path.exists(output_path):
+        if sync_delta(filename, output_path, options, integrity, args.chunk_size):
+            return
+        print("[Client] Falling back to a full download")
 
-    received_chunks[seq] = chunk
-    client_socket.send("ACK".encode())
+    # Step 1: Open every stream and receive the number of chunks and file digest on each
+    connections = []
+    for index in range(streams):
+        stripe = {"stripe": f"{index}/{streams}"} if streams > 1 else {}
+        connections.append(open_stream(filename, {**options, **stripe}))
+    preambles = [receive_preamble(reader, integrity, args.manifest) for _, reader in connections]
+    if None in preambles:
+        print(f"[Client] ❌ {filename} not found on the server. Terminating.")
+        for client_socket, _ in connections:
+            client_socket.close()
+        return
+    chunk_count, chunk_size, version, manifest = preambles[0]
+    if any(preamble[:3] != (chunk_count, chunk_size, version) for preamble in preambles[1:]):
+        print("[Client] ❌ Streams disagree about the file (changed on the server?). Terminating.")
+        for client_socket, _ in connections:
+            client_socket.close()
+        return
+    print(f"[Client] Expecting {chunk_count} chunks of {chunk_size} bytes over {streams} stream(s)")
+    if args.manifest:
+        if manifest is None:
+            print("[Client] ❌ Manifest failed verification. Terminating.")
+            for client_socket, _ in connections:
+                client_socket.close()
+            return
+        print(f"[Client] Manifest with {chunk_count} chunk digests verified")
 
-# Step 3: Reassemble
-reconstructed = b''.join(received_chunks[i] for i in sorted(received_chunks))
+    # Step 2: Receive chunks straight into the output file, one thread per stream
+    download = PartialDownload(output_path, chunk_size, chunk_count, version, integrity.file_hasher(), state)
+    if download.resumed:
+        print(f"[Client] Resuming: {download.received()} of {chunk_count} chunks already on disk")
+    file_digests = []  # Every stream ends with the whole-file digest
+    threads = [threading.Thread(target=receive_stream,
+                                args=(client_socket, reader, download, integrity, manifest, args.pipelined, args.fec,
+                                      file_digests))
+               for client_socket, reader in connections]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
 
-# Step 4: Save
-with open("reconstructed_" + filename, "wb") as f:
-    f.write(reconstructed)
+    # Step 3: Verify and move into place, or keep the partial file for the next run
+    received = set(file_digests) - {None}
+    if len(received) > 1:
+        print("[Client] ❌ Streams disagree about the whole-file digest (changed on the server?).")
+        download.discard()
+        return
+    finish_download(download, integrity, received.pop() if received else None)
 
-print("[Client] ✅ File received successfully.")
-client_socket.close()
+if __name__ == "__main__":
+    main()
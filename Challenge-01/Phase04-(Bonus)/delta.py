@@ -0,0 +1,121 @@
+import hashlib
+import struct
+import zlib
+
+DELTA_STRONG_SIZE = 8  # Bytes of BLAKE2b per block; the whole-file digest catches the rare collision
+BLOCK_SIGNATURE = struct.Struct(f'!I{DELTA_STRONG_SIZE}s')  # Adler-32, strong digest
+DELTA_OP = struct.Struct('!BII')  # Opcode, then (length, 0) for a literal or (first block, count) for a copy
+OP_LITERAL, OP_COPY, OP_END = 1, 2, 3
+MAX_LITERAL = 64 * 1024  # Longest literal (and copy read) handled in one piece
+ADLER_MOD = 65521
+
+def strong_digest(block):
+    return hashlib.blake2b(block, digest_size=DELTA_STRONG_SIZE).digest()
+
+def block_signatures(file_path, block_size):
+    """Signature table of a file's full blocks, in order; a short last block is left out"""
+    signatures = []
+    with open(file_path, 'rb') as f:
+        while len(block := f.read(block_size)) == block_size:
+            signatures.append(BLOCK_SIGNATURE.pack(zlib.adler32(block), strong_digest(block)))
+    return b''.join(signatures)
+
+def encode_delta(data, signatures, block_size):
+    """Frames that rebuild data from the blocks a signature table describes.
+
+    Each block-aligned window of data is looked up by its Adler-32 and,
+    only when that hits, confirmed with the strong digest. A match emits a
+    copy of that block and jumps a whole block ahead; a miss slides the
+    window by one byte, updating the checksum in O(1) rather than
+    rehashing. Consecutive copies of consecutive blocks are merged, so an
+    unchanged file becomes a single copy frame. Yields lists of buffers
+    for send_parts(); literals are memoryview slices of data.
+    """
+    table = {}
+    by_index = list(BLOCK_SIGNATURE.iter_unpack(signatures))
+    for index, (weak, strong) in enumerate(by_index):
+        table.setdefault(weak, {}).setdefault(strong, index)
+
+    size = len(data)
+    copy_first = copy_count = 0
+    literal_start = pos = 0
+    weak = None
+    while pos + block_size <= size:
+        if weak is None:
+            weak = zlib.adler32(data[pos:pos + block_size])
+        index = None
+        candidates = table.get(weak)
+        if candidates is not None:
+            strong = strong_digest(data[pos:pos + block_size])
+            following = copy_first + copy_count
+            if copy_count and following < len(by_index) and by_index[following] == (weak, strong):
+                index = following  # Prefer the block that extends the pending copy
+            else:
+                index = candidates.get(strong)
+        if index is not None:
+            if literal_start < pos:
+                if copy_count:
+                    yield [DELTA_OP.pack(OP_COPY, copy_first, copy_count)]
+                    copy_count = 0
+                yield from _literals(data, literal_start, pos)
+            if copy_count and index == copy_first + copy_count:
+                copy_count += 1
+            else:
+                if copy_count:
+                    yield [DELTA_OP.pack(OP_COPY, copy_first, copy_count)]
+                copy_first, copy_count = index, 1
+            pos += block_size
+            literal_start = pos
+            weak = None
+        else:
+            if pos + block_size < size:
+                # Roll the window one byte: drop data[pos], take in data[pos + block_size]
+                a, b = weak & 0xFFFF, weak >> 16
+                out, new = data[pos], data[pos + block_size]
+                a = (a - out + new) % ADLER_MOD
+                b = (b - block_size * out + a - 1) % ADLER_MOD
+                weak = (b << 16) | a
+            pos += 1
+    if copy_count:
+        yield [DELTA_OP.pack(OP_COPY, copy_first, copy_count)]
+    yield from _literals(data, literal_start, size)
+    yield [DELTA_OP.pack(OP_END, 0, 0)]
+
+def _literals(data, start, end):
+    for offset in range(start, end, MAX_LITERAL):
+        piece = data[offset:min(offset + MAX_LITERAL, end)]
+        yield [DELTA_OP.pack(OP_LITERAL, len(piece), 0), piece]
+
+def apply_delta(reader, basis, out, block_size, hasher):
+    """Write the file a delta stream describes to out; returns (literal bytes, copied bytes).
+
+    Copies are read from basis, the local copy the signatures were made of.
+    """
+    literal_bytes = copied_bytes = 0
+    while True:
+        frame = reader.read(DELTA_OP.size)
+        if frame is None:
+            raise ConnectionError("Delta stream ended early")
+        op, first, count = DELTA_OP.unpack(frame)
+        if op == OP_END:
+            return literal_bytes, copied_bytes
+        if op == OP_LITERAL:
+            data = reader.read(first)
+            if data is None:
+                raise ConnectionError("Delta stream ended early")
+            out.write(data)
+            hasher.update(data)
+            literal_bytes += len(data)
+        elif op == OP_COPY:
+            basis.seek(first * block_size)
+            remaining = count * block_size
+            while remaining:
+                data = basis.read(min(remaining, MAX_LITERAL))
+                if not data:
+                    raise ValueError(f"Delta refers to blocks {first}-{first + count - 1} past the local copy")
+                out.write(data)
+                hasher.update(data)
+                remaining -= len(data)
+            copied_bytes += count * block_size
+        else:
+            raise ValueError(f"Unknown delta opcode {op}")
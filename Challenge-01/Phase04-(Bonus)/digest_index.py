@@ -0,0 +1,78 @@
+import hashlib
+import json
+import os
+import threading
+from protocol import VERSION_SIZE
+
+INDEX_SUFFIX = '.digests'
+
+def file_key(file_path):
+    """What identifies one version of a file: its path, size, mtime and inode"""
+    stat = os.stat(file_path)
+    return {
+        "path": os.path.abspath(file_path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "inode": stat.st_ino,
+    }
+
+def file_version(file_path):
+    """Short tag of file_key(), so resumed and striped downloads can tell the file did not change"""
+    return hashlib.blake2b(json.dumps(file_key(file_path), sort_keys=True).encode(), digest_size=VERSION_SIZE).digest()
+
+class DigestIndex:
+    """On-disk sidecar holding a file's digests, so a hot file is hashed only once.
+
+    The sidecar (``<file>.digests``) starts with one JSON line describing the
+    file it was built from (path, size, mtime and inode) and where each entry
+    lives, followed by the raw digest bytes. If the file has changed since,
+    the key no longer matches and every entry is treated as missing. Entries
+    are named by the caller, e.g. ``"chunks:1024:crc32:16"``, so digests for
+    several chunk sizes and algorithms can live side by side.
+    """
+
+    def __init__(self, file_path):
+        self.index_path = file_path + INDEX_SUFFIX
+        self.key = file_key(file_path)
+        self.entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path, 'rb') as f:
+                meta, _, blob = f.read().partition(b'\n')
+            meta = json.loads(meta)
+        except (OSError, ValueError):
+            return {}
+        if meta.get("key") != self.key:
+            return {}  # File changed (or was replaced) since the index was written
+        return {name: blob[offset:offset + length] for name, (offset, length) in meta["entries"].items()}
+
+    def _save(self):
+        entries, blob, offset = {}, [], 0
+        for name, value in self.entries.items():
+            entries[name] = (offset, len(value))
+            blob.append(value)
+            offset += len(value)
+        meta = json.dumps({"key": self.key, "entries": entries}).encode()
+        temp_path = f"{self.index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(meta + b'\n')
+                f.writelines(blob)
+            os.replace(temp_path, self.index_path)  # Readers never see a half-written index
+        except OSError:
+            pass  # Read-only directory: keep serving, just without the cache
+
+    def update(self, entries):
+        """Store several entries computed elsewhere, e.g. while the file was being sent"""
+        self.entries.update(entries)
+        self._save()
+
+    def get(self, name, compute):
+        """Cached value of entry name, calling compute() and storing the result on a miss"""
+        value = self.entries.get(name)
+        if value is None:
+            value = compute()
+            self.entries[name] = value
+            self._save()
+        return value
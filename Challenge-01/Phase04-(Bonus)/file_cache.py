@@ -0,0 +1,127 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+class FileCache:
+    """In-memory LRU cache of per-file values (content, digests), bounded by a byte budget.
+
+    Values are stored per file under a caller-chosen name, e.g.
+    ``"content"`` or ``"chunks:1024:crc32:16"``, and every lookup stats the
+    file first: if its size, mtime or inode changed, all of its values are
+    dropped. Whole files are evicted least recently used first once the
+    values held exceed the budget; a single value larger than the budget is
+    returned but not kept.
+
+    When several threads miss on the same value at once, only the first one
+    calls ``compute()``; the others wait for its result instead of reading
+    the file again. A budget of 0 disables the cache.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.files = OrderedDict()  # path -> (stat key, {name: value}), least recently used first
+        self.size = 0  # Bytes held across all values
+        self.loading = {}  # (path, stat key, name) -> Future of the load in progress
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.coalesced = self.evictions = self.invalidations = 0
+
+    def get(self, file_path, name, compute):
+        """Value name of file_path, calling compute() only if no thread has it or is loading it"""
+        if not self.budget:
+            return compute()
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+        key = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        with self.lock:
+            cached = self.files.get(path)
+            if cached is not None and cached[0] != key:
+                self._drop(path)  # File changed since it was cached
+                self.invalidations += 1
+                cached = None
+            if cached is not None and name in cached[1]:
+                self.files.move_to_end(path)
+                self.hits += 1
+                return cached[1][name]
+            future = self.loading.get((path, key, name))
+            loader = future is None
+            if loader:
+                future = self.loading[(path, key, name)] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not loader:
+            return future.result()
+
+        try:
+            value = compute()
+        except BaseException as e:
+            with self.lock:
+                del self.loading[(path, key, name)]
+            future.set_exception(e)
+            raise
+        with self.lock:
+            del self.loading[(path, key, name)]
+            self._store(path, key, name, value)
+        future.set_result(value)
+        return value
+
+    def peek(self, file_path, name):
+        """Value name of file_path if it is cached and the file is unchanged, else None; never loads"""
+        if not self.budget:
+            return None
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+        with self.lock:
+            cached = self.files.get(path)
+            if cached is None or cached[0] != (stat.st_size, stat.st_mtime_ns, stat.st_ino) or name not in cached[1]:
+                return None
+            self.files.move_to_end(path)
+            self.hits += 1
+            return cached[1][name]
+
+    def put(self, file_path, name, value):
+        """Cache a value computed outside get(), e.g. while the file was being sent"""
+        if not self.budget:
+            return
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+        with self.lock:
+            self._store(path, (stat.st_size, stat.st_mtime_ns, stat.st_ino), name, value)
+
+    def content(self, file_path):
+        """The whole file as bytes, or None if it alone would exceed the budget"""
+        if os.path.getsize(file_path) > self.budget:
+            return None
+
+        def read():
+            with open(file_path, 'rb') as f:
+                return f.read()
+        return self.get(file_path, "content", read)
+
+    def stats(self):
+        with self.lock:
+            return (f"{self.hits} hits, {self.misses} misses, {self.coalesced} coalesced, "
+                    f"{self.evictions} evicted, {self.invalidations} invalidated, "
+                    f"{self.size / (1 << 20):.1f} of {self.budget / (1 << 20):.1f} MiB in {len(self.files)} files")
+
+    def _store(self, path, key, name, value):
+        if len(value) > self.budget:
+            return
+        cached = self.files.get(path)
+        if cached is None or cached[0] != key:
+            if cached is not None:
+                self._drop(path)
+            cached = self.files[path] = (key, {})
+        if name in cached[1]:
+            self.size -= len(cached[1][name])
+        cached[1][name] = value
+        self.size += len(value)
+        self.files.move_to_end(path)
+        while self.size > self.budget:
+            self._drop(next(iter(self.files)))
+            self.evictions += 1
+
+    def _drop(self, path):
+        _, values = self.files.pop(path)
+        self.size -= sum(len(value) for value in values.values())
@@ -0,0 +1,56 @@
+class FrameReader:
+    """Read exact-size frames from a socket without per-frame allocations.
+
+    Bytes are received with ``sock.recv_into`` straight into one
+    preallocated buffer and frames are handed out as memoryview slices of
+    it. A frame that arrives split across several TCP segments is simply
+    read until complete. When the free space at the end runs out, the few
+    unread bytes are moved back to the front, so the buffer is reused like
+    a ring.
+
+    A returned frame is only valid until the next call to ``read``; copy it
+    with ``bytes(frame)`` to keep it. Once a socket is wrapped, every read
+    must go through the reader, because it may already hold bytes that
+    belong to the next frame.
+    """
+
+    def __init__(self, sock, capacity=64 * 1024):
+        self.sock = sock
+        self.buffer = bytearray(capacity)
+        self.view = memoryview(self.buffer)
+        self.start = 0  # First unread byte
+        self.end = 0  # One past the last received byte
+
+    def buffered(self):
+        """Number of received bytes not yet handed out"""
+        return self.end - self.start
+
+    def read(self, num_bytes):
+        """Return exactly num_bytes as a memoryview, or None if the peer closed first"""
+        if self.end - self.start < num_bytes and not self._fill(num_bytes):
+            return None
+        frame = self.view[self.start:self.start + num_bytes]
+        self.start += num_bytes
+        return frame
+
+    def _fill(self, num_bytes):
+        unread = self.end - self.start
+        if not unread:
+            self.start = self.end = 0
+        if num_bytes > len(self.buffer):
+            # Frame larger than the buffer: switch to a bigger one
+            buffer = bytearray(max(num_bytes, 2 * len(self.buffer)))
+            buffer[:unread] = self.view[self.start:self.end]
+            self.buffer, self.view = buffer, memoryview(buffer)
+            self.start, self.end = 0, unread
+        elif self.start + num_bytes > len(self.buffer):
+            # Not enough room after the unread bytes: wrap them to the front
+            self.buffer[:unread] = self.buffer[self.start:self.end]
+            self.start, self.end = 0, unread
+
+        while self.end - self.start < num_bytes:
+            received = self.sock.recv_into(self.view[self.end:])
+            if not received:
+                return False
+            self.end += received
+        return True
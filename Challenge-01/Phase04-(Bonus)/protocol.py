@@ -0,0 +1,216 @@
+import hashlib
+import struct
+import zlib
+from pathlib import PurePosixPath, PureWindowsPath
+
+END_SEQ = -1  # Transfer complete
+PASS_END_SEQ = -2  # Pipelined mode: end of a pass, client must report its bitmap
+PARITY_SEQ = -3  # Pipelined mode with FEC: XOR parity of the chunk frames since the previous one
+MISSING_FILE = -1  # Sent instead of the chunk count for a file the server cannot serve
+
+# Integrity algorithms the client can request, separately per chunk and for the whole file
+INTEGRITY_ALGORITHMS = ("crc32", "blake2b", "sha256")
+CHUNK_ALGORITHM = "crc32"
+FILE_ALGORITHM = "sha256"
+BLAKE2B_DIGEST_SIZE = 16
+VERSION_SIZE = 16  # Tag naming the version of a file being served, sent where the whole-file digest used to be
+
+REQUEST_LENGTH = struct.Struct('!I')
+REPORT_HEADER = struct.Struct('!II')  # frames processed, bitmap length
+PARITY_HEADER = struct.Struct('!II')  # chunks covered, parity length
+MAX_FEC_GROUP = 64
+
+def recv_all(sock, num_bytes):
+    data = b''
+    while len(data) < num_bytes:
+        packet = sock.recv(num_bytes - len(data))
+        if not packet:
+            return None
+        data += packet
+    return data
+
+def send_parts(sock, parts):
+    """Send several buffers as one frame without concatenating them first"""
+    if not hasattr(sock, 'sendmsg'):
+        sock.sendall(b''.join(parts))
+        return
+    parts = [memoryview(part).cast('B') for part in parts]
+    while parts:
+        sent = sock.sendmsg(parts)
+        while parts and sent >= len(parts[0]):
+            sent -= len(parts[0])
+            parts.pop(0)
+        if parts and sent:
+            parts[0] = parts[0][sent:]
+
+# --- Request: 4-byte length + "filename\nkey=value\n..." ---
+
+def send_request(sock, filename, **options):
+    lines = [filename] + [f"{key}={value}" for key, value in options.items()]
+    payload = "\n".join(lines).encode()
+    sock.sendall(REQUEST_LENGTH.pack(len(payload)) + payload)
+
+def read_request(sock):
+    length = recv_all(sock, REQUEST_LENGTH.size)
+    if length is None:
+        return None, {}
+    payload = recv_all(sock, REQUEST_LENGTH.unpack(length)[0])
+    if payload is None:
+        return None, {}
+    filename, *lines = payload.decode().split("\n")
+    options = dict(line.split("=", 1) for line in lines if "=" in line)
+    return filename, options
+
+# --- Directory listing (mode=list): 4-byte length + relative paths, one per line ---
+
+def send_listing(sock, names):
+    payload = "\n".join(names).encode()
+    sock.sendall(REQUEST_LENGTH.pack(len(payload)) + payload)
+
+def safe_relative_path(name):
+    """Whether name is a relative path that stays under the directory it is joined to"""
+    for path in (PurePosixPath(name), PureWindowsPath(name)):
+        if path.is_absolute() or path.drive or path.root or ".." in path.parts:
+            return False
+    return bool(name)
+
+def read_listing(reader):
+    length = reader.read(REQUEST_LENGTH.size)
+    if length is None:
+        return None
+    payload = reader.read(REQUEST_LENGTH.unpack(length)[0])
+    if payload is None:
+        return None
+    return [name for name in bytes(payload).decode().split("\n") if name]
+
+# --- Integrity: raw digests, never hex ---
+
+class Crc32:
+    """zlib.crc32 behind the hashlib update()/digest() interface"""
+
+    def __init__(self):
+        self.value = 0
+
+    def update(self, data):
+        self.value = zlib.crc32(data, self.value)
+
+    def digest(self):
+        return self.value.to_bytes(4, 'big')
+
+def new_hasher(algorithm, blake2b_size=BLAKE2B_DIGEST_SIZE):
+    if algorithm == "crc32":
+        return Crc32()
+    if algorithm == "blake2b":
+        return hashlib.blake2b(digest_size=blake2b_size)
+    if algorithm == "sha256":
+        return hashlib.sha256()
+    raise ValueError(f"unsupported integrity algorithm {algorithm!r}")
+
+def digest_size(algorithm, blake2b_size=BLAKE2B_DIGEST_SIZE):
+    return {"crc32": 4, "blake2b": blake2b_size, "sha256": 32}[algorithm]
+
+def digest(data, algorithm, blake2b_size=BLAKE2B_DIGEST_SIZE):
+    """Raw digest of data in one call"""
+    if algorithm == "crc32":
+        return zlib.crc32(data).to_bytes(4, 'big')
+    hasher = new_hasher(algorithm, blake2b_size)
+    hasher.update(data)
+    return hasher.digest()
+
+def integrity_options(options):
+    """(chunk algorithm, file algorithm, BLAKE2b size) from request options, validated"""
+    chunk_algorithm = options.get("chunk_algo", CHUNK_ALGORITHM)
+    file_algorithm = options.get("file_algo", FILE_ALGORITHM)
+    blake2b_size = int(options.get("blake2b_size", BLAKE2B_DIGEST_SIZE))
+    for algorithm in (chunk_algorithm, file_algorithm):
+        if algorithm not in INTEGRITY_ALGORITHMS:
+            raise ValueError(f"unsupported integrity algorithm {algorithm!r}")
+    if not 1 <= blake2b_size <= 64:
+        raise ValueError(f"BLAKE2b digest size {blake2b_size} out of range")
+    return chunk_algorithm, file_algorithm, blake2b_size
+
+# --- Bitmap of verified chunks: bit (seq % 8) of byte (seq // 8) ---
+
+def new_bitmap(chunk_count):
+    return bytearray((chunk_count + 7) // 8)
+
+def set_bit(bitmap, seq):
+    bitmap[seq >> 3] |= 1 << (seq & 7)
+
+def has_bit(bitmap, seq):
+    return bool(bitmap[seq >> 3] & (1 << (seq & 7)))
+
+def missing_chunks(bitmap, chunk_count):
+    """Sequence numbers whose bit is not set"""
+    missing = []
+    for index, byte in enumerate(bitmap):
+        if byte == 0xFF:
+            continue
+        for bit in range(8):
+            seq = (index << 3) | bit
+            if seq < chunk_count and not byte & (1 << bit):
+                missing.append(seq)
+    return missing
+
+def encode_ranges(seqs):
+    """Sorted sequence numbers as compact ranges, e.g. [0, 1, 2, 7] -> "0-2,7" """
+    ranges = []
+    for seq in seqs:
+        if ranges and ranges[-1][1] == seq - 1:
+            ranges[-1][1] = seq
+        else:
+            ranges.append([seq, seq])
+    return ",".join(f"{start}-{end}" if start != end else f"{start}" for start, end in ranges)
+
+def parse_ranges(text):
+    """Inverse of encode_ranges"""
+    seqs = []
+    for part in filter(None, text.split(",")):
+        start, _, end = part.partition("-")
+        seqs.extend(range(int(start), int(end or start) + 1))
+    return seqs
+
+def stripe_option(options):
+    """(index, streams) from a "stripe=index/streams" request option, or None"""
+    if "stripe" not in options:
+        return None
+    index, _, streams = options["stripe"].partition("/")
+    index, streams = int(index), int(streams)
+    if not 0 <= index < streams:
+        raise ValueError(f"bad stripe {options['stripe']!r}")
+    return index, streams
+
+def stripe_chunks(chunk_count, index, streams):
+    """Contiguous range of sequence numbers that stream index of streams carries"""
+    return range(chunk_count * index // streams, chunk_count * (index + 1) // streams)
+
+def fec_option(options):
+    """Chunks per XOR parity frame from a "fec=K" request option; 0 means no FEC"""
+    group = int(options.get("fec", 0))
+    if not 0 <= group <= MAX_FEC_GROUP:
+        raise ValueError(f"FEC group size {group} out of range")
+    return group
+
+def xor_parity(chunks, length):
+    """XOR of chunks, each zero-padded to length bytes.
+
+    Python ints XOR a whole buffer in one C-level operation, which is far
+    faster than looping over bytes.
+    """
+    parity = 0
+    for chunk in chunks:
+        parity ^= int.from_bytes(bytes(chunk).ljust(length, b'\0'), 'big')
+    return parity.to_bytes(length, 'big')
+
+def send_report(sock, frames_processed, bitmap):
+    sock.sendall(REPORT_HEADER.pack(frames_processed, len(bitmap)) + bytes(bitmap))
+
+def recv_report(sock):
+    header = recv_all(sock, REPORT_HEADER.size)
+    if header is None:
+        return None, None
+    frames_processed, length = REPORT_HEADER.unpack(header)
+    bitmap = recv_all(sock, length) if length else b''
+    if bitmap is None:
+        return None, None
+    return frames_processed, bytearray(bitmap)
@@ -0,0 +1,145 @@
+import json
+import os
+import threading
+from protocol import new_bitmap, set_bit, has_bit, missing_chunks, encode_ranges
+
+CHECKPOINT_INTERVAL = 256  # Persist the bitmap after this many new chunks
+
+def load_resume_state(output_path):
+    """State left behind by an interrupted download of output_path, or None"""
+    if not os.path.exists(output_path + '.part'):
+        return None
+    try:
+        with open(output_path + '.resume') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def resume_options(state):
+    """Request options asking only for the chunks an interrupted run did not get"""
+    identity = state["identity"]
+    missing = missing_chunks(bytearray.fromhex(state["bitmap"]), identity["chunk_count"])
+    return {"resume": identity["version"], "ranges": encode_ranges(missing), "chunk_size": identity["chunk_size"]}
+
+class PartialDownload:
+    """Output file filled in place chunk by chunk, plus the state needed to resume it.
+
+    Verified chunks are written straight to ``<output>.part`` at their final
+    offset and recorded in a bitmap. The bitmap, together with the identity
+    of the file being downloaded, is saved to ``<output>.resume`` every
+    CHECKPOINT_INTERVAL chunks and on close. Chunk data is always flushed
+    before the bitmap that claims it, so a crash can only lose bits, never
+    claim chunks that are not on disk.
+
+    Several streams may write concurrently: chunks go out with positional
+    writes and the bitmap is only touched under a lock.
+
+    The whole file is hashed as it is written: file_hasher takes every chunk
+    of the contiguous prefix on disk, so a chunk written in order is hashed
+    straight from memory and only chunks that arrived ahead of it (or were
+    kept from an earlier run) are read back.
+    """
+
+    def __init__(self, output_path, chunk_size, chunk_count, version, file_hasher, state=None):
+        self.output_path = output_path
+        self.part_path = output_path + '.part'
+        self.state_path = output_path + '.resume'
+        self.chunk_size = chunk_size
+        self.chunk_count = chunk_count
+        self.version = version  # The server's tag for the file version; a changed file gets a new one
+        self.identity = {"chunk_size": chunk_size, "chunk_count": chunk_count, "version": version.hex()}
+
+        self.resumed = state is not None and state.get("identity") == self.identity
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        if self.resumed:
+            self.bitmap = bytearray.fromhex(state["bitmap"])
+            self.file = open(self.part_path, 'r+b')
+        else:
+            self.bitmap = new_bitmap(chunk_count)
+            self.file = open(self.part_path, 'w+b')
+            # Preallocate up to the last chunk, whose write sets the exact final size
+            self.file.truncate(max(chunk_count - 1, 0) * chunk_size)
+        self.count = chunk_count - len(self.missing())  # Chunks held, kept up to date by write()
+        self.file_hasher = file_hasher
+        self.hashed = 0  # Chunks fed to file_hasher, always a prefix of the file
+        self.unsaved = 0
+        self.lock = threading.Lock()
+
+    def has(self, seq):
+        return has_bit(self.bitmap, seq)
+
+    def missing(self):
+        return missing_chunks(self.bitmap, self.chunk_count)
+
+    def received(self):
+        return self.count
+
+    def complete(self):
+        return self.count == self.chunk_count
+
+    def write(self, seq, chunk):
+        if hasattr(os, 'pwrite'):
+            os.pwrite(self.file.fileno(), chunk, seq * self.chunk_size)
+        else:
+            with self.lock:
+                self.file.seek(seq * self.chunk_size)
+                self.file.write(chunk)
+                self.file.flush()
+        with self.lock:
+            if not has_bit(self.bitmap, seq):
+                self.count += 1
+            set_bit(self.bitmap, seq)
+            if seq == self.hashed:
+                self.file_hasher.update(chunk)
+                self.hashed += 1
+                self._hash_held()
+            self.unsaved += 1
+            if self.unsaved >= CHECKPOINT_INTERVAL:
+                self.checkpoint()
+
+    def _hash_held(self):
+        """Extend the hashed prefix over chunks already on disk; callers hold the lock"""
+        while self.hashed < self.chunk_count and has_bit(self.bitmap, self.hashed):
+            offset = self.hashed * self.chunk_size
+            if hasattr(os, 'pread'):
+                chunk = os.pread(self.file.fileno(), self.chunk_size, offset)
+            else:
+                self.file.seek(offset)
+                chunk = self.file.read(self.chunk_size)
+            self.file_hasher.update(chunk)
+            self.hashed += 1
+
+    def digest(self):
+        """Whole-file digest of a complete download, without reading back what was hashed while writing"""
+        with self.lock:
+            self._hash_held()
+            return self.file_hasher.digest()
+
+    def checkpoint(self):
+        """Save the bitmap; callers other than close() hold the lock"""
+        os.fsync(self.file.fileno())
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({"identity": self.identity, "bitmap": self.bitmap.hex()}, f)
+        os.replace(temp_path, self.state_path)
+        self.unsaved = 0
+
+    def close(self):
+        """Save progress so the next run can resume"""
+        if not self.file.closed:
+            self.checkpoint()
+            self.file.close()
+
+    def discard(self):
+        """Drop the partial file and its state, so the next run starts over"""
+        self.file.close()
+        for path in (self.part_path, self.state_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def finish(self):
+        """Move the completed file into place and drop the resume state"""
+        self.file.close()
+        os.replace(self.part_path, self.output_path)
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
@@ -1,29 +1,148 @@
 import socket
+import mmap
 import os
-import hashlib
 import random
+import select
 import struct
+import threading
+from collections import deque
+from chunk_source import ChunkSource
+from digest_index import DigestIndex, INDEX_SUFFIX, file_version
+from file_cache import FileCache
+from delta import BLOCK_SIGNATURE, DELTA_OP, encode_delta
+from protocol import (END_SEQ, PASS_END_SEQ, PARITY_SEQ, PARITY_HEADER, MISSING_FILE, read_request, recv_all, send_parts,
+                      send_listing, safe_relative_path, new_bitmap, has_bit, missing_chunks, recv_report, integrity_options, new_hasher,
+                      digest, digest_size, parse_ranges, stripe_option, stripe_chunks, fec_option, xor_parity)
 
-CHUNK_SIZE = 1024
+CHUNK_SIZE = 1024  # Default; a client may ask for another size within the limits below
+MIN_CHUNK_SIZE = 256
+MAX_CHUNK_SIZE = 64 * 1024
 SERVER_HOST = '0.0.0.0'
 SERVER_PORT = 5001
+SERVED_ROOT = '.'  # Requests name files and directories relative to this; nothing outside it is served
 CORRUPTION_PROBABILITY = 0.2  # 20% chance to corrupt a chunk
+LISTEN_BACKLOG = 16  # Striped downloads open several connections at once
+USE_DIGEST_INDEX = True  # Keep digests in a <file>.digests sidecar so repeat downloads skip hashing
+MAX_DELTA_BLOCKS = 1 << 20  # Largest signature table a delta client may send
+FILE_CACHE_BUDGET = 64 * 1024 * 1024  # Bytes of file content and digests kept in memory; 0 disables the cache
 
-def compute_checksum(data):
-    sha256 = hashlib.sha256()
-    sha256.update(data)
-    return sha256.hexdigest()
+file_cache = FileCache(FILE_CACHE_BUDGET)
 
-def prepare_chunks(file_path):
-    chunks = []
+def prepare_chunks(file_path, chunk_size, chunk_digests=None, chunk_digest_size=0, chunk_digest=None,
+                   file_hasher=None):
+    """Lazy chunk sequence; frames carry their slice of chunk_digests, or a digest chunk_digest() computes on first use.
+
+    Files that fit the cache budget are served from memory, others straight from an mmap.
+    """
+    return ChunkSource(file_path, chunk_size, chunk_digests, chunk_digest_size, file_cache.content(file_path),
+                       chunk_digest, file_hasher)
+
+def negotiate_chunk_size(options):
+    """The client's requested chunk size, clamped to what this server allows"""
+    return min(max(int(options.get("chunk_size", CHUNK_SIZE)), MIN_CHUNK_SIZE), MAX_CHUNK_SIZE)
+
+def compute_digests(file_path, chunk_size, chunk_algorithm, file_algorithm, blake2b_size):
+    """(raw digest of every chunk back to back, raw whole-file digest), in a single pass"""
+    hasher = new_hasher(file_algorithm, blake2b_size)
+    chunk_digests = []
+    with ChunkSource(file_path, chunk_size, data=file_cache.content(file_path)) as chunks:
+        for seq in range(len(chunks)):
+            chunk = chunks.chunk(seq)
+            hasher.update(chunk)
+            chunk_digests.append(digest(chunk, chunk_algorithm, blake2b_size))
+    return b''.join(chunk_digests), hasher.digest()
+
+def compute_file_digest(file_path, file_algorithm, blake2b_size):
+    """Raw whole-file digest, hashed chunk by chunk straight from the mapping"""
+    hasher = new_hasher(file_algorithm, blake2b_size)
+    with ChunkSource(file_path, CHUNK_SIZE, data=file_cache.content(file_path)) as chunks:
+        for seq in range(len(chunks)):
+            hasher.update(chunks.chunk(seq))
+    return hasher.digest()
+
+def cached_digest(file_path, name, compute):
+    """Digest entry name of a file: from memory, else from the sidecar index, else computed"""
+    if USE_DIGEST_INDEX:
+        return file_cache.get(file_path, name, lambda: DigestIndex(file_path).get(name, compute))
+    return file_cache.get(file_path, name, compute)
+
+def known_digest(file_path, name):
+    """Digest entry name from memory or the sidecar index, or None if it was never computed"""
+    value = file_cache.peek(file_path, name)
+    if value is None and USE_DIGEST_INDEX:
+        value = DigestIndex(file_path).entries.get(name)
+        if value is not None:
+            file_cache.put(file_path, name, value)
+    return value
+
+def remember_digests(file_path, entries):
+    """Keep digest entries computed while the file was sent, in memory and in the sidecar index"""
+    if not entries:
+        return
+    for name, value in entries.items():
+        file_cache.put(file_path, name, value)
+    if USE_DIGEST_INDEX:
+        DigestIndex(file_path).update(entries)
+
+def load_file_digest(file_path, file_algorithm, blake2b_size):
+    """Whole-file digest alone, hashing the file only if it changed"""
+    return cached_digest(file_path, f"file:{file_algorithm}:{blake2b_size}",
+                         lambda: compute_file_digest(file_path, file_algorithm, blake2b_size))
+
+def resolve_request(name):
+    """Path of a requested file or directory under SERVED_ROOT, or None if it would escape it"""
+    if not safe_relative_path(name):
+        return None
+    root = os.path.realpath(SERVED_ROOT)
+    path = os.path.realpath(os.path.join(root, name))
+    return path if os.path.commonpath([root, path]) == root else None  # Symlinks may point outside
+
+def list_directory(path):
+    """Relative paths of the regular files under path, sorted; digest sidecars are left out"""
+    names = []
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            full_path = os.path.join(root, name)
+            if not name.endswith(INDEX_SUFFIX) and os.path.isfile(full_path):
+                names.append(os.path.relpath(full_path, path).replace(os.sep, "/"))
+    return names
+
+def send_delta(client_socket, file_path, signatures, block_size, file_digest):
+    """Reply to a delta request: the whole-file digest, then literals and references to the client's blocks.
+
+    Frames are not corrupted on purpose here: the delta is checked as a
+    whole against the file digest, so there is nothing to retransmit.
+    """
+    client_socket.sendall(file_digest)
+    literal_bytes = copied_blocks = 0
     with open(file_path, 'rb') as f:
-        seq = 0
-        while chunk := f.read(CHUNK_SIZE):
-            checksum = compute_checksum(chunk)
-            header = f"{seq:08d}".encode()
-            chunks.append((seq, header, checksum.encode(), chunk))
-            seq += 1
-    return chunks
+        size = os.fstat(f.fileno()).st_size
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        data = memoryview(mapping) if mapping is not None else memoryview(b'')
+        try:
+            for parts in encode_delta(data, signatures, block_size):
+                send_parts(client_socket, parts)
+                if len(parts) > 1:
+                    literal_bytes += len(parts[1])
+                else:
+                    copied_blocks += DELTA_OP.unpack(parts[0])[2]
+        finally:
+            data.release()
+            if mapping is not None:
+                try:
+                    mapping.close()
+                except BufferError:
+                    pass  # The last literal slice is still referenced; the mapping is freed with it
+    print(f"[Server] Delta sent: {literal_bytes} literal bytes, {copied_blocks} of "
+          f"{len(signatures) // BLOCK_SIGNATURE.size} client blocks reused")
+
+def send_manifest(client_socket, chunk_digests, file_algorithm, blake2b_size):
+    """Send every chunk's raw digest up front so frames need not carry a checksum.
+
+    The digest list is preceded by its root, hashed with the whole-file algorithm.
+    """
+    send_parts(client_socket, [digest(chunk_digests, file_algorithm, blake2b_size), chunk_digests])
 
 def corrupt_data(data):
     data = bytearray(data)
@@ -31,43 +150,271 @@ def corrupt_data(data):
     data[index] ^= 0xFF  # Flip one byte
     return bytes(data)
 
-# --- Main server setup ---
-server_socket = socket.socket()
-server_socket.bind((SERVER_HOST, SERVER_PORT))
-server_socket.listen(1)
-print(f"[*] Listening as {SERVER_HOST}:{SERVER_PORT}")
+def send_chunk(client_socket, header, checksum, chunk):
+    corrupted_chunk = corrupt_data(chunk) if random.random() < CORRUPTION_PROBABILITY else chunk
+    chunk_length_bytes = struct.pack('!I', len(corrupted_chunk))  # 4-byte length
+
+    # Send header + checksum + chunk_length + chunk
+    send_parts(client_socket, [header, checksum, chunk_length_bytes, corrupted_chunk])
+
+def recv_ack(client_socket):
+    """Read exactly one "ACK" or "NACK", so a request pipelined behind it stays in the socket"""
+    reply = recv_all(client_socket, 3)
+    if reply == b"NAC":
+        reply += recv_all(client_socket, 1) or b""
+    return reply.decode(errors="replace") if reply is not None else ""
+
+def send_with_ack(client_socket, chunks, wanted):
+    """Stop-and-wait: every chunk waits for its own ACK/NACK; False if the client broke off"""
+    for seq in wanted:
+        _, header, checksum, chunk = chunks[seq]
+        while True:
+            send_chunk(client_socket, header, checksum, chunk)
 
-client_socket, address = server_socket.accept()
-print(f"[+] {address} is connected.")
+            # Wait for ACK/NACK
+            ack = recv_ack(client_socket)
+            if ack == "ACK":
+                break
+            elif ack == "NACK":
+                print(f"[Server] Chunk {seq} corrupted. Resending...")
+            else:
+                print("[Server] Invalid response. Terminating.")
+                return False
+    return True
 
-filename = client_socket.recv(1024).decode()
-print(f"[Server] Requested file: {filename}")
+def send_pipelined(client_socket, chunks, wanted, fec=0):
+    """Stream every chunk without waiting, retransmitting only what the client reports missing.
 
-chunks = prepare_chunks(filename)
+    The client periodically sends a bitmap of verified chunks together with the
+    number of frames it has processed so far. A chunk is only queued again when
+    the bitmap says it is missing *and* its latest copy is among the processed
+    frames, so chunks still in flight are never resent.
 
-# Send number of chunks first
-client_socket.send(f"{len(chunks):08d}".encode())
+    With fec > 0, every fec chunk frames (and the end of each pass) are
+    followed by a parity frame, the XOR of those chunks, from which the client
+    rebuilds any one of them that arrived corrupted. Parity frames are not
+    counted as frames. Returns False if the client disconnected.
+    """
+    chunk_count = len(chunks)
+    verified = new_bitmap(chunk_count)
+    queue = deque(wanted)
+    queued = set(queue)
+    last_sent = {}  # seq -> index of the frame that last carried it
+    frames_sent = 0
+    passes = 0
+    group = []  # Chunks sent since the last parity frame
+    parity_frames = 0
+
+    def send_parity():
+        nonlocal parity_frames
+        length = max(len(chunk) for chunk in group)
+        parity = xor_parity(group, length)
+        if random.random() < CORRUPTION_PROBABILITY:
+            parity = corrupt_data(parity)  # Parity crosses the same unreliable link
+        send_parts(client_socket, [f"{PARITY_SEQ:08d}".encode(), PARITY_HEADER.pack(len(group), length), parity])
+        group.clear()
+        parity_frames += 1
+
+    def handle_report(frames_processed, bitmap):
+        verified[:] = bitmap
+        for seq in missing_chunks(bitmap, chunk_count):
+            if seq not in queued and last_sent.get(seq, frames_sent) < frames_processed:
+                print(f"[Server] Chunk {seq} reported missing. Queued for retransmission.")
+                queue.append(seq)
+                queued.add(seq)
 
-for seq, header, checksum, chunk in chunks:
     while True:
-        corrupted_chunk = corrupt_data(chunk) if random.random() < CORRUPTION_PROBABILITY else chunk
-        chunk_length_bytes = struct.pack('!I', len(corrupted_chunk))  # 4-byte length
+        passes += 1
+        while queue:
+            seq = queue.popleft()
+            queued.discard(seq)
+            if has_bit(verified, seq):
+                continue
+            _, header, checksum, chunk = chunks[seq]
+            send_chunk(client_socket, header, checksum, chunk)
+            last_sent[seq] = frames_sent
+            frames_sent += 1
+            if fec:
+                group.append(chunk)
+                if len(group) == fec:
+                    send_parity()
 
-        # Send header + checksum + chunk_length + chunk
-        client_socket.sendall(header + checksum + chunk_length_bytes + corrupted_chunk)
+            # Pick up any bitmap the client sent meanwhile, without blocking
+            while select.select([client_socket], [], [], 0)[0]:
+                frames_processed, bitmap = recv_report(client_socket)
+                if bitmap is None:
+                    print("[Server] Client disconnected. Terminating.")
+                    return False
+                handle_report(frames_processed, bitmap)
 
-        # Wait for ACK/NACK
-        ack = client_socket.recv(4).decode()
-        if ack == "ACK":
+        if group:
+            send_parity()
+        # Ask for a final report covering everything sent so far; periodic
+        # reports still in the socket buffer are older and only update state
+        client_socket.sendall(f"{PASS_END_SEQ:08d}".encode())
+        frames_processed = -1
+        while frames_processed != frames_sent:
+            frames_processed, bitmap = recv_report(client_socket)
+            if bitmap is None:
+                print("[Server] Client disconnected. Terminating.")
+                return False
+            handle_report(frames_processed, bitmap)
+        if not queue:
             break
-        elif ack == "NACK":
-            print(f"[Server] Chunk {seq} corrupted. Resending...")
+        print(f"[Server] Pass {passes} done, {len(queue)} chunks to retransmit.")
+
+    print(f"[Server] All {len(wanted)} chunks verified after {passes} pass(es)"
+          f"{f', {parity_frames} parity frames' if fec else ''}.")
+    return True
+
+def handle_request(client_socket, address, filename, options):
+    """Serve one request; returns False if the connection cannot carry another one"""
+    mode = options.get("mode", "ack")
+    integrity = options.get("integrity", "frame")
+    try:
+        chunk_algorithm, file_algorithm, blake2b_size = integrity_options(options)
+        stripe = stripe_option(options)
+        chunk_size = negotiate_chunk_size(options)
+        fec = fec_option(options)
+        if mode == "delta":
+            blocks = int(options.get("blocks", 0))
+            if chunk_size != int(options.get("chunk_size", CHUNK_SIZE)) or not 0 <= blocks <= MAX_DELTA_BLOCKS:
+                raise ValueError("delta block size or count out of range")
+    except ValueError as e:
+        print(f"[Server] Rejecting request from {address}: {e}")
+        return False
+    path = resolve_request(filename)
+    if path is None:
+        print(f"[Server] Refusing {filename!r} from {address}: outside the served directory")
+    if mode == "list":
+        names = list_directory(path) if path is not None and os.path.isdir(path) else []
+        print(f"[Server] Listing {filename}: {len(names)} files")
+        send_listing(client_socket, names)
+        return True
+    if path is None or not os.path.isfile(path):
+        print(f"[Server] No such file: {filename}")
+        client_socket.sendall(f"{MISSING_FILE:08d}".encode())
+        return True
+    print(f"[Server] Requested file: {filename} (mode: {mode}, integrity: {integrity}, "
+          f"{chunk_algorithm} per chunk, {file_algorithm} per file, {chunk_size}-byte chunks)")
+
+    if mode == "delta":
+        # The client sends the signature table of its local copy right after the request
+        signatures = recv_all(client_socket, blocks * BLOCK_SIGNATURE.size) if blocks else b''
+        if signatures is None:
+            return False
+        send_delta(client_socket, path, signatures, chunk_size,
+                   load_file_digest(path, file_algorithm, blake2b_size))
+        return True
+
+    version = file_version(path)
+    chunk_name = f"chunks:{chunk_size}:{chunk_algorithm}:{blake2b_size}"
+    file_name = f"file:{file_algorithm}:{blake2b_size}"
+    chunk_digests = known_digest(path, chunk_name)
+    file_digest = known_digest(path, file_name)
+    computed = {}  # Digest entries to index once the file has gone out
+    if integrity == "manifest" and chunk_digests is None:
+        # The manifest goes out ahead of the data, so it needs every digest up front; one pass for both
+        chunk_digests, whole = compute_digests(path, chunk_size, chunk_algorithm, file_algorithm, blake2b_size)
+        computed[chunk_name] = chunk_digests
+        if file_digest is None:
+            file_digest = computed[file_name] = whole
+    # Otherwise the whole-file digest is hashed as frames are built, in the same pass, and sent after the last chunk
+    file_hasher = new_hasher(file_algorithm, blake2b_size) if file_digest is None else None
+    if integrity == "manifest":
+        chunks = prepare_chunks(path, chunk_size, file_hasher=file_hasher)
+    else:
+        # Digests not indexed yet are computed frame by frame, so the first chunk goes out at once
+        chunks = prepare_chunks(path, chunk_size, chunk_digests, digest_size(chunk_algorithm, blake2b_size),
+                                lambda chunk: digest(chunk, chunk_algorithm, blake2b_size), file_hasher)
+
+    with chunks:
+        # A resuming client names the file version it has and the chunks it still lacks
+        wanted = range(len(chunks))
+        if options.get("resume") == version.hex():
+            wanted = [seq for seq in parse_ranges(options.get("ranges", "")) if seq < len(chunks)]
+            print(f"[Server] Resuming: {len(wanted)} of {len(chunks)} chunks missing")
+        # A striped download splits the file into one contiguous range per connection
+        if stripe is not None:
+            stripe_range = stripe_chunks(len(chunks), *stripe)
+            wanted = [seq for seq in wanted if seq in stripe_range]
+            print(f"[Server] Stripe {stripe[0] + 1}/{stripe[1]}: {len(wanted)} chunks")
+
+        # Send number of chunks and the chunk size actually used first, then the file's version tag;
+        # the whole-file digest follows the end marker, so hashing never delays the first chunk
+        client_socket.sendall(f"{len(chunks):08d}{chunk_size:08d}".encode() + version)
+        if integrity == "manifest":
+            send_manifest(client_socket, chunk_digests, file_algorithm, blake2b_size)
+
+        if mode == "pipelined":
+            completed = send_pipelined(client_socket, chunks, wanted, fec)
         else:
-            print("[Server] Invalid response. Terminating.")
+            completed = send_with_ack(client_socket, chunks, wanted)
+        if not completed:
+            return False
+
+        if file_digest is None:
+            # Chunks no frame was built for (resumed or striped downloads) are read now
+            file_digest = computed[file_name] = chunks.file_digest()
+        table = chunks.digest_table() if chunk_digests is None else None
+        if table is not None:
+            computed[chunk_name] = table  # Every frame was built, or file_digest() filled in the rest
+
+        # Tell client transfer is done, and what the file it now holds must hash to
+        send_parts(client_socket, [f"{END_SEQ:08d}".encode(), file_digest])
+    remember_digests(path, computed)
+    return True
+
+def handle_client(client_socket, address):
+    """Serve requests until the client closes the connection.
+
+    Without keepalive=1 the connection carries a single request, as each
+    stream of a striped download does. With it, the server reads the next
+    request right after a transfer's end marker; a client that sends it as
+    soon as it holds every chunk keeps the connection busy between files.
+    """
+    requests = 0
+    while True:
+        filename, options = read_request(client_socket)
+        if filename is None:
             break
+        keepalive = options.get("keepalive") == "1"
+        if keepalive and not requests:
+            # Small control frames back to back; do not let Nagle hold one until the previous is acknowledged
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        requests += 1
+        if not handle_request(client_socket, address, filename, options) or not keepalive:
+            break
+    if requests > 1:
+        print(f"[Server] {address}: {requests} requests served on one connection")
+    if FILE_CACHE_BUDGET:
+        print(f"[Server] File cache: {file_cache.stats()}")
+
+def serve_client(client_socket, address):
+    try:
+        handle_client(client_socket, address)
+    except OSError as e:
+        print(f"[Server] Error serving {address}: {e}")
+    finally:
+        client_socket.close()
+
+# --- Main server setup ---
+def main():
+    server_socket = socket.socket()
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server_socket.bind((SERVER_HOST, SERVER_PORT))
+    server_socket.listen(LISTEN_BACKLOG)
+    print(f"[*] Listening as {SERVER_HOST}:{SERVER_PORT}")
 
-# Tell client transfer is done
-client_socket.send(f"{-1:08d}".encode())
+    try:
+        while True:
+            client_socket, address = server_socket.accept()
+            print(f"[+] {address} is connected.")
+            threading.Thread(target=serve_client, args=(client_socket, address), daemon=True).start()
+    except KeyboardInterrupt:
+        print("\n[*] Shutting down server")
+    finally:
+        server_socket.close()
 
-client_socket.close()
-server_socket.close()
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 import socket
 from config import SERVER_HOST, SERVER_PORT, CHUNK_SIZE
-from utils import calculate_checksum
+from utils import new_checksum
 
 def main():
     client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -17,16 +17,16 @@ def main():
     checksum = client.recv(64).decode()
     print(f"[+] Received Checksum: {checksum}")
 
-    # Receive file back
-    received_data = b""
+    # Receive file back, hashing it as it arrives
+    hasher = new_checksum()
     while True:
         chunk = client.recv(CHUNK_SIZE)
         if not chunk:
             break
-        received_data += chunk
+        hasher.update(chunk)
 
-    new_checksum = calculate_checksum(received_data)
-    print("[+] File verification:", "Successful" if new_checksum == checksum else "Failed")
+    received_checksum = hasher.hexdigest()
+    print("[+] File verification:", "Successful" if received_checksum == checksum else "Failed")
 
     client.close()
 
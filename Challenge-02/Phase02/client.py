@@ -1,7 +1,7 @@
 import socket
 import sys
 from config import SERVER_HOST, SERVER_PORT, CHUNK_SIZE
-from utils import calculate_checksum
+from utils import new_checksum
 
 def main():
     client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -19,8 +19,11 @@ def main():
     checksum = client.recv(64).decode()
     print(f"[+] Received Checksum: {checksum}")
 
-    # Receive data with headers
+    # Receive data with headers. Chunks are hashed as soon as they are next in
+    # order, so only out-of-order ones are held and memory does not grow with the file.
     received_chunks = {}
+    next_seq = 0
+    hasher = new_checksum()
     while True:
         header = client.recv(13)  # Format: "CLIENTID:SEQ|"
         if not header:
@@ -45,12 +48,12 @@ def main():
             break
 
         received_chunks[seq_num] = chunk
+        while next_seq in received_chunks:
+            hasher.update(received_chunks.pop(next_seq))
+            next_seq += 1
 
-    # Reassemble in order
-    received_data = b''.join(received_chunks[i] for i in sorted(received_chunks))
-
-    new_checksum = calculate_checksum(received_data)
-    print("[+] File verification:", "Successful" if new_checksum == checksum else "Failed")
+    received_checksum = hasher.hexdigest()
+    print("[+] File verification:", "Successful" if received_checksum == checksum else "Failed")
 
     client.close()
 
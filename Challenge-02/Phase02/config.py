@@ -1,3 +1,4 @@
 CHUNK_SIZE = 1024  # Bytes
 SERVER_HOST = 'localhost'
 SERVER_PORT = 5001
+SPOOL_MEMORY_LIMIT = 1024 * 1024  # Uploads larger than this are spooled to a temp file
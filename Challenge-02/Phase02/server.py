@@ -1,24 +1,31 @@
 import socket
+import tempfile
 import threading
-from config import SERVER_HOST, SERVER_PORT, CHUNK_SIZE
-from utils import calculate_checksum
+from config import SERVER_HOST, SERVER_PORT, CHUNK_SIZE, SPOOL_MEMORY_LIMIT
+from utils import new_checksum
 
 def handle_client(conn, addr, client_id):
     print(f"[+] Client {client_id} connected from {addr}")
-    file_data = b""
+    # The upload stays in memory up to SPOOL_MEMORY_LIMIT, then spills to disk
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_LIMIT)
+    hasher = new_checksum()  # Updated as bytes arrive, no second pass
+    file_size = 0
     
     while True:
         chunk = conn.recv(CHUNK_SIZE)
         if not chunk:
             break
-        file_data += chunk
+        spool.write(chunk)
+        hasher.update(chunk)
+        file_size += len(chunk)
 
-    checksum = calculate_checksum(file_data)
+    checksum = hasher.hexdigest()
     conn.sendall(checksum.encode())
 
-    # Send file back with sequence numbers and client ID
-    for seq_num in range(0, len(file_data), CHUNK_SIZE):
-        chunk = file_data[seq_num:seq_num + CHUNK_SIZE]
+    # Stream the file back from the spool with sequence numbers and client ID
+    spool.seek(0)
+    for seq_num in range(0, file_size, CHUNK_SIZE):
+        chunk = spool.read(CHUNK_SIZE)
         header_str = f"{client_id}:{seq_num // CHUNK_SIZE:06d}|"
         header_bytes = header_str.encode("ascii")
         # Pad header to 13 bytes
@@ -29,6 +36,7 @@ def handle_client(conn, addr, client_id):
         conn.sendall(header_bytes)
         conn.sendall(chunk)
 
+    spool.close()
     conn.close()
     print(f"[-] Client {client_id} disconnected")
 
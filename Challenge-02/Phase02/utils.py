@@ -2,3 +2,7 @@ import hashlib
 
 def calculate_checksum(file_data):
     return hashlib.sha256(file_data).hexdigest()
+
+def new_checksum():
+    """Incremental hasher matching calculate_checksum, for data that arrives in pieces"""
+    return hashlib.sha256()
@@ -0,0 +1,180 @@
+import asyncio
+from collections import deque
+from config import (SERVER_HOST, SERVER_PORT, LISTEN_BACKLOG, ACK_TIMEOUT, MAX_TRANSFERS, ADMISSION_QUEUE,
+                    ADMISSION_WAIT, BUSY_RETRY_AFTER)
+from session import ServerSession
+from utils import encode_busy
+
+class Admission:
+    """At most a fixed number of sessions at once; later connections wait, paused, in arrival order.
+
+    The event loop counterpart of the threads engine's worker pool. A waiting
+    connection is not read from, so it holds no session state. It is turned
+    away with a busy reply if the queue is full or no slot frees up within
+    ADMISSION_WAIT seconds.
+    """
+
+    def __init__(self, limit, queue_limit=ADMISSION_QUEUE, wait=ADMISSION_WAIT):
+        self.limit = limit
+        self.queue_limit = queue_limit
+        self.wait = wait
+        self.active = 0
+        self.waiting = deque()  # Protocols in arrival order
+
+    def enter(self, protocol):
+        if self.active < self.limit:
+            self.active += 1
+            protocol.start()
+        elif len(self.waiting) < self.queue_limit:
+            self.waiting.append(protocol)
+            protocol.hold(self.wait)
+        else:
+            protocol.turn_away("queue full")
+
+    def leave(self, protocol):
+        """A connection closed: free its slot, or its place in the queue"""
+        if protocol.session is None:
+            if protocol in self.waiting:
+                self.waiting.remove(protocol)
+            return
+        self.active -= 1
+        if self.waiting:
+            self.active += 1
+            self.waiting.popleft().start()
+
+    def expire(self, protocol):
+        self.waiting.remove(protocol)
+        protocol.turn_away(f"no free slot within {self.wait:g}s")
+
+class SessionProtocol(asyncio.Protocol):
+    """Drive a ServerSession from event loop callbacks.
+
+    Reads arrive through data_received() and the session's deadlines become
+    loop.call_at() timers, so no coroutine ever blocks or sleeps per client.
+    """
+
+    def __init__(self, client_id, admission):
+        self.client_id = client_id
+        self.admission = admission
+        self.session = None  # Created once the connection is admitted
+        self.transport = None
+        self.timer = None
+        self.timer_deadline = None
+        self.draining = False  # Session over; waiting for the client to close its side
+        self.awaited = None  # Compression future the session is waiting on, with a callback attached
+
+    def connection_made(self, transport):
+        self.transport = transport
+        print(f"[+] Client {self.client_id} connected from {transport.get_extra_info('peername')}")
+        self.admission.enter(self)
+
+    def start(self):
+        """Admitted: start the session and read what the client sent while it waited"""
+        self.cancel_timer()
+        self.session = ServerSession(self.client_id)
+        print(f"[+] Waiting for file data from client {self.client_id}")
+        if not self.transport.is_closing():
+            self.transport.resume_reading()
+            self.pump()
+
+    def hold(self, wait):
+        """Queued: leave the client's bytes in the socket until a slot frees up, for at most wait seconds"""
+        self.transport.pause_reading()
+        self.timer = asyncio.get_running_loop().call_later(wait, self.admission.expire, self)
+
+    def turn_away(self, reason):
+        print(f"[!] Server busy, turning client {self.client_id} away ({reason}); retry after {BUSY_RETRY_AFTER} ms")
+        self.cancel_timer()
+        self.transport.write(encode_busy(self.client_id, BUSY_RETRY_AFTER))
+        self.draining = True
+        if self.transport.can_write_eof():
+            self.transport.write_eof()
+        self.transport.resume_reading()  # Discard the client's bytes so closing does not reset the connection
+        self.timer = asyncio.get_running_loop().call_later(ACK_TIMEOUT, self.transport.close)
+
+    def data_received(self, data):
+        if self.draining or self.session is None:
+            return
+        self.session.receive_data(data)
+        self.pump()
+
+    def eof_received(self):
+        if self.draining or self.session is None:
+            self.transport.close()
+            return True
+        self.session.receive_data(b"")
+        self.pump()
+        return True  # Keep our side open until the session says it is done
+
+    def connection_lost(self, exc):
+        if exc is not None and not self.draining:  # A reset after our end marker is the client leaving
+            print(f"[!] Connection lost with client {self.client_id}: {exc}")
+        self.cancel_timer()
+        self.admission.leave(self)
+        if self.session is not None:
+            self.session.close()
+        print(f"[-] Client {self.client_id} disconnected")
+
+    def on_timer(self):
+        self.timer = None
+        self.timer_deadline = None
+        self.session.on_timer()
+        self.pump()
+
+    def on_compressed(self):
+        self.awaited = None
+        if not self.session.closed:
+            self.session.on_timer()
+            self.pump()
+
+    def cancel_timer(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+            self.timer_deadline = None
+
+    def pump(self):
+        """Flush session output and re-arm the timer for its next deadline"""
+        outgoing = self.session.data_to_send()
+        if outgoing and not self.transport.is_closing():
+            self.transport.write(outgoing)
+        if self.session.closed:
+            self.cancel_timer()
+            if not self.transport.can_write_eof():
+                self.transport.close()
+                return
+            # Half-close and read until the client closes too: closing with its last ACKs still
+            # arriving would reset the connection, and the client could lose the end marker
+            self.draining = True
+            self.transport.write_eof()
+            self.timer = asyncio.get_running_loop().call_later(ACK_TIMEOUT, self.transport.close)
+            return
+
+        if self.session.compressing is not None and self.session.compressing is not self.awaited:
+            # Sending waits for a worker thread; resume on the loop once it is done, without blocking it
+            self.awaited = self.session.compressing
+            asyncio.wrap_future(self.awaited).add_done_callback(lambda _: self.on_compressed())
+        deadline = self.session.next_deadline()
+        if deadline == self.timer_deadline:
+            return
+        self.cancel_timer()
+        if deadline is not None:
+            # The default event loop clock is time.monotonic(), like the session's
+            self.timer = asyncio.get_running_loop().call_at(deadline, self.on_timer)
+            self.timer_deadline = deadline
+
+async def serve(host=SERVER_HOST, port=SERVER_PORT, max_transfers=MAX_TRANSFERS):
+    loop = asyncio.get_running_loop()
+    admission = Admission(max_transfers)
+    next_client_id = 0
+
+    def new_protocol():
+        nonlocal next_client_id
+        protocol = SessionProtocol(next_client_id, admission)
+        next_client_id += 1
+        return protocol
+
+    server = await loop.create_server(new_protocol, host, port, backlog=LISTEN_BACKLOG)
+    print(f"[*] Server listening on {host}:{port} (asyncio engine, {max_transfers} sessions at once)")
+    async with server:
+        await server.serve_forever()
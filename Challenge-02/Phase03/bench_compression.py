@@ -0,0 +1,89 @@
+"""Benchmark the echo with each compression codec against no compression.
+
+Starts server.py in a subprocess (no simulated loss by default), echoes a
+file once per codec and reports the bytes received on the wire and the
+time taken, both for the echo alone and end to end (upload included).
+
+    python bench_compression.py --file test_files/client1.txt --chunk-size 1024
+"""
+import argparse
+import socket
+import subprocess
+import sys
+import time
+from config import SERVER_HOST, MAX_PACKET_SIZE
+from utils import (create_packet_header, parse_packet_header, recv_exact, encode_hello, parse_hello,
+                   decompress_packet, HEADER_SIZE, FLAG_HELLO, FLAG_COMPRESSED, COMPRESSION_CODECS)
+from bench_engines import SERVER_BOOTSTRAP, wait_until_listening
+
+def echo_once(port, data, codec, chunk_size, adaptive):
+    """(wire bytes, echo seconds, total seconds, chunks verified) for one echo of data"""
+    start = time.perf_counter()
+    sock = socket.create_connection((SERVER_HOST, port))
+    hello = encode_hello(chunk_size=chunk_size, adaptive=int(adaptive), compression=codec, size=len(data))
+    sock.sendall(create_packet_header(0, 0, length=len(hello), flags=FLAG_HELLO) + hello)
+    sock.sendall(data)
+    wire = 0
+    reply = None
+    for _ in range(3):  # Hello reply, checksum, then the chunk digest manifest
+        header = recv_exact(sock, HEADER_SIZE)
+        payload = recv_exact(sock, parse_packet_header(header)[3])
+        wire += HEADER_SIZE + len(payload)
+        reply = reply or parse_hello(payload)
+    echo_start = time.perf_counter()
+    chunk_size = reply["chunk_size"]
+    verified = 0
+    while True:
+        header = recv_exact(sock, HEADER_SIZE)
+        if not header:
+            break
+        wire += HEADER_SIZE
+        client_id, seq_num, flags, length = parse_packet_header(header)
+        if seq_num == -1:
+            break
+        payload = recv_exact(sock, length)
+        wire += length
+        try:
+            if flags & FLAG_COMPRESSED:
+                payload = decompress_packet(payload, codec, MAX_PACKET_SIZE)
+            ok = payload == data[seq_num * chunk_size:seq_num * chunk_size + len(payload)]
+        except ValueError:
+            ok = False
+        verified += ok
+        sock.sendall(create_packet_header(client_id, seq_num, is_ack=ok, is_nack=not ok))
+    end = time.perf_counter()
+    sock.close()
+    return wire, end - echo_start, end - start, verified
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--file", default="test_files/client1.txt")
+    parser.add_argument("--chunk-size", type=int, default=1024)
+    parser.add_argument("--adaptive", action="store_true", help="let packets grow to several chunks")
+    parser.add_argument("--port", type=int, default=19997)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--corrupt-rate", type=float, default=0.0)
+    parser.add_argument("--repeat", type=int, default=3, help="echoes per codec; the fastest is reported")
+    args = parser.parse_args()
+
+    with open(args.file, "rb") as f:
+        data = f.read()
+
+    server = subprocess.Popen(
+        [sys.executable, "-u", "-c", SERVER_BOOTSTRAP, str(args.drop_rate), str(args.corrupt_rate),
+         "--port", str(args.port)],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_listening(server)
+        print(f"{len(data)} bytes, {args.chunk_size}-byte chunks{', adaptive packets' if args.adaptive else ''}")
+        print(f"{'codec':>6} {'wire bytes':>11} {'ratio':>6} {'echo ms':>8} {'total ms':>9}")
+        for codec in COMPRESSION_CODECS:
+            runs = [echo_once(args.port, data, codec, args.chunk_size, args.adaptive) for _ in range(args.repeat)]
+            wire, echo_time, total_time, _ = min(runs, key=lambda run: run[1])
+            print(f"{codec:>6} {wire:>11} {wire / len(data):>6.2f} {echo_time * 1000:>8.1f} {total_time * 1000:>9.1f}")
+    finally:
+        server.terminate()
+        server.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Benchmark the threads and asyncio server engines side by side.
+
+Starts server.py in a subprocess for each engine, runs many clients
+concurrently against it and reports wall time, peak server RSS, the
+number of context switches the server process made, per-client latency
+(median and 99th percentile, including waits after busy replies) and how
+many busy replies the clients got.
+
+    python bench_engines.py --clients 200 --file test_files/client1.txt
+    python bench_engines.py --clients 1000 --max-transfers 1000 32  # unbounded vs a small pool
+"""
+import argparse
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+from config import SERVER_HOST, CHUNK_SIZE, MAX_TRANSFERS
+from utils import (create_packet_header, parse_packet_header, recv_exact, encode_hello, HEADER_SIZE, FLAG_HELLO,
+                   BUSY_REPLY)
+
+SERVER_BOOTSTRAP = (
+    "import sys, utils; "
+    "utils.PACKET_DROP_RATE = float(sys.argv[1]); utils.PACKET_CORRUPT_RATE = float(sys.argv[2]); "
+    "sys.argv = ['server.py'] + sys.argv[3:]; "
+    "import server; server.main()"
+)
+
+def run_client(port, data, results, index):
+    """Minimal protocol client: upload, then ACK every correct echoed chunk; retries after busy replies"""
+    start = time.perf_counter()
+    busy = 0
+    try:
+        while True:
+            sock = socket.create_connection((SERVER_HOST, port))
+            hello = encode_hello(size=len(data))  # Server defaults; the declared size ends the upload on its last byte
+            sock.sendall(create_packet_header(0, 0, length=len(hello), flags=FLAG_HELLO) + hello)
+            try:
+                sock.sendall(data)
+            except OSError:
+                pass  # Turned away mid-upload; the busy reply is already waiting
+            _, seq_num, _, length = parse_packet_header(recv_exact(sock, HEADER_SIZE))
+            payload = recv_exact(sock, length)
+            if seq_num != -6:
+                break
+            sock.close()
+            busy += 1
+            time.sleep(BUSY_REPLY.unpack(payload)[0] / 1000)
+        for _ in range(2):  # Checksum, then the chunk digest manifest
+            header = recv_exact(sock, HEADER_SIZE)
+            recv_exact(sock, parse_packet_header(header)[3])
+        received = 0
+        while True:
+            header = recv_exact(sock, HEADER_SIZE)
+            if not header:
+                break
+            client_id, seq_num, _, length = parse_packet_header(header)
+            if seq_num == -1:
+                break
+            original = data[seq_num * CHUNK_SIZE:(seq_num + 1) * CHUNK_SIZE]
+            chunk = recv_exact(sock, length)
+            ok = chunk == original
+            received += ok
+            sock.sendall(create_packet_header(client_id, seq_num, is_ack=ok, is_nack=not ok))
+        sock.close()
+        results[index] = (received, time.perf_counter() - start, busy)
+    except (OSError, ValueError):
+        results[index] = (-1, time.perf_counter() - start, busy)
+
+def wait_until_listening(server):
+    """Block until the server prints its listening line, then discard the rest of its output"""
+    for line in server.stdout:
+        if line.startswith(b"[*] Server listening"):
+            threading.Thread(target=server.stdout.read, daemon=True).start()
+            return
+    raise RuntimeError("server exited before it started listening")
+
+def peak_rss_kib(pid):
+    """High-water RSS of a running process (Linux only), or None"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def bench_engine(engine, port, data, clients, drop_rate, corrupt_rate, max_transfers):
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    server = subprocess.Popen(
+        [sys.executable, "-u", "-c", SERVER_BOOTSTRAP, str(drop_rate), str(corrupt_rate),
+         "--engine", engine, "--port", str(port), "--max-transfers", str(max_transfers)],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_listening(server)
+        results = [(-1, 0.0, 0)] * clients
+        threads = [threading.Thread(target=run_client, args=(port, data, results, i)) for i in range(clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        max_rss = peak_rss_kib(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    switches = (after.ru_nvcsw + after.ru_nivcsw) - (before.ru_nvcsw + before.ru_nivcsw)
+    failed = sum(1 for received, _, _ in results if received < 0)
+    latencies = sorted(latency for _, latency, _ in results)
+    p50, p99 = latencies[len(latencies) // 2], latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)]
+    busy = sum(count for _, _, count in results)
+    if max_rss is None:
+        max_rss = after.ru_maxrss  # Largest child so far, in KiB on Linux
+    return elapsed, max_rss, switches, failed, p50, p99, busy
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--file", default="test_files/client1.txt")
+    parser.add_argument("--port", type=int, default=19999)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--corrupt-rate", type=float, default=0.0)
+    parser.add_argument("--max-transfers", type=int, nargs="+", default=[MAX_TRANSFERS],
+                        help="server admission limits to compare")
+    args = parser.parse_args()
+
+    with open(args.file, "rb") as f:
+        data = f.read()
+
+    print(f"{args.clients} concurrent clients, {len(data)} bytes each")
+    offset = 0
+    for max_transfers in args.max_transfers:
+        for engine in ["threads", "asyncio"]:
+            elapsed, max_rss, switches, failed, p50, p99, busy = bench_engine(
+                engine, args.port + offset, data, args.clients, args.drop_rate, args.corrupt_rate, max_transfers)
+            offset += 1
+            print(f"{engine:>8} x{max_transfers:<5}: {elapsed:7.2f} s  peak RSS {max_rss / 1024:7.1f} MiB  "
+                  f"{switches:8d} context switches  latency p50 {p50:5.2f} s p99 {p99:5.2f} s  "
+                  f"{busy} busy replies  {failed} failed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Microbenchmark the binary header codec against the old padded ASCII one.
+
+    python bench_headers.py --count 100000
+"""
+import argparse
+import timeit
+from utils import create_packet_header, parse_packet_header, pack_headers, unpack_headers, FLAG_ACK
+
+def create_ascii_header(client_id, seq_num, is_ack=False, is_nack=False):
+    """The original 20-byte ASCII header, kept here for comparison"""
+    status = "ACK" if is_ack else "NACK" if is_nack else "DATA"
+    header = f"{client_id}:{seq_num:06d}:{status}|"
+    header = header.ljust(20)
+    return header.encode('ascii')
+
+def parse_ascii_header(header):
+    header_str = header.decode('ascii').strip().rstrip('|')
+    client_id, seq_num, status = header_str.split(':')
+    return int(client_id), int(seq_num), status
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=100000, help="headers per run")
+    parser.add_argument("--batch", type=int, default=64, help="headers per batch call")
+    args = parser.parse_args()
+
+    seqs = range(args.count)
+    ascii_headers = [create_ascii_header(3, seq, is_ack=True) for seq in seqs]
+    binary_headers = [create_packet_header(3, seq, is_ack=True) for seq in seqs]
+    rows = [(3, seq, FLAG_ACK, 0) for seq in seqs]
+    batches = [rows[i:i + args.batch] for i in range(0, len(rows), args.batch)]
+    packed_batches = [pack_headers(batch) for batch in batches]
+
+    cases = [
+        ("ascii pack", lambda: [create_ascii_header(3, seq, is_ack=True) for seq in seqs]),
+        ("binary pack", lambda: [create_packet_header(3, seq, is_ack=True) for seq in seqs]),
+        (f"batch pack x{args.batch}", lambda: [pack_headers(batch) for batch in batches]),
+        ("ascii parse", lambda: [parse_ascii_header(h) for h in ascii_headers]),
+        ("binary parse", lambda: [parse_packet_header(h) for h in binary_headers]),
+        (f"batch parse x{args.batch}", lambda: [unpack_headers(b) for b in packed_batches]),
+    ]
+    print(f"{args.count} headers per run; ascii header 20 bytes, binary header {len(binary_headers[0])} bytes")
+    for name, func in cases:
+        best = min(timeit.repeat(func, number=1, repeat=5))
+        print(f"{name:>16}: {best * 1e9 / args.count:7.1f} ns/header")
+
+if __name__ == "__main__":
+    main()
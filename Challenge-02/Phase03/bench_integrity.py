@@ -0,0 +1,38 @@
+"""Microbenchmark per-chunk verification cost of each integrity algorithm.
+
+    python bench_integrity.py --sizes 256 1024 4096 16384 65536
+"""
+import argparse
+import os
+import timeit
+from utils import calculate_checksum, chunk_digest, digest_size
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 1024, 4096, 16384, 65536],
+                        help="chunk sizes in bytes")
+    parser.add_argument("--total", type=int, default=8 * 1024 * 1024, help="bytes hashed per run")
+    args = parser.parse_args()
+
+    cases = [
+        ("sha256 hex (old)", lambda chunk: calculate_checksum(chunk).encode(), 64),
+        ("sha256", lambda chunk: chunk_digest(chunk, "sha256"), digest_size("sha256")),
+        ("blake2b-32", lambda chunk: chunk_digest(chunk, "blake2b", 32), 32),
+        ("blake2b-16", lambda chunk: chunk_digest(chunk, "blake2b", 16), 16),
+        ("crc32", lambda chunk: chunk_digest(chunk, "crc32"), digest_size("crc32")),
+    ]
+    print(f"{'algorithm':>16} {'chunk':>6} {'ns/chunk':>10} {'MB/s':>8} {'overhead':>9}")
+    for size in args.sizes:
+        count = max(1, args.total // size)
+        chunk = os.urandom(size)
+        expected = {name: digest(chunk) for name, digest, _ in cases}
+        for name, digest, wire_size in cases:
+            # Verification is one digest and one comparison against the expected value
+            run = lambda: [digest(chunk) == expected[name] for _ in range(count)]
+            best = min(timeit.repeat(run, number=1, repeat=5))
+            print(f"{name:>16} {size:>6} {best * 1e9 / count:>10.1f} "
+                  f"{size * count / best / 1e6:>8.0f} {wire_size / size:>8.1%}")
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import time
+from config import WINDOW_SIZE, ADAPTIVE_SHRINK_LOSS, ADAPTIVE_GROW_LOSS
+
+class ChunkSizer:
+    """Adaptive packet size: how many chunks the next data packet should carry.
+
+    Starts at one chunk and re-decides once per epoch (a window's worth of
+    ACKs). If too many packets were NACKed or timed out, the size halves,
+    because every lost packet costs a full retransmission. After a clean
+    epoch it doubles, unless the previous doubling lowered goodput, in which
+    case it steps back instead.
+    """
+
+    def __init__(self, max_chunks, epoch=WINDOW_SIZE):
+        self.max_chunks = max(1, max_chunks)
+        self.chunks = 1
+        self.epoch = epoch
+        self.acks = 0
+        self.losses = 0
+        self.acked_bytes = 0
+        self.epoch_start = time.monotonic()
+        self.last_goodput = None
+        self.grew = False
+
+    def on_ack(self, num_bytes, now=None):
+        self.acks += 1
+        self.acked_bytes += num_bytes
+        if self.acks >= self.epoch:
+            self.adjust(time.monotonic() if now is None else now)
+
+    def on_loss(self):
+        self.losses += 1
+
+    def adjust(self, now):
+        goodput = self.acked_bytes / max(now - self.epoch_start, 1e-6)
+        loss_rate = self.losses / (self.acks + self.losses)
+        previous = self.chunks
+        if loss_rate > ADAPTIVE_SHRINK_LOSS:
+            self.chunks = max(1, self.chunks // 2)
+        elif self.grew and goodput < self.last_goodput:
+            self.chunks = max(1, self.chunks // 2)  # The last step up did not pay off
+        elif loss_rate < ADAPTIVE_GROW_LOSS:
+            self.chunks = min(self.max_chunks, self.chunks * 2)
+        self.grew = self.chunks > previous
+        self.last_goodput = goodput
+        self.acks = self.losses = self.acked_bytes = 0
+        self.epoch_start = now
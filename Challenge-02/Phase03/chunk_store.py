@@ -0,0 +1,146 @@
+import bisect
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from config import STORE_MEMORY_BYTES, STORE_RETAIN_BYTES
+from utils import store_key
+
+class ChunkStore:
+    """Content-addressed chunk storage shared by every connection.
+
+    Chunks are keyed by a collision-resistant digest of their bytes (see
+    store_key()), so identical chunks uploaded by any number of clients
+    are held once. Each session references the chunks of its upload and
+    releases them when it closes. A chunk nobody references is kept, least
+    recently released first out, while such chunks fit in retain_bytes, so
+    a later upload of the same data can still skip it. All methods are
+    safe to call from several engine threads.
+
+    Only memory_bytes of chunk data are held in RAM; past that, chunks
+    spill to a temporary file, like the Phase02 upload spool. Space freed
+    by evicted chunks is merged with free neighbours and reused best fit,
+    whatever the chunk sizes; a free tail is cut off the file, so it only
+    stays as large as the chunks still spilled (plus fragmentation).
+    """
+
+    def __init__(self, retain_bytes=STORE_RETAIN_BYTES, memory_bytes=STORE_MEMORY_BYTES):
+        self.retain_bytes = retain_bytes
+        self.memory_bytes = memory_bytes
+        self.chunks = {}  # Key -> [chunk bytes or None if spilled, spill offset, length, reference count]
+        self.idle = OrderedDict()  # Keys of unreferenced chunks, oldest release first
+        self.idle_bytes = 0
+        self.lock = threading.Lock()
+        self.stored_bytes = 0  # Bytes actually held, in memory or spilled
+        self.referenced_bytes = 0  # Bytes the live uploads add up to
+        self.resident_bytes = 0  # Bytes held in memory
+        self.spill = None  # Temporary file, created on the first spilled chunk
+        self.spill_end = 0  # Spill file length
+        self.free_by_size = []  # (length, offset) of every free extent below spill_end, sorted
+        self.free_at = {}  # Free extents: start offset -> length
+        self.free_until = {}  # Free extents: end offset -> start offset
+
+    def put(self, data):
+        """Store data (or take another reference to an identical chunk); returns its key"""
+        key = store_key(data)
+        with self.lock:
+            if not self._reference(key):
+                self.chunks[key] = self._hold(data) + [len(data), 1]
+                self.stored_bytes += len(data)
+            self.referenced_bytes += len(data)
+        return key
+
+    def _hold(self, data):
+        if self.resident_bytes + len(data) <= self.memory_bytes:
+            self.resident_bytes += len(data)
+            return [bytes(data), 0]
+        if self.spill is None:
+            self.spill = tempfile.TemporaryFile()
+        offset = self._allocate(len(data))
+        os.pwrite(self.spill.fileno(), data, offset)
+        return [None, offset]
+
+    def _allocate(self, length):
+        """Offset of length bytes in the spill file: the smallest free extent that fits, else the end"""
+        index = bisect.bisect_left(self.free_by_size, (length, -1))
+        if index == len(self.free_by_size):
+            offset = self.spill_end
+            self.spill_end += length
+            return offset
+        size, offset = self.free_by_size[index]
+        self._unlink(offset, size)
+        if size > length:
+            self._link(offset + length, size - length)
+        return offset
+
+    def _free(self, offset, length):
+        """Return a spilled chunk's extent, merged with the free extents on either side"""
+        start = self.free_until.get(offset)
+        if start is not None:
+            size = self.free_at[start]
+            self._unlink(start, size)
+            offset, length = start, length + size
+        size = self.free_at.get(offset + length)
+        if size is not None:
+            self._unlink(offset + length, size)
+            length += size
+        if offset + length == self.spill_end:
+            self.spill_end = offset
+            os.ftruncate(self.spill.fileno(), offset)
+        else:
+            self._link(offset, length)
+
+    def _link(self, offset, length):
+        bisect.insort(self.free_by_size, (length, offset))
+        self.free_at[offset] = length
+        self.free_until[offset + length] = offset
+
+    def _unlink(self, offset, length):
+        del self.free_by_size[bisect.bisect_left(self.free_by_size, (length, offset))]
+        del self.free_at[offset]
+        del self.free_until[offset + length]
+
+    def acquire(self, key):
+        """Take a reference to key if it is stored; returns False if it is not"""
+        with self.lock:
+            if not self._reference(key):
+                return False
+            self.referenced_bytes += self.chunks[key][2]
+            return True
+
+    def _reference(self, key):
+        entry = self.chunks.get(key)
+        if entry is None:
+            return False
+        if not entry[3]:
+            del self.idle[key]
+            self.idle_bytes -= entry[2]
+        entry[3] += 1
+        return True
+
+    def get(self, key):
+        """Bytes of a chunk the caller holds a reference to"""
+        data, offset, length, _ = self.chunks[key]
+        if data is not None:
+            return data
+        return os.pread(self.spill.fileno(), length, offset)
+
+    def release(self, key):
+        with self.lock:
+            entry = self.chunks[key]
+            entry[3] -= 1
+            self.referenced_bytes -= entry[2]
+            if not entry[3]:
+                self.idle[key] = None
+                self.idle_bytes += entry[2]
+                while self.idle_bytes > self.retain_bytes:
+                    oldest, _ = self.idle.popitem(last=False)
+                    data, offset, length, _ = self.chunks.pop(oldest)
+                    self.idle_bytes -= length
+                    self.stored_bytes -= length
+                    if data is not None:
+                        self.resident_bytes -= length
+                    else:
+                        self._free(offset, length)
+
+SHARED_STORE = ChunkStore()
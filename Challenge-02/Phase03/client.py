@@ -1,35 +1,125 @@
+import argparse
+import bisect
+import os
+import select
 import socket
-import sys
+import threading
 import time
-from config import SERVER_HOST, SERVER_PORT, CHUNK_SIZE, ACK_TIMEOUT
-from utils import calculate_checksum, create_packet_header, parse_packet_header
+from config import (SERVER_HOST, SERVER_PORT, CHUNK_SIZE, ACK_TIMEOUT, WINDOW_SIZE, CHUNK_ALGORITHM,
+                    FILE_ALGORITHM, BLAKE2B_DIGEST_SIZE, MAX_PACKET_SIZE, COMPRESSION, ACK_EVERY, ACK_DELAY,
+                    BUSY_RETRIES, DEDUP_DIGEST_SIZE)
+from framing import FrameReader
+from utils import (create_packet_header, parse_packet_header, new_checksum, chunk_digest, digest_size,
+                   encode_hello, parse_hello, decompress_packet, store_key, clamp_chunk_size, has_bit, seq_runs,
+                   encode_sack, HEADER_SIZE, BUSY_REPLY, FLAG_HELLO, FLAG_COMPRESSED, FLAG_HAVE, FLAG_SACK,
+                   INTEGRITY_ALGORITHMS, COMPRESSION_CODECS)
+from resume import PartialDownload, load_resume_state, resume_options
 
-def send_ack_nack(conn, client_id, seq_num, is_ack=True):
+class ServerBusy(Exception):
+    """The server turned the connection away; retry_after is in milliseconds"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"server busy, retry after {retry_after} ms")
+        self.retry_after = retry_after
+
+def check_busy(reader, seq_num, length):
+    """Raise ServerBusy if a reply header is the server's busy reply"""
+    if seq_num != -6:  # -6 is our special busy reply sequence number
+        return
+    payload = reader.read(length)
+    if payload is None or len(payload) != BUSY_REPLY.size:
+        raise ConnectionError("Busy reply truncated")
+    raise ServerBusy(BUSY_REPLY.unpack(payload)[0])
+
+def send_frame(conn, frame, lock=None):
+    """Send a response frame; lock serializes it with a concurrent stream upload"""
+    if lock is None:
+        conn.sendall(frame)
+        return
+    with lock:
+        conn.sendall(frame)
+
+def send_ack_nack(conn, client_id, seq_num, is_ack=True, lock=None):
     """Send ACK or NACK for a packet"""
-    header = create_packet_header(client_id, seq_num, is_ack=is_ack, is_nack=not is_ack)
-    conn.sendall(header)
+    send_frame(conn, create_packet_header(client_id, seq_num, is_ack=is_ack, is_nack=not is_ack), lock)
+
+def receive_hello_reply(reader):
+    """Receive the options the server settled on (chunk size, adaptive mode)"""
+    # The server replies once the upload is over (right away in stream mode), or after ACK_TIMEOUT of
+    # silence from a client that did not declare its size
+    for attempt in range(3):
+        try:
+            header = reader.read(HEADER_SIZE)
+            break
+        except socket.timeout:
+            print(f"[!] Timeout waiting for hello reply (attempt {attempt + 1}/3)")
+    else:
+        raise socket.timeout("No hello reply received")
+    if header is None:
+        raise ConnectionError("No hello reply received")
+    _, seq_num, _, length = parse_packet_header(header)
+    check_busy(reader, seq_num, length)
+    if seq_num != -4:  # -4 is our special hello reply sequence number
+        raise ValueError("Invalid header for hello reply")
+    reply = reader.read(length)
+    if reply is None:
+        raise ConnectionError("Hello reply truncated")
+    return parse_hello(reply)
+
+def upload_dedup(client, reader, data, chunk_size):
+    """Ask which chunks the server already stores, then upload only the others"""
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+    query = b"".join(store_key(chunk) for chunk in chunks)
+    client.sendall(create_packet_header(0, 0, length=len(query), flags=FLAG_HAVE) + query)
+    header = reader.read(HEADER_SIZE)
+    if header is None:
+        raise ConnectionError("No have reply received")
+    _, seq_num, _, length = parse_packet_header(header)
+    check_busy(reader, seq_num, length)
+    if seq_num != -5:  # -5 is our special have reply sequence number
+        raise ValueError("Invalid header for have reply")
+    have = reader.read(length)
+    if have is None:
+        raise ConnectionError("Have reply truncated")
+    missing = [chunk for seq, chunk in enumerate(chunks) if not has_bit(have, seq)]
+    print(f"[+] Server already has {len(chunks) - len(missing)} of {len(chunks)} chunks; "
+          f"uploading {sum(len(chunk) for chunk in missing)} bytes")
+    for chunk in missing:
+        client.sendall(chunk)
+
+def upload_stream(client, data, lock):
+    """Stream mode: send the file as data packets (sequence number = byte offset) while the echo runs"""
+    try:
+        for offset in range(0, len(data), MAX_PACKET_SIZE):
+            frame = data[offset:offset + MAX_PACKET_SIZE]
+            with lock:  # ACKs from the receive loop go out between frames, never inside one
+                client.sendall(create_packet_header(0, offset, length=len(frame)) + frame)
+    except OSError as e:
+        if client.fileno() != -1:  # Not just the main thread closing the connection (e.g. after a busy reply)
+            print(f"[!] Error sending file: {e}")
 
-def receive_checksum(conn, client_id):
+def receive_checksum(reader, client_id):
     """Receive checksum with retry logic"""
     retries = 0
     while retries < 3:  # Try 3 times to receive checksum
         try:
             print("[+] Waiting for checksum...")
             # First receive the header
-            header = conn.recv(20)
-            if not header:
+            header = reader.read(HEADER_SIZE)
+            if header is None:
                 raise socket.timeout("No header received")
 
-            _, seq_num, status = parse_packet_header(header)
+            _, seq_num, _, length = parse_packet_header(header)
             if seq_num != -2:  # -2 is our special checksum sequence number
                 raise ValueError("Invalid header for checksum")
 
             # Then receive the checksum
-            checksum = conn.recv(64).decode()
-            if not checksum:
+            checksum = reader.read(length)
+            if checksum is None:
                 raise socket.timeout("No checksum received")
 
-            print(f"[+] Received Checksum: {checksum}")
+            checksum = bytes(checksum)
+            print(f"[+] Received Checksum: {checksum.hex()}")
             return checksum
 
         except socket.timeout:
@@ -45,22 +135,71 @@ def receive_checksum(conn, client_id):
                 raise
             time.sleep(0.1)
 
+def receive_manifest(reader):
+    """Receive the table of per-chunk digests the server sends ahead of the data"""
+    header = reader.read(HEADER_SIZE)
+    if header is None:
+        raise ConnectionError("No manifest received")
+    _, seq_num, _, length = parse_packet_header(header)
+    if seq_num != -3:  # -3 is our special manifest sequence number
+        raise ValueError("Invalid header for manifest")
+    manifest = reader.read(length)
+    if manifest is None:
+        raise ConnectionError("Manifest truncated")
+    return bytes(manifest)
+
 def main():
+    parser = argparse.ArgumentParser(description="Upload a file and verify the server's echo")
+    parser.add_argument("file_path", nargs="?", default="test_files/client1.txt")
+    parser.add_argument("--chunk-algo", choices=INTEGRITY_ALGORITHMS, default=CHUNK_ALGORITHM,
+                        help="digest used to verify each echoed chunk")
+    parser.add_argument("--file-algo", choices=INTEGRITY_ALGORITHMS, default=FILE_ALGORITHM,
+                        help="digest used to verify the whole file")
+    parser.add_argument("--blake2b-size", type=int, default=BLAKE2B_DIGEST_SIZE,
+                        help="BLAKE2b digest size in bytes (1-64)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                        help="requested chunk size in bytes; the server may clamp it")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="let the server grow or shrink packets with the observed loss rate")
+    parser.add_argument("--compress", choices=COMPRESSION_CODECS, default=COMPRESSION,
+                        help="ask the server to compress echoed packets that shrink")
+    parser.add_argument("--dedup", action="store_true",
+                        help="skip uploading chunks the server already stores")
+    parser.add_argument("--stream", action="store_true",
+                        help="receive the echo while the upload is still in flight")
+    parser.add_argument("--sack", action="store_true",
+                        help="acknowledge packets in batches with cumulative + selective ACK frames")
+    parser.add_argument("--output", help="where to write the echoed file (default: received_<name>)")
+    args = parser.parse_args()
+    if args.stream and args.dedup:
+        parser.error("--stream and --dedup cannot be combined")
+    if args.dedup and digest_size(args.file_algo, args.blake2b_size) < DEDUP_DIGEST_SIZE:
+        parser.error(f"--dedup needs a --file-algo digest of at least {DEDUP_DIGEST_SIZE} bytes")
+    output_path = args.output or "received_" + os.path.basename(args.file_path)
+
+    for attempt in range(BUSY_RETRIES + 1):
+        retry_after = transfer(args, output_path)
+        if retry_after is None:
+            return
+        if attempt == BUSY_RETRIES:
+            print(f"[!] Server still busy after {BUSY_RETRIES} retries. Giving up.")
+            return
+        print(f"[*] Retrying in {retry_after} ms (retry {attempt + 1}/{BUSY_RETRIES})")
+        time.sleep(retry_after / 1000)
+
+def transfer(args, output_path):
+    """Upload the file over one connection and verify the echo; returns the retry delay in ms if the server was busy"""
     try:
         client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         client.settimeout(ACK_TIMEOUT)  # Set default timeout
+        client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # ACK frames must not wait behind Nagle
         client.connect((SERVER_HOST, SERVER_PORT))
         print(f"[+] Connected to server at {SERVER_HOST}:{SERVER_PORT}")
 
-        # Send file to server
-        file_path = sys.argv[1] if len(sys.argv) > 1 else "test_files/client1.txt"
+        file_path = args.file_path
         try:
             with open(file_path, "rb") as f:
                 data = f.read()
-                print(f"[+] Sending file: {file_path} ({len(data)} bytes)")
-                for i in range(0, len(data), CHUNK_SIZE):
-                    client.sendall(data[i:i+CHUNK_SIZE])
-                print("[+] File sent successfully")
         except FileNotFoundError:
             print(f"[!] Error: File {file_path} not found")
             return
@@ -68,9 +207,76 @@ def main():
             print(f"[!] Error reading file: {e}")
             return
 
-        # Receive checksum
+        # Announce the integrity algorithms, chunk size and file size (and what an interrupted run
+        # still lacks), then send the file. The declared size lets the server start the echo on the
+        # last byte instead of waiting for ACK_TIMEOUT of silence.
+        options = {"chunk": args.chunk_algo, "file": args.file_algo, "blake2b_size": args.blake2b_size,
+                   "chunk_size": args.chunk_size, "adaptive": int(args.adaptive), "compression": args.compress,
+                   "size": len(data), "sack": int(args.sack)}
+        if args.dedup:
+            # The server echoes chunks it already had only if the assembled file matches this digest
+            file_hasher = new_checksum(args.file_algo, args.blake2b_size)
+            file_hasher.update(data)
+            options.update(dedup=1, digest=file_hasher.digest().hex())
+        if args.stream:
+            # The client knows what the echo must be, so it builds the checksum and manifest itself
+            chunk_size = clamp_chunk_size(args.chunk_size)
+            file_hasher = new_checksum(args.file_algo, args.blake2b_size)
+            file_hasher.update(data)
+            local_checksum = file_hasher.digest()
+            local_manifest = b"".join(chunk_digest(data[i:i + chunk_size], args.chunk_algo, args.blake2b_size)
+                                      for i in range(0, len(data), chunk_size))
+            options.update(stream=1, digest=local_checksum.hex())
+        state = load_resume_state(output_path)
+        if state is not None:
+            options.update(resume_options(state))
+        hello = encode_hello(**options)
+        client.sendall(create_packet_header(0, 0, length=len(hello), flags=FLAG_HELLO) + hello)
+
+        # Every read from here on goes through one reusable receive buffer
+        reader = FrameReader(client)
+
+        print(f"[+] Sending file: {file_path} ({len(data)} bytes)")
+        send_lock = None
+        try:
+            if args.stream:
+                send_lock = threading.Lock()
+                threading.Thread(target=upload_stream, args=(client, data, send_lock), daemon=True).start()
+            elif args.dedup:
+                # Chunks are cut at the size the server will use, so their keys match its store
+                upload_dedup(client, reader, data, clamp_chunk_size(options["chunk_size"]))
+            else:
+                for i in range(0, len(data), CHUNK_SIZE):
+                    client.sendall(data[i:i+CHUNK_SIZE])
+        except ServerBusy:
+            raise
+        except Exception as e:
+            if isinstance(e, OSError):
+                # A server too busy to take the upload sends a busy reply and closes; it may be waiting here
+                try:
+                    receive_hello_reply(reader)
+                except ServerBusy:
+                    raise
+                except Exception:
+                    pass
+            print(f"[!] Error sending file: {e}")
+            return
+        if not args.stream:
+            print("[+] File sent successfully")
+
+        # Receive the negotiated options, the checksum and the per-chunk digest manifest
         try:
-            checksum = receive_checksum(client, 0)  # client_id is 0 for now
+            reply = receive_hello_reply(reader)
+            chunk_size = reply["chunk_size"]
+            print(f"[+] Chunk size {chunk_size} bytes{' (adaptive packets)' if reply['adaptive'] else ''}, "
+                  f"compression {reply['compression']}")
+            if args.stream:
+                checksum, manifest = local_checksum, local_manifest  # The server's checksum arrives mid-echo
+            else:
+                checksum = receive_checksum(reader, 0)  # client_id is 0 for now
+                manifest = receive_manifest(reader)
+        except ServerBusy:
+            raise
         except Exception as e:
             print(f"[!] Failed to receive checksum: {e}")
             return
@@ -78,51 +284,152 @@ def main():
         # Reset timeout for receiving data
         client.settimeout(None)  # No timeout for receiving data
 
-        # Receive data with headers and send ACK/NACK
+        # Receive data with headers and send ACK/NACK. Verified chunks go
+        # straight to the output file. Packets may arrive out of order within
+        # the sender's window, so they are also kept until the window base can
+        # slide past them; in-order data is folded into the whole-file hash
+        # right away, so no second pass is needed at the end.
+        chunk_digest_size = digest_size(args.chunk_algo, args.blake2b_size)
+        total_chunks = len(manifest) // chunk_digest_size
+        download = PartialDownload(output_path, chunk_size, total_chunks, checksum, state)
+        if download.resumed:
+            print(f"[+] Resuming: {download.received()} of {total_chunks} chunks already on disk")
+        # The server's window runs over the chunks we lack, in order. In adaptive
+        # mode a packet is a run of up to packet_chunks consecutive chunks.
+        wanted = download.missing()
+        packet_chunks = MAX_PACKET_SIZE // chunk_size if reply["adaptive"] else 1
         received_chunks = {}
-        expected_seq = 0
+        expected_seq = 0  # Receive window base: lowest sequence number not yet received
+        file_hasher = new_checksum(args.file_algo, args.blake2b_size)
+        received_bytes = 0
+        wire_bytes = 0  # Headers and payloads of data packets, as they arrived
         start_time = time.time()
-        
-        while True:
+
+        def slide_window():
+            nonlocal expected_seq, received_bytes
+            while expected_seq < total_chunks and download.has(expected_seq):
+                in_order = received_chunks.pop(expected_seq, None)
+                if in_order is None:
+                    in_order = download.read_chunk(expected_seq)  # Kept from an earlier run
+                file_hasher.update(in_order)
+                received_bytes += len(in_order)
+                expected_seq += 1
+
+        # SACK mode: one acknowledgement frame per ACK_EVERY packets, or after ACK_DELAY, whichever is first
+        sack = reply["sack"]
+        pending_acks = 0
+        ack_due = None
+        last_arrival = 0.0  # When the newest packet being acknowledged arrived
+        nacks = []
+
+        def send_acks():
+            nonlocal pending_acks, ack_due
+            ranges = [(first, last + 1) for first, last in seq_runs(sorted(received_chunks))]
+            payload = encode_sack(ranges, nacks, time.monotonic() - last_arrival)
+            send_frame(client, create_packet_header(0, expected_seq, is_ack=True, length=len(payload),
+                                                    flags=FLAG_SACK) + payload, send_lock)
+            pending_acks = 0
+            ack_due = None
+            nacks.clear()
+
+        def respond(client_id, seq_num, is_ack):
+            """ACK or NACK a packet, or fold it into the next acknowledgement frame"""
+            nonlocal pending_acks, ack_due, last_arrival
+            if not sack:
+                send_ack_nack(client, client_id, seq_num, is_ack=is_ack, lock=send_lock)
+                return
+            last_arrival = time.monotonic()
+            if not is_ack:
+                nacks.append(seq_num)
+            pending_acks += 1
+            if ack_due is None:
+                ack_due = time.monotonic() + ACK_DELAY
+            if not is_ack or pending_acks >= ACK_EVERY:
+                send_acks()  # A NACK goes out at once, so the retransmission is not delayed
+
+        slide_window()
+        # Read through the end marker even once every chunk is in: closing with it unread
+        # would reset the connection while the server is still winding down
+        end_received = False
+        while not end_received:
             try:
+                if ack_due is not None:
+                    # Flush held acknowledgements once they are due; until then, wait only for the next packet
+                    wait = ack_due - time.monotonic()
+                    if wait <= 0 or (reader.buffered() < HEADER_SIZE
+                                     and not select.select([client], [], [], wait)[0]):
+                        send_acks()
                 # Receive header
                 print(f"[+] Waiting for packet {expected_seq}...")
-                header = client.recv(20)
-                if not header:
+                header = reader.read(HEADER_SIZE)
+                if header is None:
                     print("[+] Server closed connection")
                     break
 
-                client_id, seq_num, status = parse_packet_header(header)
+                client_id, seq_num, flags, chunk_len = parse_packet_header(header)
                 
                 # Check for end of transmission
                 if seq_num == -1:
                     print("[+] End of transmission received")
+                    end_received = True
                     break
+                if seq_num == -2:
+                    # Stream mode: the server's checksum of the upload, sent once its last byte arrived
+                    server_checksum = reader.read(chunk_len)
+                    if server_checksum is None:
+                        print("[!] Checksum truncated")
+                        break
+                    print(f"[+] Received Checksum: {bytes(server_checksum).hex()}")
+                    if server_checksum != checksum:
+                        print("[!] Server received a different file than was sent")
+                        break
+                    continue
 
                 print(f"[+] Received header for packet {seq_num}")
                 
                 # Receive chunk
-                chunk = client.recv(CHUNK_SIZE)
-                if not chunk:
+                chunk = reader.read(chunk_len)
+                if chunk is None:
                     print("[!] Missing chunk after header.")
                     break
+                wire_bytes += HEADER_SIZE + chunk_len
+
+                if flags & FLAG_COMPRESSED:
+                    try:
+                        chunk = decompress_packet(chunk, reply["compression"], packet_chunks * chunk_size)
+                    except ValueError as e:
+                        print(f"[!] Packet {seq_num} corrupted ({e})")
+                        respond(client_id, seq_num, is_ack=False)
+                        continue
+
+                count = (len(chunk) + chunk_size - 1) // chunk_size
+                if not (0 <= seq_num and seq_num + count <= total_chunks and 1 <= count <= packet_chunks):
+                    print(f"[!] Packet {seq_num} out of range, dropping")
+                    continue
+                if download.has(seq_num):
+                    # Duplicate of a packet we already hold; our ACK was late, repeat it
+                    respond(client_id, seq_num, is_ack=True)
+                    continue
+                window_chunks = WINDOW_SIZE * packet_chunks
+                if bisect.bisect_left(wanted, seq_num) >= bisect.bisect_left(wanted, expected_seq) + window_chunks:
+                    print(f"[!] Packet {seq_num} outside receive window, dropping")
+                    continue
 
-                # Verify chunk integrity
-                chunk_checksum = calculate_checksum(chunk)
-                original_checksum = calculate_checksum(data[seq_num * CHUNK_SIZE:(seq_num + 1) * CHUNK_SIZE])
+                # Verify chunk integrity: one hash and a manifest lookup per chunk in the packet
+                pieces = [chunk[i * chunk_size:(i + 1) * chunk_size] for i in range(count)]
                 
-                if chunk_checksum == original_checksum:
+                if all(chunk_digest(piece, args.chunk_algo, args.blake2b_size)
+                       == manifest[(seq_num + i) * chunk_digest_size:(seq_num + i + 1) * chunk_digest_size]
+                       for i, piece in enumerate(pieces)):
                     print(f"[+] Packet {seq_num} received correctly")
-                    received_chunks[seq_num] = chunk
-                    send_ack_nack(client, client_id, seq_num, is_ack=True)
+                    for i, piece in enumerate(pieces):
+                        download.write(seq_num + i, piece)
+                        received_chunks[seq_num + i] = bytes(piece)  # The frame is reused by the next read
+                    respond(client_id, seq_num, is_ack=True)
+                    slide_window()
                 else:
                     print(f"[!] Packet {seq_num} corrupted")
-                    send_ack_nack(client, client_id, seq_num, is_ack=False)
-
-                # Check if we've received all chunks
-                if len(received_chunks) == (len(data) + CHUNK_SIZE - 1) // CHUNK_SIZE:
-                    print("[+] All packets received")
-                    break
+                    respond(client_id, seq_num, is_ack=False)
 
             except socket.timeout:
                 print(f"[!] Timeout waiting for packet {expected_seq}")
@@ -134,13 +441,30 @@ def main():
                 print(f"[!] Error during transfer: {e}")
                 break
 
-        # Reassemble in order
-        received_data = b''.join(received_chunks[i] for i in sorted(received_chunks))
-        print(f"[+] Reassembled {len(received_data)} bytes")
+        if ack_due is not None:
+            try:
+                send_acks()  # The server finishes once it hears about the last packets
+            except OSError:
+                pass
+        if expected_seq < total_chunks:
+            download.close()
+            print(f"[!] Transfer interrupted with {len(download.missing())} chunks missing. Run again to resume.")
+            return
+        print("[+] All packets received")
+        print(f"[+] Reassembled {received_bytes} bytes")
+        print(f"[+] {wire_bytes} bytes of data packets on the wire")
 
-        new_checksum = calculate_checksum(received_data)
-        print("[+] File verification:", "Successful" if new_checksum == checksum else "Failed")
+        received_checksum = file_hasher.digest()
+        print("[+] File verification:", "Successful" if received_checksum == checksum else "Failed")
+        if received_checksum == checksum:
+            download.finish()
+            print(f"[+] Saved to {output_path}")
+        else:
+            download.discard()
 
+    except ServerBusy as e:
+        print(f"[!] Server busy, retry after {e.retry_after} ms")
+        return e.retry_after
     except ConnectionRefusedError:
         print(f"[!] Could not connect to server at {SERVER_HOST}:{SERVER_PORT}")
     except Exception as e:
@@ -0,0 +1,56 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import COMPRESSION_WORKERS
+from utils import compress_packet
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    """Worker pool shared by every session, started on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(COMPRESSION_WORKERS, thread_name_prefix="compress")
+        return _pool
+
+class PacketCompressor:
+    """Compresses a session's data packets on the shared worker pool.
+
+    The session hands over packets it expects to send soon with prefetch(),
+    so by the time a packet goes out its payload is usually ready. The
+    session never waits on a job: it checks job().done() before sending a
+    new packet and otherwise holds off until the future completes. Payloads
+    are kept until release(), so a retransmission is never compressed
+    twice. Entries are keyed by first chunk: a prefetch made for a
+    different packet size is simply redone.
+    """
+
+    def __init__(self, codec):
+        self.codec = codec
+        self.jobs = {}  # First chunk -> (chunk count, future of (payload, flags))
+
+    def has(self, first, count):
+        job = self.jobs.get(first)
+        return job is not None and job[0] == count
+
+    def prefetch(self, first, count, data):
+        self.jobs[first] = (count, _get_pool().submit(compress_packet, data, self.codec))
+
+    def job(self, first, count, read):
+        """Future of the packet's (payload, flags); read() supplies its bytes if no job exists yet"""
+        if not self.has(first, count):
+            self.prefetch(first, count, read())
+        return self.jobs[first][1]
+
+    def payload(self, first):
+        """(payload, flags) of a packet whose job is done"""
+        return self.jobs[first][1].result()
+
+    def release(self, first):
+        self.jobs.pop(first, None)
+
+    def clear(self):
+        for _, future in self.jobs.values():
+            future.cancel()
+        self.jobs.clear()
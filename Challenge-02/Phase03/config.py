@@ -3,5 +3,34 @@ SERVER_PORT = 9999
 CHUNK_SIZE = 1024
 PACKET_DROP_RATE = 0.1  # 10% chance of packet drop
 PACKET_CORRUPT_RATE = 0.05  # 5% chance of packet corruption
-ACK_TIMEOUT = 2.0  # Timeout in seconds for waiting for ACK/NACK
-MAX_RETRIES = 3  # Maximum number of retransmission attempts 
\ No newline at end of file
+ACK_TIMEOUT = 2.0  # Timeout in seconds for waiting for data, and the ACK timeout before any RTT is measured
+MAX_RETRIES = 3  # Maximum number of retransmission attempts
+WINDOW_SIZE = 8  # Maximum number of unacknowledged packets in flight
+LISTEN_BACKLOG = 128  # Pending connections the kernel queues before accept()
+SERVER_ENGINE = "threads"  # "threads" or "asyncio"; override with --engine
+CHUNK_ALGORITHM = "crc32"  # Per-chunk digest: "crc32", "blake2b" or "sha256"
+FILE_ALGORITHM = "sha256"  # Whole-file digest: "crc32", "blake2b" or "sha256"
+BLAKE2B_DIGEST_SIZE = 16  # Bytes per BLAKE2b digest (1-64)
+MIN_CHUNK_SIZE = 256  # Smallest chunk size a client may negotiate
+MAX_PACKET_SIZE = 64 * 1024  # Largest chunk size, and largest data packet in adaptive mode
+ADAPTIVE_SHRINK_LOSS = 0.3  # Adaptive mode: halve the packet size when more packets than this are lost
+ADAPTIVE_GROW_LOSS = 0.2  # Adaptive mode: double it when fewer than this are lost
+MIN_RTO = 0.02  # Lower bound in seconds for the RTT-based retransmission timeout
+MAX_RTO = 8.0  # Upper bound in seconds, reached by doubling after repeated timeouts
+PACING_GAIN = 1.25  # Pace data packets at this multiple of the best recent goodput
+PACING_HISTORY = 8  # Goodput samples (one per round trip) the pacing rate is taken from
+PACING_SLACK = 0.002  # Seconds of sending a late timer wake-up may catch up on (asyncio timers fire to the ms)
+COMPRESSION = "none"  # Per-packet compression of the echo: "none", "zlib", "lzma" or "bz2"; override with --compress
+COMPRESSION_WORKERS = 4  # Threads compressing packets ahead of the send loop (all three codecs release the GIL)
+COMPRESSION_LOOKAHEAD = 16  # Packets compressed ahead of the one being sent
+STORE_RETAIN_BYTES = 16 * 1024 * 1024  # Chunks no upload references are kept up to this many bytes, for later dedup
+DEDUP = False  # Answer dedup queries from the chunk store (reveals what other clients uploaded); enable with --dedup
+DEDUP_DIGEST_SIZE = 16  # Shortest whole-file digest, in bytes, a dedup upload must announce
+STORE_MEMORY_BYTES = 8 * 1024 * 1024  # Chunk data held in memory; the rest spills to a temp file
+ACK_EVERY = 4  # SACK mode: the client sends an acknowledgement frame after this many packets at most
+ACK_DELAY = 0.005  # SACK mode: and holds one back no longer than this many seconds (NACKs go out at once)
+MAX_TRANSFERS = 64  # Sessions served at once; override with --max-transfers. Further connections wait for a slot
+ADMISSION_QUEUE = 256  # Connections waiting for a slot; beyond this, new ones are turned away at once
+ADMISSION_WAIT = 1.0  # Seconds a connection may wait for a slot before it is turned away (keep below ACK_TIMEOUT)
+BUSY_RETRY_AFTER = 500  # Milliseconds a turned-away client is told to wait before connecting again
+BUSY_RETRIES = 5  # Times the client reconnects after busy replies before giving up
\ No newline at end of file
@@ -0,0 +1,47 @@
+import time
+from collections import deque
+from config import PACING_GAIN, PACING_HISTORY, PACING_SLACK
+
+class Pacer:
+    """Spaces data packets out at a rate derived from measured goodput.
+
+    Goodput is sampled about once per round trip (bytes acknowledged over
+    the time it took). The pacing rate is PACING_GAIN times the best of the
+    last few samples: enough headroom to keep probing for more bandwidth,
+    while a window's worth of packets no longer leaves as one burst. Until
+    the first sample, packets are not paced.
+    """
+
+    def __init__(self, gain=PACING_GAIN, history=PACING_HISTORY, slack=PACING_SLACK):
+        self.gain = gain
+        self.slack = slack
+        self.samples = deque(maxlen=history)
+        self.rate = None  # Bytes per second
+        self.next_send = 0.0
+        self.acked_bytes = 0
+        self.sample_start = None
+
+    def ready(self, now):
+        return now >= self.next_send
+
+    def on_send(self, num_bytes, now=None):
+        now = time.monotonic() if now is None else now
+        if self.sample_start is None:
+            self.sample_start = now
+        if self.rate:
+            # A late wake-up keeps up to slack seconds (at least one packet) of credit, so timer
+            # granularity does not lower the rate. Longer idle time earns none, so a quiet spell
+            # is not followed by a burst.
+            gap = num_bytes / self.rate
+            self.next_send = max(self.next_send, now - max(gap, self.slack)) + gap
+
+    def on_ack(self, num_bytes, interval, now=None):
+        """Count acknowledged bytes; interval is the current smoothed RTT"""
+        now = time.monotonic() if now is None else now
+        self.acked_bytes += num_bytes
+        elapsed = now - self.sample_start
+        if elapsed >= interval and elapsed > 0:
+            self.samples.append(self.acked_bytes / elapsed)
+            self.rate = self.gain * max(self.samples)
+            self.acked_bytes = 0
+            self.sample_start = now
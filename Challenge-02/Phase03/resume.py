@@ -0,0 +1,108 @@
+import json
+import os
+from utils import new_bitmap, set_bit, has_bit, missing_chunks, encode_ranges
+
+CHECKPOINT_INTERVAL = 256  # Persist the bitmap after this many new chunks
+
+def load_resume_state(output_path):
+    """State left behind by an interrupted download of output_path, or None"""
+    if not os.path.exists(output_path + '.part'):
+        return None
+    try:
+        with open(output_path + '.resume') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def resume_options(state):
+    """Request options asking only for the chunks an interrupted run did not get"""
+    identity = state["identity"]
+    missing = missing_chunks(bytearray.fromhex(state["bitmap"]), identity["chunk_count"])
+    return {"resume": identity["file_digest"], "ranges": encode_ranges(missing), "chunk_size": identity["chunk_size"]}
+
+class PartialDownload:
+    """Output file filled in place chunk by chunk, plus the state needed to resume it.
+
+    Verified chunks are written straight to ``<output>.part`` at their final
+    offset and recorded in a bitmap. The bitmap, together with the identity
+    of the file being downloaded, is saved to ``<output>.resume`` every
+    CHECKPOINT_INTERVAL chunks and on close. Chunk data is always flushed
+    before the bitmap that claims it, so a crash can only lose bits, never
+    claim chunks that are not on disk.
+    """
+
+    def __init__(self, output_path, chunk_size, chunk_count, file_digest, state=None):
+        self.output_path = output_path
+        self.part_path = output_path + '.part'
+        self.state_path = output_path + '.resume'
+        self.chunk_size = chunk_size
+        self.chunk_count = chunk_count
+        self.identity = {"chunk_size": chunk_size, "chunk_count": chunk_count, "file_digest": file_digest.hex()}
+
+        self.resumed = state is not None and state.get("identity") == self.identity
+        if self.resumed:
+            self.bitmap = bytearray.fromhex(state["bitmap"])
+            self.file = open(self.part_path, 'r+b')
+        else:
+            self.bitmap = new_bitmap(chunk_count)
+            self.file = open(self.part_path, 'w+b')
+        self.unsaved = 0
+
+    def has(self, seq):
+        return has_bit(self.bitmap, seq)
+
+    def missing(self):
+        return missing_chunks(self.bitmap, self.chunk_count)
+
+    def received(self):
+        return self.chunk_count - len(self.missing())
+
+    def write(self, seq, chunk):
+        self.file.seek(seq * self.chunk_size)
+        self.file.write(chunk)
+        set_bit(self.bitmap, seq)
+        self.unsaved += 1
+        if self.unsaved >= CHECKPOINT_INTERVAL:
+            self.checkpoint()
+
+    def read_chunk(self, seq):
+        """One chunk read back from the part file"""
+        self.file.flush()
+        self.file.seek(seq * self.chunk_size)
+        return self.file.read(self.chunk_size)
+
+    def iter_chunks(self):
+        """Chunks in order, read back from the part file"""
+        self.file.flush()
+        self.file.seek(0)
+        while chunk := self.file.read(self.chunk_size):
+            yield chunk
+
+    def checkpoint(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({"identity": self.identity, "bitmap": self.bitmap.hex()}, f)
+        os.replace(temp_path, self.state_path)
+        self.unsaved = 0
+
+    def close(self):
+        """Save progress so the next run can resume"""
+        if not self.file.closed:
+            self.checkpoint()
+            self.file.close()
+
+    def discard(self):
+        """Drop the partial file and its state, so the next run starts over"""
+        self.file.close()
+        for path in (self.part_path, self.state_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def finish(self):
+        """Move the completed file into place and drop the resume state"""
+        self.file.close()
+        os.replace(self.part_path, self.output_path)
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
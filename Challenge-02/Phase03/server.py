@@ -1,153 +1,199 @@
+import argparse
+import concurrent.futures
+import selectors
 import socket
 import threading
 import time
-from config import SERVER_HOST, SERVER_PORT, CHUNK_SIZE, ACK_TIMEOUT, MAX_RETRIES
-from utils import calculate_checksum, simulate_packet_drop, corrupt_packet, create_packet_header, parse_packet_header
-
-def send_packet_with_retry(conn, client_id, seq_num, data):
-    """Send a packet with retransmission logic"""
-    retries = 0
-    while retries < MAX_RETRIES:
-        # Simulate packet drop
-        if simulate_packet_drop():
-            print(f"[!] Simulated packet drop for seq {seq_num}")
-            time.sleep(ACK_TIMEOUT)
-            retries += 1
-            continue
-
-        # Create and send packet
-        header = create_packet_header(client_id, seq_num)
-        packet = corrupt_packet(data)  # Simulate corruption
-        try:
-            print(f"[+] Sending packet {seq_num}")
-            conn.sendall(header)
-            conn.sendall(packet)
-
-            # Wait for ACK/NACK
-            conn.settimeout(ACK_TIMEOUT)
-            response = conn.recv(20)  # Receive header
-            if not response:
-                raise socket.timeout("No response received")
-
-            _, resp_seq, status = parse_packet_header(response)
-            if status == "ACK" and resp_seq == seq_num:
-                print(f"[+] Packet {seq_num} acknowledged")
-                return True
-            elif status == "NACK" and resp_seq == seq_num:
-                print(f"[!] Packet {seq_num} corrupted, retrying...")
-                retries += 1
-            else:
-                print(f"[!] Invalid response for packet {seq_num}")
-                retries += 1
-
-        except (socket.timeout, ConnectionResetError, BrokenPipeError) as e:
-            print(f"[!] Error during packet {seq_num} transmission: {e}")
-            retries += 1
-            if retries >= MAX_RETRIES:
-                break
-            time.sleep(ACK_TIMEOUT)
-
-    print(f"[!] Max retries exceeded for packet {seq_num}")
-    return False
-
-def send_checksum(conn, checksum, client_id):
-    """Send checksum with retry logic"""
-    retries = 0
-    while retries < MAX_RETRIES:
-        try:
-            print(f"[+] Sending checksum to client {client_id}")
-            # Send a special header first
-            header = create_packet_header(client_id, -2, is_ack=True)  # -2 indicates checksum
-            conn.sendall(header)
-            time.sleep(0.1)  # Small delay
-            # Send the checksum
-            conn.sendall(checksum.encode())
-            return True
-        except Exception as e:
-            print(f"[!] Error sending checksum: {e}")
-            retries += 1
-            if retries >= MAX_RETRIES:
-                return False
-            time.sleep(ACK_TIMEOUT)
-    return False
+from collections import deque
+from config import (SERVER_HOST, SERVER_PORT, SERVER_ENGINE, LISTEN_BACKLOG, ACK_TIMEOUT, MAX_TRANSFERS,
+                    ADMISSION_QUEUE, ADMISSION_WAIT, BUSY_RETRY_AFTER, DEDUP)
+from session import ServerSession
+from utils import encode_busy
 
 def handle_client(conn, addr, client_id):
+    """Drive a ServerSession over a blocking socket in its own thread"""
     print(f"[+] Client {client_id} connected from {addr}")
-    file_data = b""
-    
-    try:
-        conn.settimeout(ACK_TIMEOUT)
-        # Receive file data
-        print(f"[+] Waiting for file data from client {client_id}")
-        while True:
-            try:
-                chunk = conn.recv(CHUNK_SIZE)
-                if not chunk:
-                    break
-                file_data += chunk
-                print(f"[+] Received {len(chunk)} bytes")
-            except socket.timeout:
-                print(f"[!] Timeout waiting for data from client {client_id}")
-                break
-            except (ConnectionResetError, BrokenPipeError):
-                print(f"[!] Connection lost while receiving data from client {client_id}")
-                return
+    # Packets are small and paced; Nagle would hold them until the client's delayed TCP ACK
+    # (asyncio transports already set TCP_NODELAY)
+    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    session = ServerSession(client_id)
+    print(f"[+] Waiting for file data from client {client_id}")
 
-        if not file_data:
-            print(f"[!] No data received from client {client_id}")
-            return
+    # Not select.select(): it fails on descriptors past 1024, which a loaded server reaches
+    selector = selectors.DefaultSelector()
+    selector.register(conn, selectors.EVENT_READ)
+    try:
+        while not session.closed:
+            outgoing = session.data_to_send()
+            if outgoing:
+                conn.sendall(outgoing)
 
-        print(f"[+] Received total of {len(file_data)} bytes")
-        checksum = calculate_checksum(file_data)
-        
-        # Send checksum with retry logic
-        if not send_checksum(conn, checksum, client_id):
-            print(f"[!] Failed to send checksum to client {client_id}")
-            return
+            deadline = session.next_deadline()
+            timeout = max(0.0, deadline - time.monotonic()) if deadline is not None else None
+            if session.compressing is not None:
+                # This thread has nothing else to do; ACKs wait in the socket meanwhile
+                concurrent.futures.wait([session.compressing], timeout)
+                timeout = 0
+            if selector.select(timeout):
+                session.receive_data(conn.recv(65536))
+            session.on_timer()
 
-        # Send file back with sequence numbers and error simulation
-        total_chunks = (len(file_data) + CHUNK_SIZE - 1) // CHUNK_SIZE
-        print(f"[+] Sending {total_chunks} chunks back to client {client_id}")
-        
-        # Reset timeout for sending data
-        conn.settimeout(None)  # No timeout for sending
-        
-        for seq_num in range(total_chunks):
-            chunk = file_data[seq_num * CHUNK_SIZE:(seq_num + 1) * CHUNK_SIZE]
-            if not send_packet_with_retry(conn, client_id, seq_num, chunk):
-                print(f"[!] Failed to send packet {seq_num} after {MAX_RETRIES} retries")
-                break
-            time.sleep(0.01)  # Small delay between packets
-
-        # Send end of transmission marker
+        outgoing = session.data_to_send()
+        if outgoing:
+            conn.sendall(outgoing)
+        # Half-close and read until the client closes too: closing with its last ACKs still
+        # arriving would reset the connection, and the client could lose the end marker
         try:
-            end_header = create_packet_header(client_id, -1)  # Special sequence number for end
-            conn.sendall(end_header)
-        except:
-            pass
+            conn.shutdown(socket.SHUT_WR)
+            conn.settimeout(ACK_TIMEOUT)
+            while conn.recv(65536):
+                pass
+        except OSError:
+            pass  # A reset after our end marker is the client leaving, not an error
 
+    except (ConnectionResetError, BrokenPipeError):
+        print(f"[!] Connection lost with client {client_id}")
     except Exception as e:
         print(f"[!] Error handling client {client_id}: {e}")
     finally:
+        session.close()  # Releases its chunks in the shared store, however the connection ended
+        selector.close()
         try:
             conn.close()
         except:
             pass
         print(f"[-] Client {client_id} disconnected")
 
+class Admission:
+    """Accepted connections waiting for one of a fixed number of worker threads.
+
+    At most MAX_TRANSFERS sessions run at once, so memory and CPU stay
+    bounded however many clients arrive. Up to ADMISSION_QUEUE more wait,
+    in arrival order, for a worker to free up; a connection that waited
+    ADMISSION_WAIT seconds, or arrives to a full queue, gets a busy reply
+    instead. A client that is turned away learns so within ADMISSION_WAIT,
+    rather than timing out behind thousands of others.
+
+    Turned-away connections are drained by the accept loop itself, through
+    selector, until the client closes or ADMISSION_WAIT passes, so a burst
+    of them costs no threads. Only the accept loop calls admit(), expire()
+    and drain().
+    """
+
+    def __init__(self, workers, queue_limit=ADMISSION_QUEUE, wait=ADMISSION_WAIT):
+        self.queue_limit = queue_limit
+        self.wait = wait
+        self.pending = deque()  # (deadline, conn, addr, client_id), oldest first
+        self.ready = threading.Condition()
+        self.selector = selectors.DefaultSelector()  # The listening socket, plus the connections being drained
+        self.draining = deque()  # (deadline, conn) of turned-away connections, oldest first
+        for _ in range(workers):
+            threading.Thread(target=self.work, daemon=True).start()
+
+    def work(self):
+        while True:
+            with self.ready:
+                while not self.pending:
+                    self.ready.wait()
+                _, conn, addr, client_id = self.pending.popleft()
+            handle_client(conn, addr, client_id)
+
+    def admit(self, conn, addr, client_id):
+        with self.ready:
+            if len(self.pending) < self.queue_limit:
+                self.pending.append((time.monotonic() + self.wait, conn, addr, client_id))
+                self.ready.notify()
+                return
+        self.turn_away(conn, client_id, "queue full")
+
+    def turn_away(self, conn, client_id, reason):
+        """Tell a client the server is busy and when to retry, then drain it instead of serving it"""
+        print(f"[!] Server busy, turning client {client_id} away ({reason}); retry after {BUSY_RETRY_AFTER} ms")
+        try:
+            conn.sendall(encode_busy(client_id, BUSY_RETRY_AFTER))
+            conn.shutdown(socket.SHUT_WR)
+        except OSError:
+            conn.close()
+            return
+        # Closing with unread data would reset the connection and could destroy the busy reply
+        conn.setblocking(False)
+        self.selector.register(conn, selectors.EVENT_READ)
+        self.draining.append((time.monotonic() + self.wait, conn))
+
+    def drain(self, conn):
+        """Discard what a turned-away client sent; close the connection once the client closes"""
+        try:
+            if conn.recv(65536):
+                return
+        except BlockingIOError:
+            return
+        except OSError:
+            pass
+        self.selector.unregister(conn)
+        conn.close()
+
+    def expire(self):
+        """Turn away connections that waited too long and close drains that timed out.
+
+        Returns the seconds until the next deadline, or None if nothing is waiting.
+        """
+        now = time.monotonic()
+        expired = []
+        with self.ready:
+            while self.pending and self.pending[0][0] <= now:
+                expired.append(self.pending.popleft())
+            deadlines = [self.pending[0][0]] if self.pending else []
+        for _, conn, _, client_id in expired:
+            self.turn_away(conn, client_id, f"no free slot within {self.wait:g}s")
+        while self.draining and (self.draining[0][0] <= now or self.draining[0][1].fileno() == -1):
+            _, conn = self.draining.popleft()
+            if conn.fileno() != -1:
+                self.selector.unregister(conn)
+                conn.close()
+        if self.draining:
+            deadlines.append(self.draining[0][0])
+        return max(0.0, min(deadlines) - now) if deadlines else None
+
 def main():
+    parser = argparse.ArgumentParser(description="File echo server with error simulation")
+    parser.add_argument("--engine", choices=["threads", "asyncio"], default=SERVER_ENGINE,
+                        help="thread per connection, or a single asyncio event loop")
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--max-transfers", type=int, default=MAX_TRANSFERS,
+                        help="sessions served at once; later connections queue, then get a busy reply")
+    parser.add_argument("--dedup", action=argparse.BooleanOptionalAction, default=DEDUP,
+                        help="let clients skip chunks the store already holds (tells them what others uploaded)")
+    args = parser.parse_args()
+    ServerSession.dedup = args.dedup
+
+    if args.engine == "asyncio":
+        import asyncio
+        from async_server import serve
+        try:
+            asyncio.run(serve(SERVER_HOST, args.port, args.max_transfers))
+        except KeyboardInterrupt:
+            print("\n[!] Server shutting down...")
+        return
+
     server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server.bind((SERVER_HOST, SERVER_PORT))
-    server.listen(5)
-    print(f"[*] Server listening on {SERVER_HOST}:{SERVER_PORT}")
-    
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((SERVER_HOST, args.port))
+    server.listen(LISTEN_BACKLOG)
+    print(f"[*] Server listening on {SERVER_HOST}:{args.port} (threads engine, {args.max_transfers} workers)")
+
+    admission = Admission(args.max_transfers)
+    admission.selector.register(server, selectors.EVENT_READ)
     client_id = 0
     while True:
         try:
-            conn, addr = server.accept()
-            thread = threading.Thread(target=handle_client, args=(conn, addr, client_id))
-            thread.start()
-            client_id += 1
+            # Wake up in time to turn away connections that waited too long in the queue
+            for key, _ in admission.selector.select(admission.expire()):
+                if key.fileobj is not server:
+                    admission.drain(key.fileobj)
+                    continue
+                conn, addr = server.accept()
+                admission.admit(conn, addr, client_id)
+                client_id += 1
         except KeyboardInterrupt:
             print("\n[!] Server shutting down...")
             break
@@ -155,4 +201,4 @@ def main():
             print(f"[!] Error accepting connection: {e}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
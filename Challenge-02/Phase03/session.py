@@ -0,0 +1,602 @@
+import time
+from config import CHUNK_SIZE, ACK_TIMEOUT, MAX_RETRIES, WINDOW_SIZE, MAX_PACKET_SIZE, COMPRESSION_LOOKAHEAD, DEDUP
+from utils import (new_checksum, chunk_digest, parse_hello, encode_hello, parse_ranges, new_bitmap, set_bit,
+                   simulate_packet_drop, corrupt_packet, create_packet_header, parse_packet_header, unpack_headers,
+                   parse_sack, HEADER_SIZE, STORE_KEY_SIZE, FLAG_ACK, FLAG_NACK, FLAG_HELLO, FLAG_HAVE, FLAG_SACK)
+from window import SendWindow
+from chunk_sizer import ChunkSizer
+from pacer import Pacer
+from compressor import PacketCompressor
+from chunk_store import SHARED_STORE
+
+class ServerSession:
+    """Protocol state for one client connection, independent of how bytes move.
+
+    An engine (threads or asyncio) feeds received bytes to receive_data(),
+    calls on_timer() once next_deadline() has passed, writes whatever
+    data_to_send() returns and closes the connection once closed is True.
+    While compressing holds a future, the next packet is still being
+    compressed: the engine also calls on_timer() once that completes.
+    The session never blocks or sleeps, so one engine thread or event loop
+    can drive any number of sessions.
+    """
+
+    HELLO, QUERY, UPLOAD, ECHO, CLOSED = "hello", "query", "upload", "echo", "closed"
+    dedup = DEDUP  # Answer dedup queries from the store; if off, every client uploads every chunk
+
+    def __init__(self, client_id, store=SHARED_STORE):
+        self.client_id = client_id
+        self.state = self.HELLO
+        # The upload lives in the chunk store shared by all connections, as one key per chunk
+        self.store = store
+        self.keys = []
+        self.chunk_buffer = bytearray()  # Chunk currently being filled
+        self.missing = None  # Dedup mode: chunks the client still has to upload, in order
+        self.next_missing = 0
+        self.upload_size = 0
+        self.uploading = False  # Stream mode: the upload is still arriving while the echo runs
+        # Integrity algorithms (and any resume request) come from the client's hello packet
+        self.hello = None
+        self.chunk_size = CHUNK_SIZE
+        self.chunk_algorithm = self.blake2b_size = None
+        self.hasher = None  # Updated as bytes arrive, no second pass
+        self.manifest = bytearray()  # Raw digest of every complete chunk, in order
+        self.last_activity = time.monotonic()
+        self.inbox = bytearray()
+        self.outbox = bytearray()
+        self.window = None
+        self.send_order = None  # Chunk sequence numbers to echo
+        self.cursor = 0  # Next entry of send_order not yet assigned to a packet
+        self.packets = []  # Window position -> (first chunk, number of chunks)
+        self.packet_of = {}  # First chunk -> window position, to match ACKs
+        self.sizer = None  # Adaptive mode: decides how many chunks each packet carries
+        self.pacer = Pacer()  # Spaces new packets out at the measured goodput
+        self.compressor = None  # Set when the client negotiated compression
+        self.compressing = None  # Future of the next packet's compression, while sending waits for it
+        self.data_bytes = self.payload_bytes = 0  # Echoed bytes before and after compression
+        self.packets_sent = self.ack_frames = 0  # Data packets out, acknowledgement frames in
+
+    @property
+    def closed(self):
+        return self.state == self.CLOSED
+
+    def data_to_send(self):
+        data = bytes(self.outbox)
+        self.outbox.clear()
+        return data
+
+    def next_deadline(self):
+        """Monotonic time at which on_timer() must run next, or None"""
+        if self.state in (self.HELLO, self.QUERY, self.UPLOAD):
+            return self.last_activity + ACK_TIMEOUT
+        if self.state == self.ECHO:
+            deadlines = [self.window.next_deadline()]
+            if self.window.can_send() and self.can_plan() and self.compressing is None:
+                deadlines.append(self.pacer.next_send)  # Next new packet is only held back by pacing
+            if self.uploading:
+                deadlines.append(self.last_activity + ACK_TIMEOUT)
+            return min((d for d in deadlines if d is not None), default=None)
+        return None
+
+    def receive_data(self, data):
+        """Handle bytes read from the peer; b"" means the peer closed its side"""
+        if self.state == self.HELLO:
+            if not data:
+                self.finish_upload()
+                return
+            self.inbox += data
+            self.last_activity = time.monotonic()
+            data = self.receive_hello()
+            if not data:
+                return  # Hello incomplete, or nothing uploaded behind it yet
+        if self.state == self.QUERY:
+            if not data:
+                print(f"[!] Client {self.client_id} closed before asking which chunks the server has")
+                self.close()
+                return
+            self.inbox += data
+            self.last_activity = time.monotonic()
+            data = self.receive_query()
+            if not data:
+                return
+        if self.state == self.UPLOAD:
+            if not data:
+                self.finish_upload()
+                return
+            self.update_upload(data)
+            self.last_activity = time.monotonic()
+            print(f"[+] Received {len(data)} bytes")
+            if self.upload_size == self.hello["size"] and (self.missing is None
+                                                           or self.next_missing == len(self.missing)):
+                self.finish_upload()  # The size was declared, so no need to wait for silence
+        elif self.state == self.ECHO:
+            if not data:
+                print(f"[!] Connection lost while sending to client {self.client_id}")
+                self.close()
+                return
+            self.inbox += data
+            if self.hello["stream"] or self.hello["sack"]:
+                self.receive_packets()  # Frames with payloads, so they are parsed one at a time
+                return
+            # ACK/NACK frames carry no payload, so every complete header can be parsed in one call
+            complete = len(self.inbox) - len(self.inbox) % HEADER_SIZE
+            try:
+                responses = unpack_headers(self.inbox[:complete])
+            except ValueError as e:
+                print(f"[!] {e}")
+                self.close()
+                return
+            del self.inbox[:complete]
+            for response in responses:
+                self.handle_response(*response)
+                if self.state != self.ECHO:
+                    break
+
+    def on_timer(self, now=None):
+        now = time.monotonic() if now is None else now
+        if self.state in (self.HELLO, self.QUERY, self.UPLOAD) and now >= self.last_activity + ACK_TIMEOUT:
+            # The client never half-closes, so without a declared size silence marks the end of the upload
+            print(f"[!] Timeout waiting for data from client {self.client_id}")
+            self.finish_upload()
+        elif self.state == self.ECHO and self.uploading and now >= self.last_activity + ACK_TIMEOUT:
+            print(f"[!] Client {self.client_id} stopped uploading after {self.upload_size} of "
+                  f"{self.hello['size']} bytes")
+            self.close()
+        elif self.state == self.ECHO:
+            expired = self.window.expired(now)
+            if expired:
+                self.window.rtt.backoff()  # Once per timeout event, however many packets it covers
+            for pos in expired:
+                print(f"[!] Timeout waiting for ACK of packet {self.packets[pos][0]}, retrying...")
+                if not self.retransmit(pos):
+                    return
+            self.fill_window(now)
+
+    def close(self):
+        if self.state != self.CLOSED:
+            self.state = self.CLOSED
+            if self.compressor:
+                self.compressor.clear()
+            for key in self.keys:
+                if key is not None:
+                    self.store.release(key)
+            self.keys = []
+
+    # --- Upload phase ---
+
+    def receive_hello(self):
+        """Parse the hello packet once it is complete; returns any upload bytes that followed it"""
+        if len(self.inbox) < HEADER_SIZE:
+            return b""
+        try:
+            _, _, flags, length = parse_packet_header(self.inbox[:HEADER_SIZE])
+            if not flags & FLAG_HELLO:
+                raise ValueError("Expected a hello packet")
+            if len(self.inbox) < HEADER_SIZE + length:
+                return b""
+            self.hello = parse_hello(self.inbox[HEADER_SIZE:HEADER_SIZE + length])
+        except ValueError as e:
+            print(f"[!] {e}")
+            self.close()
+            return b""
+        print(f"[+] Client {self.client_id} integrity: {self.hello['chunk']} per chunk, {self.hello['file']} per file")
+        self.chunk_algorithm, self.blake2b_size = self.hello["chunk"], self.hello["blake2b_size"]
+        self.chunk_size = self.hello["chunk_size"]
+        self.hasher = new_checksum(self.hello["file"], self.blake2b_size)
+        data = bytes(self.inbox[HEADER_SIZE + length:])
+        self.inbox.clear()
+        if self.hello["stream"]:
+            self.start_stream()
+            self.inbox += data  # Upload frames, handled by the echo state
+            self.receive_packets()
+            return b""
+        self.state = self.QUERY if self.hello["dedup"] else self.UPLOAD
+        return data
+
+    def receive_query(self):
+        """Answer the dedup "have these chunks?" packet; returns any upload bytes that followed it.
+
+        The query lists the store key of every chunk of the upload. The
+        reply is a bitmap of the chunks already stored, each of which this
+        session references right away; the client then uploads only the rest.
+        With dedup off on this server, the bitmap is empty. Either way, the
+        echo only starts once the assembled file matches the hello's digest.
+        """
+        if len(self.inbox) < HEADER_SIZE:
+            return b""
+        total_chunks = (self.hello["size"] + self.chunk_size - 1) // self.chunk_size
+        try:
+            _, _, flags, length = parse_packet_header(self.inbox[:HEADER_SIZE])
+            if not flags & FLAG_HAVE:
+                raise ValueError("Expected a have-query packet")
+            if length != total_chunks * STORE_KEY_SIZE:
+                raise ValueError("Have-query does not match the announced upload size")
+        except ValueError as e:
+            print(f"[!] {e}")
+            self.close()
+            return b""
+        if len(self.inbox) < HEADER_SIZE + length:
+            return b""
+        query = bytes(self.inbox[HEADER_SIZE:HEADER_SIZE + length])
+        data = bytes(self.inbox[HEADER_SIZE + length:])
+        self.inbox.clear()
+
+        have = new_bitmap(total_chunks)
+        self.keys = [None] * total_chunks
+        self.missing = []
+        for seq in range(total_chunks):
+            key = query[seq * STORE_KEY_SIZE:(seq + 1) * STORE_KEY_SIZE]
+            if self.dedup and self.store.acquire(key):
+                set_bit(have, seq)
+                self.keys[seq] = key
+            else:
+                self.missing.append(seq)
+        self.upload_size = self.hello["size"]
+        print(f"[+] Client {self.client_id} dedup: server already has {total_chunks - len(self.missing)} "
+              f"of {total_chunks} chunks")
+        self.outbox += create_packet_header(self.client_id, -5, is_ack=True, length=len(have), flags=FLAG_HAVE)  # -5 indicates have reply
+        self.outbox += have
+        self.state = self.UPLOAD
+        if not self.missing:
+            self.finish_upload()
+            return b""
+        return data
+
+    def chunk_length(self, seq):
+        return min(self.chunk_size, self.upload_size - seq * self.chunk_size)
+
+    def update_upload(self, data):
+        """Cut incoming bytes into chunks, whatever the recv() boundaries were, and store each one"""
+        if self.missing is None:
+            if self.hello["size"] and self.upload_size + len(data) > self.hello["size"]:
+                print(f"[!] Client {self.client_id} sent more than the {self.hello['size']} bytes it announced")
+                data = data[:self.hello["size"] - self.upload_size]
+            self.hasher.update(data)
+            self.upload_size += len(data)
+        view = memoryview(data)
+        while view:
+            if self.missing is None:
+                target = self.chunk_size
+            elif self.next_missing < len(self.missing):
+                target = self.chunk_length(self.missing[self.next_missing])
+            else:
+                print(f"[!] Client {self.client_id} sent {len(view)} bytes more than it announced")
+                return
+            take = min(target - len(self.chunk_buffer), len(view))
+            self.chunk_buffer += view[:take]
+            view = view[take:]
+            if len(self.chunk_buffer) == target:
+                self.store_chunk()
+
+    def store_chunk(self):
+        key = self.store.put(self.chunk_buffer)
+        if self.missing is None:
+            self.keys.append(key)
+            self.manifest += chunk_digest(self.chunk_buffer, self.chunk_algorithm, self.blake2b_size)
+        else:
+            self.keys[self.missing[self.next_missing]] = key
+            self.next_missing += 1
+        self.chunk_buffer.clear()
+
+    def finish_upload(self):
+        if self.missing is None:
+            if self.chunk_buffer:
+                self.store_chunk()  # Short last chunk
+        elif self.next_missing < len(self.missing):
+            print(f"[!] Client {self.client_id} uploaded {self.next_missing} of {len(self.missing)} missing chunks")
+            self.close()
+            return
+        else:
+            # Chunks came from the store and the wire out of order; hash the file once, in order.
+            # upload_checksum() holds the echo back unless this matches the digest the client announced
+            for key in self.keys:
+                chunk = self.store.get(key)
+                self.hasher.update(chunk)
+                self.manifest += chunk_digest(chunk, self.chunk_algorithm, self.blake2b_size)
+        if not self.upload_size:
+            print(f"[!] No data received from client {self.client_id}")
+            self.close()
+            return
+        checksum = self.upload_checksum()
+        if checksum is None:
+            return
+
+        self.send_reply()
+        total_chunks = (self.upload_size + self.chunk_size - 1) // self.chunk_size
+        self.send_order = self.echo_order(total_chunks, checksum.hex())
+        print(f"[+] Sending checksum to client {self.client_id}")
+        self.outbox += create_packet_header(self.client_id, -2, is_ack=True, length=len(checksum))  # -2 indicates checksum
+        self.outbox += checksum
+
+        # Digest of every chunk ahead of the data, so the client verifies each chunk with one hash
+        self.outbox += create_packet_header(self.client_id, -3, is_ack=True, length=len(self.manifest))  # -3 indicates manifest
+        self.outbox += self.manifest
+        self.start_echo()
+
+    def upload_checksum(self):
+        """Whole-file digest of the completed upload, or None (and the session closed) if it contradicts the hello"""
+        print(f"[+] Received total of {self.upload_size} bytes")
+        print(f"[+] Chunk store: {self.store.stored_bytes} bytes held ({self.store.resident_bytes} in memory) "
+              f"for {self.store.referenced_bytes} bytes of live uploads")
+        checksum = self.hasher.digest()  # Raw bytes, in the negotiated whole-file algorithm
+        if self.hello["digest"] and checksum.hex() != self.hello["digest"]:
+            print(f"[!] Upload from client {self.client_id} does not match the digest it announced")
+            self.close()
+            return None
+        return checksum
+
+    def send_reply(self):
+        """Confirm the chunk size (possibly clamped) and mode before anything that depends on them"""
+        reply = encode_hello(chunk_size=self.chunk_size, adaptive=self.hello["adaptive"],
+                             compression=self.hello["compression"], sack=self.hello["sack"])
+        self.outbox += create_packet_header(self.client_id, -4, is_ack=True, length=len(reply), flags=FLAG_HELLO)  # -4 indicates hello reply
+        self.outbox += reply
+
+    def echo_order(self, total_chunks, file_digest):
+        """Chunks to echo: all of them, or only what an earlier echo of this exact file left missing"""
+        if self.hello.get("resume") != file_digest:
+            return range(total_chunks)
+        send_order = sorted({seq for seq in parse_ranges(self.hello.get("ranges", "")) if 0 <= seq < total_chunks})
+        print(f"[+] Client {self.client_id} resuming: {len(send_order)} of {total_chunks} chunks missing")
+        return send_order
+
+    def start_echo(self):
+        print(f"[+] Sending {len(self.send_order)} chunks of {self.chunk_size} bytes back to client "
+              f"{self.client_id} (window size {WINDOW_SIZE}{', adaptive' if self.hello['adaptive'] else ''}"
+              f"{', while uploading' if self.uploading else ''})")
+        if self.hello["adaptive"]:
+            self.sizer = ChunkSizer(MAX_PACKET_SIZE // self.chunk_size)
+        if self.hello["compression"] != "none":
+            self.compressor = PacketCompressor(self.hello["compression"])
+        # One chunk per packet is the most packets there can be; plan_packet() lowers it in adaptive mode
+        self.window = SendWindow(len(self.send_order))
+        self.state = self.ECHO
+        self.fill_window()
+
+    # --- Stream mode: upload and echo share the connection ---
+
+    def start_stream(self):
+        """Start the echo right after the hello; chunks are sent back as soon as they are uploaded.
+
+        The client frames its upload as data packets whose sequence number is
+        the byte offset, so they can be told apart from its ACKs and NACKs.
+        The checksum follows once the last byte is in; the client builds the
+        chunk manifest itself from the file it is sending.
+        """
+        self.upload_size = 0
+        self.uploading = True
+        self.send_reply()
+        total_chunks = (self.hello["size"] + self.chunk_size - 1) // self.chunk_size
+        self.send_order = self.echo_order(total_chunks, self.hello["digest"])
+        self.start_echo()
+
+    def receive_packets(self):
+        """Split the inbox into upload frames, SACK frames and ACK/NACK responses"""
+        pos = 0
+        while self.state == self.ECHO and len(self.inbox) - pos >= HEADER_SIZE:
+            try:
+                client_id, seq_num, flags, length = parse_packet_header(self.inbox[pos:pos + HEADER_SIZE])
+            except ValueError as e:
+                print(f"[!] {e}")
+                self.close()
+                return
+            if len(self.inbox) - pos < HEADER_SIZE + length:
+                break
+            payload = self.inbox[pos + HEADER_SIZE:pos + HEADER_SIZE + length]
+            pos += HEADER_SIZE + length
+            if flags & FLAG_SACK:
+                self.handle_sack(seq_num, payload)
+            elif flags & (FLAG_ACK | FLAG_NACK):
+                self.handle_response(client_id, seq_num, flags, length)
+            else:
+                self.receive_frame(seq_num, payload)
+        del self.inbox[:pos]
+
+    def receive_frame(self, offset, payload):
+        if not self.uploading or offset != self.upload_size or offset + len(payload) > self.hello["size"]:
+            print(f"[!] Unexpected upload frame at offset {offset} from client {self.client_id}")
+            self.close()
+            return
+        self.update_upload(payload)
+        self.last_activity = time.monotonic()
+        print(f"[+] Received {len(payload)} bytes")
+        if self.upload_size < self.hello["size"]:
+            self.fill_window()  # The new chunks may be next in line
+            return
+
+        if self.chunk_buffer:
+            self.store_chunk()  # Short last chunk
+        self.uploading = False
+        checksum = self.upload_checksum()
+        if checksum is None:
+            return
+        print(f"[+] Sending checksum to client {self.client_id}")
+        self.outbox += create_packet_header(self.client_id, -2, is_ack=True, length=len(checksum))  # -2 indicates checksum
+        self.outbox += checksum
+        self.fill_window()
+
+    # --- Echo phase: selective-repeat sliding window ---
+
+    def chunks(self, seq_num, count=1):
+        """Count consecutive chunks, fetched from the store"""
+        if count == 1:
+            return self.store.get(self.keys[seq_num])
+        return b"".join(self.store.get(key) for key in self.keys[seq_num:seq_num + count])
+
+    def next_run(self, cursor):
+        """(first chunk, chunk count) of the packet that would start at send_order[cursor].
+
+        A packet is a run of consecutive chunks, so its sequence number (the
+        first chunk) still maps to the offset seq * chunk_size however many
+        chunks it holds.
+        """
+        want = self.sizer.chunks if self.sizer else 1
+        first = self.send_order[cursor]
+        count = 1
+        while (count < want and cursor + count < len(self.send_order)
+               and self.send_order[cursor + count] == first + count and first + count < len(self.keys)):
+            count += 1
+        return first, count
+
+    def can_plan(self):
+        """Whether the next packet's first chunk is here yet; only a streamed upload can lag behind"""
+        return self.send_order[self.cursor] < len(self.keys)
+
+    def plan_packet(self, pos):
+        """Decide which chunks the packet at window position pos carries"""
+        first, count = self.next_run(self.cursor)
+        self.cursor += count
+        self.packets.append((first, count))
+        self.packet_of[first] = pos
+        if self.cursor == len(self.send_order):
+            self.window.limit(pos + 1)
+
+    def transmit_packet(self, pos):
+        """Queue (or simulate dropping) a single data packet and record it in the window"""
+        self.window.mark_sent(pos)
+        seq_num, count = self.packets[pos]
+        self.pacer.on_send(count * self.chunk_size)
+        if self.compressor:
+            payload, flags = self.compressor.payload(seq_num)  # fill_window() waited for it
+        else:
+            payload, flags = self.chunks(seq_num, count), 0
+        self.packets_sent += 1
+        if self.window.attempts[pos] == 1:
+            self.data_bytes += min(count * self.chunk_size, self.upload_size - seq_num * self.chunk_size)
+            self.payload_bytes += len(payload)
+        if simulate_packet_drop():
+            print(f"[!] Simulated packet drop for seq {seq_num}")
+            return
+        packet = corrupt_packet(payload)  # Simulate corruption
+        print(f"[+] Sending packet {seq_num}")
+        self.outbox += create_packet_header(self.client_id, seq_num, length=len(packet), flags=flags)
+        self.outbox += packet
+
+    def retransmit(self, pos):
+        if self.sizer:
+            self.sizer.on_loss()
+        if not self.window.can_retry(pos):
+            print(f"[!] Max retries exceeded for packet {self.packets[pos][0]}")
+            print(f"[!] Failed to send file to client {self.client_id} after {MAX_RETRIES} retries")
+            self.finish_echo()
+            return False
+        self.transmit_packet(pos)
+        return True
+
+    def fill_window(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.compressing = None
+        while self.window.can_send() and self.can_plan() and self.pacer.ready(now):
+            if self.compressor:
+                first, count = self.next_run(self.cursor)
+                job = self.compressor.job(first, count, lambda: self.chunks(first, count))
+                if not job.done():
+                    self.compressing = job  # The engine calls on_timer() once it completes
+                    break
+            pos = self.window.take_next()
+            self.plan_packet(pos)
+            self.transmit_packet(pos)
+        if self.compressor:
+            self.prefetch()
+        if self.window.done:
+            self.finish_echo()
+
+    def prefetch(self):
+        """Start compressing the packets expected after the ones already planned"""
+        cursor = self.cursor
+        for _ in range(COMPRESSION_LOOKAHEAD):
+            if cursor >= len(self.send_order) or self.send_order[cursor] >= len(self.keys):
+                break
+            first, count = self.next_run(cursor)
+            if not self.compressor.has(first, count):
+                self.compressor.prefetch(first, count, self.chunks(first, count))
+            cursor += count
+
+    def acknowledge(self, pos, now, sample=True):
+        """Mark the packet at window position pos delivered; False if it already was"""
+        if not self.window.ack(pos, now, sample):
+            return False
+        first, count = self.packets[pos]
+        print(f"[+] Packet {first} acknowledged")
+        acked_bytes = count * self.chunk_size
+        if self.compressor:
+            self.compressor.release(first)
+        if self.sizer:
+            self.sizer.on_ack(acked_bytes, now)
+        if self.window.rtt.srtt is not None:
+            self.pacer.on_ack(acked_bytes, self.window.rtt.srtt, now)
+        return True
+
+    def handle_sack(self, cumulative, payload):
+        """Apply an acknowledgement frame covering any number of packets.
+
+        A packet is delivered if all its chunks are below the cumulative ACK
+        (the first chunk the client still lacks) or inside one SACK range.
+        Only the most recently sent of them is timed, minus the time the
+        client held the frame back, so coalescing does not inflate the RTT.
+        NACKed packets still in flight are retransmitted at once, and so are
+        packets sent before a delivered one but not delivered themselves: the
+        connection keeps order, so they were lost rather than late.
+        """
+        self.ack_frames += 1
+        try:
+            ranges, nacks, ack_delay = parse_sack(payload)
+        except ValueError as e:
+            print(f"[!] {e}")
+            self.close()
+            return
+        now = time.monotonic()
+        delivered = []
+        for pos in self.window.outstanding():
+            first, count = self.packets[pos]
+            end = first + count
+            if end <= cumulative or any(start <= first and end <= stop for start, stop in ranges):
+                delivered.append(pos)
+        sent_times = [sent for sent in map(self.window.sent_once_at, delivered) if sent is not None]
+        if sent_times:
+            self.window.rtt.sample(max(now - max(sent_times) - ack_delay, 0.0))
+        newest_delivered = max((self.window.sent_at[pos] for pos in delivered), default=None)
+        for pos in delivered:
+            self.acknowledge(pos, now, sample=False)
+        for seq in nacks:
+            pos = self.packet_of.get(seq)
+            if pos is not None and self.window.in_flight(pos):
+                print(f"[!] Packet {seq} corrupted, retrying...")
+                if not self.retransmit(pos):
+                    return
+        if newest_delivered is not None:
+            for pos in self.window.outstanding():
+                if self.window.sent_at[pos] < newest_delivered:
+                    print(f"[!] Packet {self.packets[pos][0]} overtaken, retrying...")
+                    if not self.retransmit(pos):
+                        return
+        self.fill_window(now)
+
+    def handle_response(self, client_id, resp_seq, flags, length):
+        self.ack_frames += 1
+        pos = self.packet_of.get(resp_seq)
+        if pos is None:
+            print(f"[!] Invalid response for packet {resp_seq}")
+        elif flags & FLAG_ACK:
+            now = time.monotonic()
+            if self.acknowledge(pos, now):
+                self.fill_window(now)
+        elif flags & FLAG_NACK and self.window.in_flight(pos):
+            print(f"[!] Packet {resp_seq} corrupted, retrying...")
+            self.retransmit(pos)
+        else:
+            print(f"[!] Invalid response for packet {resp_seq}")
+
+    def finish_echo(self):
+        rtt, rate = self.window.rtt, self.pacer.rate
+        if rtt.srtt is not None:
+            print(f"[+] Client {self.client_id}: srtt {rtt.srtt * 1000:.2f} ms, rto {rtt.rto * 1000:.0f} ms, "
+                  f"pacing {rate / 1e6 if rate else 0:.1f} MB/s")
+        if self.compressor:
+            print(f"[+] Client {self.client_id}: {self.payload_bytes} payload bytes sent for {self.data_bytes} "
+                  f"bytes of data ({self.hello['compression']})")
+        print(f"[+] Client {self.client_id}: {self.ack_frames} acknowledgement frames for {self.packets_sent} "
+              f"data packets{' (SACK)' if self.hello['sack'] else ''}")
+        # Send end of transmission marker
+        self.outbox += create_packet_header(self.client_id, -1)  # Special sequence number for end
+        self.close()
@@ -1,11 +1,185 @@
+import bz2
+import functools
 import hashlib
+import lzma
 import random
+import struct
 import time
-from config import PACKET_DROP_RATE, PACKET_CORRUPT_RATE
+import zlib
+from config import (PACKET_DROP_RATE, PACKET_CORRUPT_RATE, CHUNK_ALGORITHM, FILE_ALGORITHM,
+                    BLAKE2B_DIGEST_SIZE, CHUNK_SIZE, MIN_CHUNK_SIZE, MAX_PACKET_SIZE, DEDUP_DIGEST_SIZE)
 
 def calculate_checksum(data):
     return hashlib.sha256(data).hexdigest()
 
+INTEGRITY_ALGORITHMS = ("crc32", "blake2b", "sha256")
+
+class Crc32:
+    """zlib.crc32 behind the hashlib update()/digest() interface"""
+
+    def __init__(self):
+        self.value = 0
+
+    def update(self, data):
+        self.value = zlib.crc32(data, self.value)
+
+    def digest(self):
+        return self.value.to_bytes(4, "big")
+
+def new_checksum(algorithm=FILE_ALGORITHM, blake2b_size=BLAKE2B_DIGEST_SIZE):
+    """Incremental hasher for data that arrives in pieces"""
+    if algorithm == "crc32":
+        return Crc32()
+    if algorithm == "blake2b":
+        return hashlib.blake2b(digest_size=blake2b_size)
+    if algorithm == "sha256":
+        return hashlib.sha256()
+    raise ValueError(f"Unsupported integrity algorithm {algorithm!r}")
+
+def digest_size(algorithm, blake2b_size=BLAKE2B_DIGEST_SIZE):
+    """Length in bytes of the raw digests algorithm produces"""
+    return {"crc32": 4, "blake2b": blake2b_size, "sha256": 32}[algorithm]
+
+def chunk_digest(data, algorithm=CHUNK_ALGORITHM, blake2b_size=BLAKE2B_DIGEST_SIZE):
+    """Raw per-chunk digest used in the manifest"""
+    if algorithm == "crc32":
+        return zlib.crc32(data).to_bytes(4, "big")
+    if algorithm == "blake2b":
+        return hashlib.blake2b(data, digest_size=blake2b_size).digest()
+    if algorithm == "sha256":
+        return hashlib.sha256(data).digest()
+    raise ValueError(f"Unsupported integrity algorithm {algorithm!r}")
+
+STORE_KEY_SIZE = 32
+
+def store_key(data):
+    """Key of a chunk in the server's content-addressed store (collision resistant, unlike crc32)"""
+    return hashlib.blake2b(data, digest_size=STORE_KEY_SIZE).digest()
+
+def clamp_chunk_size(chunk_size):
+    """The chunk size a server actually uses when asked for chunk_size"""
+    return min(max(chunk_size, MIN_CHUNK_SIZE), MAX_PACKET_SIZE)
+
+def encode_hello(**options):
+    """Payload of the hello packet a client sends before its upload"""
+    return "\n".join(f"{key}={value}" for key, value in options.items()).encode()
+
+def parse_hello(payload):
+    """Validated hello options, with defaults for anything the client left out"""
+    try:
+        options = dict(line.split("=", 1) for line in bytes(payload).decode().split("\n") if line)
+        options.setdefault("chunk", CHUNK_ALGORITHM)
+        options.setdefault("file", FILE_ALGORITHM)
+        options["blake2b_size"] = int(options.get("blake2b_size", BLAKE2B_DIGEST_SIZE))
+        # The server has the last word on the chunk size; the client learns it from the hello reply
+        options["chunk_size"] = clamp_chunk_size(int(options.get("chunk_size", CHUNK_SIZE)))
+        options["adaptive"] = int(options.get("adaptive", 0))
+        options.setdefault("compression", "none")
+        # A declared size (and optional whole-file digest, required with dedup) ends the upload on its last byte
+        options["size"] = int(options.get("size", 0))
+        options["digest"] = bytes.fromhex(options.get("digest", "")).hex()
+        # Dedup mode: the upload is followed by a "have these chunks?" query
+        options["dedup"] = int(options.get("dedup", 0))
+        # Stream mode: the upload is framed, so the echo can run alongside it on the same connection
+        options["stream"] = int(options.get("stream", 0))
+        # SACK mode: the client acknowledges packets in batches with cumulative + selective ACK frames
+        options["sack"] = int(options.get("sack", 0))
+    except ValueError:
+        raise ValueError("Malformed hello packet")
+    for algorithm in (options["chunk"], options["file"]):
+        if algorithm not in INTEGRITY_ALGORITHMS:
+            raise ValueError(f"Unsupported integrity algorithm {algorithm!r}")
+    if not 1 <= options["blake2b_size"] <= 64:
+        raise ValueError(f"BLAKE2b digest size {options['blake2b_size']} out of range")
+    if options["size"] < 0:
+        raise ValueError(f"Negative upload size {options['size']}")
+    if options["stream"] and (not options["size"] or options["dedup"]):
+        raise ValueError("Stream mode needs a declared size and does not combine with dedup")
+    if options["dedup"] and len(options["digest"]) < 2 * DEDUP_DIGEST_SIZE:
+        # The echo of chunks taken from the store is only sent once the assembled file matches it
+        raise ValueError(f"Dedup needs a whole-file digest of at least {DEDUP_DIGEST_SIZE} bytes")
+    if options["compression"] not in COMPRESSION_CODECS:
+        raise ValueError(f"Unsupported compression {options['compression']!r}")
+    return options
+
+COMPRESSION_CODECS = ("none", "zlib", "lzma", "bz2")
+_COMPRESSORS = {"zlib": zlib.compress, "lzma": lzma.compress, "bz2": bz2.compress}
+_DECOMPRESSORS = {"zlib": zlib.decompressobj, "lzma": lzma.LZMADecompressor, "bz2": bz2.BZ2Decompressor}
+
+def compress_packet(data, codec):
+    """(payload, flags) for a data packet; sent as is when compressing would not shrink it"""
+    if codec != "none":
+        compressed = _COMPRESSORS[codec](data)
+        if len(compressed) < len(data):
+            return compressed, FLAG_COMPRESSED
+    return data, 0
+
+def decompress_packet(payload, codec, max_size):
+    """Original bytes of a FLAG_COMPRESSED payload; ValueError if it is damaged or inflates past max_size"""
+    try:
+        decompressor = _DECOMPRESSORS[codec]()
+        data = decompressor.decompress(bytes(payload), max_size)
+    except (KeyError, zlib.error, lzma.LZMAError, OSError, EOFError) as e:
+        raise ValueError(f"Cannot decompress packet: {e}")
+    if not decompressor.eof or decompressor.unused_data:
+        raise ValueError("Compressed packet truncated or too large")
+    return data
+
+def seq_runs(seqs):
+    """Sorted sequence numbers as [first, last] runs of consecutive numbers"""
+    runs = []
+    for seq in seqs:
+        if runs and runs[-1][1] == seq - 1:
+            runs[-1][1] = seq
+        else:
+            runs.append([seq, seq])
+    return runs
+
+def encode_ranges(seqs):
+    """Sorted sequence numbers as compact ranges, e.g. [0, 1, 2, 7] -> "0-2,7" """
+    return ",".join(f"{start}-{end}" if start != end else f"{start}" for start, end in seq_runs(seqs))
+
+def parse_ranges(text):
+    """Inverse of encode_ranges"""
+    seqs = []
+    for part in filter(None, text.split(",")):
+        start, _, end = part.partition("-")
+        seqs.extend(range(int(start), int(end or start) + 1))
+    return seqs
+
+# Bitmap of chunks held: bit (seq % 8) of byte (seq // 8)
+
+def new_bitmap(chunk_count):
+    return bytearray((chunk_count + 7) // 8)
+
+def set_bit(bitmap, seq):
+    bitmap[seq >> 3] |= 1 << (seq & 7)
+
+def has_bit(bitmap, seq):
+    return bool(bitmap[seq >> 3] & (1 << (seq & 7)))
+
+def missing_chunks(bitmap, chunk_count):
+    """Sequence numbers whose bit is not set"""
+    missing = []
+    for index, byte in enumerate(bitmap):
+        if byte == 0xFF:
+            continue
+        for bit in range(8):
+            seq = (index << 3) | bit
+            if seq < chunk_count and not byte & (1 << bit):
+                missing.append(seq)
+    return missing
+
+def recv_exact(conn, num_bytes):
+    """Receive exactly num_bytes from conn, or None if the peer closed early"""
+    data = b""
+    while len(data) < num_bytes:
+        packet = conn.recv(num_bytes - len(data))
+        if not packet:
+            return None
+        data += packet
+    return data
+
 def simulate_packet_drop():
     """Simulate packet drop based on configured probability"""
     return random.random() < PACKET_DROP_RATE
@@ -21,19 +195,84 @@ def corrupt_packet(data):
         return bytes(data_array)
     return data
 
-def create_packet_header(client_id, seq_num, is_ack=False, is_nack=False):
+# Binary packet header: version, flags, client id, sequence number, payload length.
+# Sequence numbers are signed 64-bit so the -1/-2 control markers still fit.
+HEADER_VERSION = 1
+PACKET_HEADER = struct.Struct("!BBIqI")
+HEADER_SIZE = PACKET_HEADER.size  # 18 bytes
+
+FLAG_ACK = 0x01
+FLAG_NACK = 0x02
+FLAG_HELLO = 0x04  # Payload carries the client's integrity options
+FLAG_COMPRESSED = 0x08  # Payload is compressed with the codec negotiated in the hello
+FLAG_HAVE = 0x10  # Dedup query (store keys of the upload's chunks) or its reply (bitmap of chunks held)
+FLAG_SACK = 0x20  # Acknowledgement frame: the sequence number is a cumulative ACK, the payload SACK ranges and NACKs
+
+# Number of SACK ranges, number of NACKed sequence numbers, microseconds the newest packet's ACK was held
+SACK_COUNTS = struct.Struct("!HHI")
+
+# Payload of a busy reply (sequence number -6): milliseconds the client should wait before retrying
+BUSY_REPLY = struct.Struct("!I")
+
+def encode_sack(ranges, nacks, ack_delay):
+    """Payload of a SACK frame: [start, end) chunk ranges held beyond the cumulative ACK, then NACKed packets"""
+    values = [value for start_end in ranges for value in start_end] + list(nacks)
+    return (SACK_COUNTS.pack(len(ranges), len(nacks), min(int(ack_delay * 1e6), 0xFFFFFFFF))
+            + struct.pack(f"!{len(values)}I", *values))
+
+def parse_sack(payload):
+    """(ranges, nacks, ack delay in seconds) carried by a SACK frame payload"""
+    try:
+        range_count, nack_count, ack_delay = SACK_COUNTS.unpack_from(payload)
+        if len(payload) != SACK_COUNTS.size + 4 * (2 * range_count + nack_count):
+            raise ValueError("Malformed SACK frame")
+        values = struct.unpack_from(f"!{2 * range_count + nack_count}I", payload, SACK_COUNTS.size)
+    except struct.error as e:
+        raise ValueError(f"Malformed SACK frame: {e}")
+    ends = 2 * range_count
+    return list(zip(values[0:ends:2], values[1:ends:2])), list(values[ends:]), ack_delay / 1e6
+
+def create_packet_header(client_id, seq_num, is_ack=False, is_nack=False, length=0, flags=0):
     """Create a packet header with status flags"""
-    status = "ACK" if is_ack else "NACK" if is_nack else "DATA"
-    header = f"{client_id}:{seq_num:06d}:{status}|"
-    # Pad header to 20 bytes
-    header = header.ljust(20)
-    return header.encode('ascii')
+    if is_ack:
+        flags |= FLAG_ACK
+    if is_nack:
+        flags |= FLAG_NACK
+    try:
+        return PACKET_HEADER.pack(HEADER_VERSION, flags, client_id, seq_num, length)
+    except struct.error as e:
+        raise ValueError(f"Header field out of range: {e}")
+
+def encode_busy(client_id, retry_after):
+    """Busy reply a server sends instead of serving a connection, then closes it"""
+    return create_packet_header(client_id, -6, is_nack=True, length=BUSY_REPLY.size) + BUSY_REPLY.pack(retry_after)
 
 def parse_packet_header(header):
-    """Parse packet header and return components"""
+    """Parse packet header and return (client_id, seq_num, flags, length)"""
     try:
-        header_str = header.decode('ascii').strip()
-        client_id, seq_num, status = header_str.split(':')
-        return int(client_id), int(seq_num), status
-    except Exception as e:
-        raise ValueError(f"Invalid header format: {e}") 
\ No newline at end of file
+        version, flags, client_id, seq_num, length = PACKET_HEADER.unpack(header)
+    except struct.error as e:
+        raise ValueError(f"Invalid header format: {e}")
+    if version != HEADER_VERSION:
+        raise ValueError(f"Unsupported header version {version}")
+    return client_id, seq_num, flags, length
+
+@functools.lru_cache(maxsize=64)
+def _batch_struct(count):
+    return struct.Struct("!" + PACKET_HEADER.format.lstrip("!") * count)
+
+def pack_headers(headers):
+    """Pack a sequence of (client_id, seq_num, flags, length) tuples in one call"""
+    values = []
+    for client_id, seq_num, flags, length in headers:
+        values += (HEADER_VERSION, flags, client_id, seq_num, length)
+    return _batch_struct(len(headers)).pack(*values)
+
+def unpack_headers(buffer):
+    """Parse back-to-back headers; returns a list of (client_id, seq_num, flags, length)"""
+    headers = []
+    for version, flags, client_id, seq_num, length in PACKET_HEADER.iter_unpack(buffer):
+        if version != HEADER_VERSION:
+            raise ValueError(f"Unsupported header version {version}")
+        headers.append((client_id, seq_num, flags, length))
+    return headers
@@ -0,0 +1,119 @@
+import time
+from config import WINDOW_SIZE, ACK_TIMEOUT, MAX_RETRIES, MIN_RTO, MAX_RTO
+
+class RttEstimator:
+    """Retransmission timeout from measured round trips (RFC 6298).
+
+    Keeps a smoothed RTT and its mean deviation; the timeout is
+    SRTT + 4 * RTTVAR, clamped to [MIN_RTO, MAX_RTO]. Until the first
+    sample arrives the timeout is initial_rto, and every timeout doubles it
+    until a fresh sample brings it back down.
+    """
+
+    def __init__(self, initial_rto=ACK_TIMEOUT, min_rto=MIN_RTO, max_rto=MAX_RTO):
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial_rto
+
+    def sample(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = min(max(self.srtt + 4 * self.rttvar, self.min_rto), self.max_rto)
+
+    def backoff(self):
+        self.rto = min(self.rto * 2, self.max_rto)
+
+class SendWindow:
+    """Selective-repeat bookkeeping for the sending side of a transfer.
+
+    Tracks which sequence numbers are in flight, when each one was last
+    transmitted and how many attempts it has used, so that only NACKed or
+    timed-out packets are retransmitted. ACKs of packets sent only once
+    feed the RTT estimator that sets the timeout (Karn's rule: a
+    retransmitted packet's ACK cannot be matched to one transmission).
+    """
+
+    def __init__(self, total_packets, window_size=WINDOW_SIZE, timeout=ACK_TIMEOUT, max_retries=MAX_RETRIES):
+        self.total_packets = total_packets
+        self.window_size = max(1, window_size)
+        self.rtt = RttEstimator(timeout)
+        self.max_retries = max_retries
+        self.base = 0  # Oldest unacknowledged sequence number
+        self.next_seq = 0  # Next never-sent sequence number
+        self.acked = set()
+        self.sent_at = {}  # seq -> time of the last transmission
+        self.attempts = {}  # seq -> number of transmissions so far
+
+    @property
+    def done(self):
+        return self.base >= self.total_packets
+
+    def can_send(self):
+        """True if a new sequence number fits inside the window"""
+        return self.next_seq < min(self.base + self.window_size, self.total_packets)
+
+    def take_next(self):
+        """Reserve the next new sequence number for transmission"""
+        seq = self.next_seq
+        self.next_seq += 1
+        return seq
+
+    def limit(self, total_packets):
+        """Lower the packet count once the sender knows it (packets may be sized as they are sent)"""
+        self.total_packets = total_packets
+
+    def can_retry(self, seq):
+        """True if seq has been transmitted fewer than max_retries times, as in the stop-and-wait sender"""
+        return self.attempts.get(seq, 0) < self.max_retries
+
+    def mark_sent(self, seq, now=None):
+        """Record a (re)transmission of seq"""
+        self.sent_at[seq] = time.monotonic() if now is None else now
+        self.attempts[seq] = self.attempts.get(seq, 0) + 1
+
+    def ack(self, seq, now=None, sample=True):
+        """Mark seq as delivered and slide the window; returns False for stale ACKs.
+
+        With sample=False the ACK does not feed the RTT estimator; the caller
+        samples it itself (e.g. corrected for how long the receiver held it).
+        """
+        if seq in self.acked or not self.base <= seq < self.next_seq:
+            return False
+        self.acked.add(seq)
+        sent = self.sent_at.pop(seq, None)
+        if sample and sent is not None and self.attempts.get(seq) == 1:
+            self.rtt.sample((time.monotonic() if now is None else now) - sent)
+        while self.base in self.acked:
+            self.acked.discard(self.base)
+            self.attempts.pop(self.base, None)
+            self.base += 1
+        return True
+
+    def outstanding(self):
+        """Sequence numbers sent but not yet acknowledged, oldest first"""
+        return sorted(self.sent_at)
+
+    def sent_once_at(self, seq):
+        """Time seq was sent if it has been sent exactly once (so its ACK can be timed), else None"""
+        return self.sent_at.get(seq) if self.attempts.get(seq) == 1 else None
+
+    def in_flight(self, seq):
+        """True if seq has been sent but not yet acknowledged"""
+        return seq in self.sent_at
+
+    def expired(self, now=None):
+        """Sequence numbers whose ACK deadline has passed"""
+        now = time.monotonic() if now is None else now
+        return sorted(seq for seq, sent in self.sent_at.items() if now - sent >= self.rtt.rto)
+
+    def next_deadline(self):
+        """Time at which the oldest in-flight packet times out, or None"""
+        if not self.sent_at:
+            return None
+        return min(self.sent_at.values()) + self.rtt.rto